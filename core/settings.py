@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista: a duração medida inclui os demais middlewares
+    'users.instrumentacao.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     # CorsMiddleware must be placed as high as possible so it can
     # add the CORS headers before other middleware produce a response.
@@ -88,6 +90,9 @@ DATABASES = {
         default=config('DATABASE_URL')
     )
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # WAL: leituras não esperam a transação de uma ingestão em segundo plano
+    DATABASES['default'].setdefault('OPTIONS', {}).setdefault('init_command', 'PRAGMA journal_mode=WAL;')
 
 
 # Password validation
@@ -149,3 +154,99 @@ CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default=[], cast=Csv())
 # the environment variable CORS_ALLOW_CREDENTIALS=True in production and make sure
 # CORS_ALLOWED_ORIGINS contains the exact origin(s) (can't be '*').
 CORS_ALLOW_CREDENTIALS = config('CORS_ALLOW_CREDENTIALS', default=False, cast=bool)
+
+# Quantidade de linhas do CSV processadas e gravadas por lote na ingestão
+CSV_CHUNK_SIZE = config('CSV_CHUNK_SIZE', default=5000, cast=int)
+# Leitura em vários processos: arquivos a partir de CSV_PARALELO_MIN_BYTES são divididos em blocos
+# de CSV_BLOCO_BYTES (em fins de linha) lidos e normalizados por CSV_PROCESSOS processos (1: desligado)
+CSV_PROCESSOS = config('CSV_PROCESSOS', default=1, cast=int)
+CSV_PARALELO_MIN_BYTES = config('CSV_PARALELO_MIN_BYTES', default=32 * 1024 * 1024, cast=int)
+CSV_BLOCO_BYTES = config('CSV_BLOCO_BYTES', default=4 * 1024 * 1024, cast=int)
+
+# Diretório dos vectorstores por conversa e limite (em bytes, contando documentos e vetores) do
+# cache de vectorstores em memória
+VECTORSTORE_DIR = config('VECTORSTORE_DIR', default=str(BASE_DIR / 'vectorstores'))
+VECTORSTORE_CACHE_MAX_BYTES = config('VECTORSTORE_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+
+# Embeddings: 'openai', 'fake' (modelo local determinístico, sem rede) ou 'palavras' (bag of words local)
+EMBEDDING_BACKEND = config('EMBEDDING_BACKEND', default='openai')
+EMBEDDING_MODEL = config('EMBEDDING_MODEL', default='text-embedding-ada-002')
+EMBEDDING_FAKE_DIM = config('EMBEDDING_FAKE_DIM', default=256, cast=int)
+# Textos por chamada de embedding e chamadas simultâneas na indexação do upload
+EMBEDDING_BATCH_SIZE = config('EMBEDDING_BATCH_SIZE', default=256, cast=int)
+EMBEDDING_MAX_CONCURRENCY = config('EMBEDDING_MAX_CONCURRENCY', default=4, cast=int)
+# Cache de embeddings no banco (0 desliga) e a cada quantas gravações o limite é verificado
+EMBEDDING_CACHE_MAX_ITEMS = config('EMBEDDING_CACHE_MAX_ITEMS', default=200000, cast=int)
+EMBEDDING_CACHE_CHECK_EVERY = config('EMBEDDING_CACHE_CHECK_EVERY', default=1000, cast=int)
+
+# Análise de saúde financeira em cache (segundos); respostas inválidas do LLM ficam pouco tempo
+SAUDE_CACHE_TIMEOUT = config('SAUDE_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+SAUDE_CACHE_TIMEOUT_ERRO = config('SAUDE_CACHE_TIMEOUT_ERRO', default=60, cast=int)
+# Tamanho máximo (tokens estimados) do resumo financeiro enviado nos prompts de análise
+RESUMO_FINANCEIRO_MAX_TOKENS = config('RESUMO_FINANCEIRO_MAX_TOKENS', default=400, cast=int)
+
+# Histórico do agente: mensagens ainda não resumidas vão no prompt (até o limite em tokens estimados);
+# as que passam de HISTORICO_MAX_MENSAGENS entram no resumo da conversa em lotes de
+# HISTORICO_RESUMIR_A_CADA, e as que não cabem nos tokens entram no resumo no mesmo turno
+HISTORICO_MAX_MENSAGENS = config('HISTORICO_MAX_MENSAGENS', default=10, cast=int)
+HISTORICO_MAX_TOKENS = config('HISTORICO_MAX_TOKENS', default=1500, cast=int)
+HISTORICO_RESUMIR_A_CADA = config('HISTORICO_RESUMIR_A_CADA', default=6, cast=int)
+RESUMO_CONVERSA_MAX_TOKENS = config('RESUMO_CONVERSA_MAX_TOKENS', default=300, cast=int)
+
+# Cache de respostas do agente (0 desliga): validade em segundos e similaridade mínima (cosseno)
+# para reaproveitar a resposta de uma pergunta parecida. No text-embedding-ada-002 perguntas sem
+# relação já passam de 0,8 e variações da mesma pergunta ficam acima de 0,97
+RESPOSTAS_CACHE_MAX_ITENS = config('RESPOSTAS_CACHE_MAX_ITENS', default=1000, cast=int)
+RESPOSTAS_CACHE_TTL = config('RESPOSTAS_CACHE_TTL', default=60 * 60, cast=int)
+RESPOSTAS_CACHE_SIMILARIDADE = config('RESPOSTAS_CACHE_SIMILARIDADE', default=0.98, cast=float)
+
+# Clientes da OpenAI compartilhados pelo processo: timeout (segundos) por uso, novas tentativas
+# com backoff, chamadas simultâneas e conexões HTTP mantidas no pool
+LLM_TIMEOUTS = {
+    'agente': config('LLM_TIMEOUT_AGENTE', default=60.0, cast=float),
+    'saude': config('LLM_TIMEOUT_SAUDE', default=30.0, cast=float),
+    'resumo': config('LLM_TIMEOUT_RESUMO', default=30.0, cast=float),
+    'embeddings': config('LLM_TIMEOUT_EMBEDDINGS', default=20.0, cast=float),
+}
+LLM_MAX_RETRIES = config('LLM_MAX_RETRIES', default=2, cast=int)
+LLM_MAX_CONCURRENCY = config('LLM_MAX_CONCURRENCY', default=32, cast=int)
+LLM_MAX_CONEXOES = config('LLM_MAX_CONEXOES', default=32, cast=int)
+
+# Exclusão de registros por upload ou período: linhas removidas por transação
+EXCLUSAO_TAMANHO_LOTE = config('EXCLUSAO_TAMANHO_LOTE', default=5000, cast=int)
+
+# Ingestão de CSV em segundo plano: arquivos aguardando em INGESTAO_DIR, jobs executados por um
+# pool de INGESTAO_WORKERS threads no próprio processo web (INGESTAO_EM_PROCESSO) ou pelo
+# comando run_jobs. Jobs sem sinal de vida há INGESTAO_JOB_EXPIRACAO segundos voltam para a fila
+# (verificado pelos workers do run_jobs a cada INGESTAO_RECUPERACAO_INTERVALO segundos).
+INGESTAO_DIR = config('INGESTAO_DIR', default=str(BASE_DIR / 'ingestao'))
+INGESTAO_WORKERS = config('INGESTAO_WORKERS', default=2, cast=int)
+INGESTAO_EM_PROCESSO = config('INGESTAO_EM_PROCESSO', default=True, cast=bool)
+INGESTAO_JOB_EXPIRACAO = config('INGESTAO_JOB_EXPIRACAO', default=60 * 60, cast=int)
+INGESTAO_PROGRESSO_INTERVALO = config('INGESTAO_PROGRESSO_INTERVALO', default=1.0, cast=float)
+INGESTAO_RECUPERACAO_INTERVALO = config('INGESTAO_RECUPERACAO_INTERVALO', default=60.0, cast=float)
+
+# Cache do Django (análises de saúde, respostas dos endpoints de leitura): 'memoria' (por processo)
+# ou 'arquivo' (em CACHE_DIR, compartilhado entre os processos web e o run_jobs)
+CACHE_BACKEND = config('CACHE_BACKEND', default='memoria')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ITENS', default=5000, cast=int)},
+    } if CACHE_BACKEND == 'arquivo' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ITENS', default=5000, cast=int)},
+    }
+}
+# Respostas dos GETs do dashboard e da listagem em cache por usuário e versão dos dados (segundos;
+# 0 desliga). Com CACHE_BACKEND='arquivo' a versão também fica em cache, por até
+# VERSAO_CACHE_TIMEOUT, e é atualizada na hora em todos os processos; com o cache em memória ela é
+# lida do banco a cada GET (outro processo não veria a invalidação e responderia 304 com dados antigos).
+RESPOSTAS_HTTP_CACHE_TIMEOUT = config('RESPOSTAS_HTTP_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+VERSAO_CACHE_TIMEOUT = config('VERSAO_CACHE_TIMEOUT', default=30, cast=int)
+
+# Instrumentação (etapas cronometradas, consultas ao banco e tokens por requisição): header
+# Server-Timing e métricas do processo no formato do Prometheus em users/metricas/. Desligada, não
+# acrescenta nada às requisições.
+INSTRUMENTACAO = config('INSTRUMENTACAO', default=False, cast=bool)
@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncMonth
+
+from .parsing import TIPO_DESPESA, TIPO_RECEITA
+
+# Agregações dos endpoints de dashboard. Todas as seções são montadas a partir de uma
+# única consulta agrupada (SUM + GROUP BY) sobre FinancialRollup, que já guarda os totais
+# por mês, tipo e categoria; `agrupar` faz o mesmo direto em FinancialRecord.
+
+ZERO = Decimal('0')
+
+
+def agrupar(registros, campos):
+    # Uma linha por combinação de `campos` ('mes', 'tipo_normalizado', 'categoria')
+    if 'mes' in campos:
+        registros = registros.annotate(mes=TruncMonth('data_normalizada'))
+    return list(
+        registros.values(*campos)
+        .annotate(total=Sum('valor_normalizado'), quantidade=Count('id'), primeiro=Min('id'))
+        .order_by()
+    )
+
+
+def agrupar_rollup(rollup, campos):
+    # Mesmo formato de `agrupar`, lido das linhas já consolidadas do rollup
+    return list(
+        rollup.values(*campos)
+        .annotate(total=Sum('total'), quantidade=Sum('quantidade'), primeiro=Min('primeiro'))
+        .order_by()
+    )
+
+
+def indicadores(grupos):
+    totais = {}
+    for grupo in grupos:
+        totais[grupo['tipo_normalizado']] = totais.get(grupo['tipo_normalizado'], ZERO) + (grupo['total'] or ZERO)
+    # Sem lançamentos do tipo, o total é o 0 inteiro do sum() das views antigas ('0' no JSON, não '0.0')
+    total_receita = float(totais[TIPO_RECEITA]) if TIPO_RECEITA in totais else 0
+    total_gastos = float(totais[TIPO_DESPESA]) if TIPO_DESPESA in totais else 0
+    lucro_liquido = total_receita - total_gastos
+    margem_lucro = (lucro_liquido / total_receita * 100) if total_receita else 0.0
+    return {
+        'receita': round(total_receita, 2),
+        'gastos': round(total_gastos, 2),
+        'lucro_liquido': round(lucro_liquido, 2),
+        'margem_lucro': round(margem_lucro, 2)
+    }
+
+
+def totais_mensais(grupos):
+    # Lista ordenada de (chave 'yyyy-mm', receita, despesa)
+    meses = {}
+    for grupo in grupos:
+        if grupo['mes'] is None:
+            continue
+        totais = meses.setdefault(grupo['mes'], {TIPO_RECEITA: ZERO, TIPO_DESPESA: ZERO})
+        totais[grupo['tipo_normalizado']] += grupo['total'] or ZERO
+    return [
+        (mes.strftime('%Y-%m'), float(totais[TIPO_RECEITA]), float(totais[TIPO_DESPESA]))
+        for mes, totais in sorted(meses.items())
+    ]
+
+
+def tendencias(grupos):
+    meses = totais_mensais(grupos)
+    return {
+        'labels': [chave for chave, _, _ in meses],
+        'receitas': [round(receita, 2) for _, receita, _ in meses],
+        'despesas': [round(despesa, 2) for _, _, despesa in meses]
+    }
+
+
+def fluxo_caixa(grupos):
+    meses = totais_mensais(grupos)
+    return {
+        'labels': [chave for chave, _, _ in meses],
+        'fluxo_caixa': [round(receita - despesa, 2) for _, receita, despesa in meses]
+    }
+
+
+def despesas_por_categoria(grupos, sem_categoria):
+    # Categorias na ordem da primeira ocorrência, como na leitura sequencial da tabela
+    categorias = {}
+    for grupo in grupos:
+        if grupo['tipo_normalizado'] != TIPO_DESPESA:
+            continue
+        atual = categorias.setdefault(grupo['categoria'], {'total': ZERO, 'quantidade': 0, 'primeiro': grupo['primeiro']})
+        atual['total'] += grupo['total'] or ZERO
+        atual['quantidade'] += grupo['quantidade']
+        atual['primeiro'] = min(atual['primeiro'], grupo['primeiro'])
+    resultado = {}
+    for categoria, atual in sorted(categorias.items(), key=lambda item: item[1]['primeiro']):
+        chave = categoria or sem_categoria
+        total, quantidade = resultado.get(chave, (0.0, 0))
+        resultado[chave] = (total + float(atual['total']), quantidade + atual['quantidade'])
+    return resultado
+
+
+def distribuicao_despesas(grupos):
+    categorias = despesas_por_categoria(grupos, 'Outros')
+    return {
+        'labels': list(categorias.keys()),
+        'valores': [round(total, 2) for total, _ in categorias.values()]
+    }
+
+
+def percentual_tipos_despesa(grupos):
+    categorias = despesas_por_categoria(grupos, 'Outro')
+    total = sum(quantidade for _, quantidade in categorias.values())
+    return {cat: round((qtd / total) * 100, 2) for cat, (_, qtd) in categorias.items()} if total > 0 else {}
+
+
+# Seção do dashboard -> (função que monta o payload, campos de agrupamento necessários)
+SECOES = {
+    'indicadores': (indicadores, {'tipo_normalizado'}),
+    'tendencias': (tendencias, {'mes', 'tipo_normalizado'}),
+    'distribuicao_despesas': (distribuicao_despesas, {'tipo_normalizado', 'categoria'}),
+    'percentual_tipos_despesa': (percentual_tipos_despesa, {'tipo_normalizado', 'categoria'}),
+    'fluxo_caixa': (fluxo_caixa, {'mes', 'tipo_normalizado'}),
+}
+
+
+def dashboard(rollup, secoes=None):
+    """Calcula as seções pedidas (todas, por padrão) com uma única consulta agrupada no rollup."""
+    secoes = list(secoes or SECOES)
+    campos = set()
+    for secao in secoes:
+        campos |= SECOES[secao][1]
+    grupos = agrupar_rollup(rollup, sorted(campos))
+    return {secao: SECOES[secao][0](grupos) for secao in secoes}
@@ -0,0 +1,79 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+# Apoio às views assíncronas (fora do ciclo síncrono do APIView do DRF)
+
+
+def _fechando_conexoes(funcao):
+    def executar(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            # Threads do executor não passam pelo request_finished: fecha as conexões abertas aqui
+            connections.close_all()
+    return executar
+
+
+async def em_thread(funcao, *args, **kwargs):
+    # Código síncrono bloqueante (rede, FAISS, arquivos) roda no pool de threads, sem travar o event loop
+    return await sync_to_async(_fechando_conexoes(funcao), thread_sensitive=False)(*args, **kwargs)
+
+
+class CredenciaisInvalidas(Exception):
+    def __init__(self, detalhe):
+        super().__init__(detalhe)
+        self.detalhe = detalhe
+
+
+def _autenticar(request):
+    try:
+        resultado = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed as e:
+        raise CredenciaisInvalidas(e.detail)
+    return resultado[0] if resultado else None
+
+
+async def obter_usuario(request):
+    # Mesma autenticação JWT do DRF; sem token o usuário é anônimo (None)
+    return await sync_to_async(_autenticar)(request)
+
+
+def ler_dados(request):
+    # Corpo JSON ou formulário, como o request.data do DRF
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+def resposta_json(dados, status=200):
+    return JsonResponse(dados, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def via_asgi(request):
+    # Respostas em streaming precisam de iterador assíncrono sob ASGI e síncrono sob WSGI
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def quer_streaming(request, dados):
+    # {"stream": true} no corpo ou Accept: text/event-stream
+    return bool(dados.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def evento_sse(dados, evento=None):
+    linha = f'data: {json.dumps(dados, ensure_ascii=False)}\n\n'
+    return f'event: {evento}\n{linha}' if evento else linha
+
+
+def resposta_sse(eventos):
+    # Server-Sent Events sem buffer (no-cache para proxies, X-Accel-Buffering para o nginx)
+    resposta = StreamingHttpResponse(eventos, content_type='text/event-stream; charset=utf-8')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
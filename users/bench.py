@@ -0,0 +1,254 @@
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from django.conf import settings
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from .cache_respostas import cache_respostas
+from .embeddings import embeddings_compartilhados
+from .models import FinancialRecord
+
+# Utilitários compartilhados pelos comandos de benchmark (manage.py bench_*)
+
+CATEGORIAS = ['Fornecedores', 'Aluguel', 'Salários', 'Marketing', 'Impostos', 'Vendas', 'Serviços', '']
+FORMAS_PAGAMENTO = ['Pix', 'Boleto', 'Cartão', 'Dinheiro']
+
+
+def formatar_valor_br(centavos):
+    # 123456 -> '1.234,56'
+    return f'{centavos // 100:,}'.replace(',', '.') + f',{centavos % 100:02d}'
+
+
+def gerar_registros(quantidade, semente=0, owner=None):
+    # Registros sintéticos já com os campos normalizados preenchidos
+    rnd = random.Random(semente)
+    for i in range(quantidade):
+        dia = date(rnd.randint(2020, 2025), rnd.randint(1, 12), rnd.randint(1, 28))
+        centavos = rnd.randint(100, 5_000_000)
+        receita = rnd.random() < 0.35
+        yield FinancialRecord(
+            owner=owner,
+            data=dia.strftime('%d/%m/%Y'),
+            cliente_fornecedor=f'Cliente {rnd.randint(1, 500)}',
+            descricao=f'Lançamento {i}',
+            categoria='Vendas' if receita else rnd.choice(CATEGORIAS),
+            valor=formatar_valor_br(centavos),
+            tipo='Receita' if receita else 'Despesa',
+            forma_pagamento=rnd.choice(FORMAS_PAGAMENTO),
+            status='Pago',
+            valor_normalizado=Decimal(centavos) / 100,
+            data_normalizada=dia,
+            tipo_normalizado='receita' if receita else 'despesa',
+        )
+
+
+def popular(quantidade, tamanho_lote=5000, semente=0, owner=None):
+    lote = []
+    for registro in gerar_registros(quantidade, semente, owner):
+        lote.append(registro)
+        if len(lote) >= tamanho_lote:
+            FinancialRecord.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        FinancialRecord.objects.bulk_create(lote)
+
+
+def cronometrar(funcao, repeticoes=5):
+    # Mediana, em milissegundos, de várias execuções
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return tempos[len(tempos) // 2]
+
+
+def gerar_dataframe(quantidade, semente=0):
+    # Linhas já padronizadas (campos texto do FinancialRecord), como saem de padronizar_colunas
+    campos = ['data', 'cliente_fornecedor', 'descricao', 'categoria', 'valor', 'tipo', 'forma_pagamento', 'status']
+    linhas = [{campo: getattr(r, campo) for campo in campos} for r in gerar_registros(quantidade, semente)]
+    return pd.DataFrame(linhas, columns=campos)
+
+
+class EmbeddingsFalsos(Embeddings):
+    """Modelo de embedding local determinístico com latência fixa por chamada, simulando a API."""
+
+    def __init__(self, dimensao=256, latencia=0.0):
+        self.modelo = DeterministicFakeEmbedding(size=dimensao)
+        self.latencia = latencia
+        self.chamadas = 0
+
+    def embed_documents(self, texts):
+        self.chamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self.modelo.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.chamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self.modelo.embed_query(text)
+
+
+class _HandlerLLMFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em writes separados: sem TCP_NODELAY o ACK atrasado soma ~40 ms por resposta
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, dados, status=200):
+        corpo = json.dumps(dados).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        servidor = self.server.llm_falso
+        pedido = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with servidor.lock:
+            servidor.requisicoes += 1
+            servidor.conexoes.add(self.client_address)
+            servidor.em_andamento += 1
+            servidor.max_em_andamento = max(servidor.max_em_andamento, servidor.em_andamento)
+        try:
+            self._responder(servidor, pedido)
+        finally:
+            with servidor.lock:
+                servidor.em_andamento -= 1
+
+    def _responder(self, servidor, pedido):
+        with servidor.lock:
+            falhar = servidor.falhas > 0
+            servidor.falhas -= falhar
+        if falhar:
+            self._json({'error': {'message': 'Serviço indisponível (falha simulada).'}}, status=503)
+            return
+        if self.path.endswith('/embeddings'):
+            entradas = pedido.get('input')
+            entradas = entradas if isinstance(entradas, list) else [entradas]
+            time.sleep(servidor.latencia)
+            vetores = servidor.embeddings.embed_documents([str(e) for e in entradas])
+            self._json({
+                'object': 'list', 'model': pedido.get('model'),
+                'data': [{'object': 'embedding', 'index': i, 'embedding': v} for i, v in enumerate(vetores)],
+                'usage': {'prompt_tokens': len(entradas), 'total_tokens': len(entradas)},
+            })
+            return
+        prompt = pedido.get('prompt')
+        with servidor.lock:
+            servidor.prompts.append(''.join(prompt) if isinstance(prompt, list) else str(prompt or ''))
+        tokens = [servidor.resposta] if servidor.resposta is not None else [f'palavra{i} ' for i in range(servidor.tokens)]
+        time.sleep(servidor.latencia)
+        if not pedido.get('stream'):
+            # Sem streaming a resposta só sai depois de todos os tokens gerados
+            time.sleep(servidor.intervalo_tokens * max(len(tokens) - 1, 0))
+            self._json({
+                'id': 'cmpl-falso', 'object': 'text_completion', 'created': 0, 'model': pedido.get('model'),
+                'choices': [{'text': ''.join(tokens), 'index': 0, 'logprobs': None, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': len(tokens), 'total_tokens': len(tokens) + 1},
+            })
+            return
+        # Streaming no formato SSE da OpenAI, um token por evento
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for i, token in enumerate(tokens):
+            if i and servidor.intervalo_tokens:
+                time.sleep(servidor.intervalo_tokens)
+            evento = {
+                'id': 'cmpl-falso', 'object': 'text_completion', 'created': 0, 'model': pedido.get('model'),
+                'choices': [{'text': token, 'index': 0, 'logprobs': None, 'finish_reason': None}],
+            }
+            self.wfile.write(f'data: {json.dumps(evento)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class ServidorLLMFalso:
+    """Servidor HTTP local compatível com a API da OpenAI (completions, streaming e embeddings).
+
+    Responde depois de `latencia` segundos; em streaming envia `tokens` tokens espaçados
+    por `intervalo_tokens` segundos. Com `resposta`, as completions devolvem esse texto fixo; as
+    `falhas` primeiras requisições recebem 503. Use `url` como OPENAI_BASE_URL.
+    """
+
+    def __init__(self, latencia=0.5, tokens=20, intervalo_tokens=0.0, dimensao=256, resposta=None, falhas=0):
+        self.latencia = latencia
+        self.tokens = tokens
+        self.resposta = resposta
+        self.falhas = falhas
+        self.intervalo_tokens = intervalo_tokens
+        self.embeddings = DeterministicFakeEmbedding(size=dimensao)
+        self.lock = threading.Lock()
+        self.requisicoes = 0
+        # Endereços (host, porta) dos clientes: cada conexão TCP nova tem uma porta diferente
+        self.conexoes = set()
+        self.em_andamento = 0
+        self.max_em_andamento = 0
+        # Prompts recebidos nas completions, em ordem
+        self.prompts = []
+
+    def __enter__(self):
+        self.httpd = _ServidorHTTP(('127.0.0.1', 0), _HandlerLLMFalso)
+        self.httpd.llm_falso = self
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/v1'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ServidorASGI:
+    """Sobe a aplicação ASGI do projeto em um worker uvicorn local (thread daemon). Use `url`."""
+
+    def __enter__(self):
+        import uvicorn
+        from core.asgi import application
+
+        config = uvicorn.Config(application, host='127.0.0.1', port=0, log_level='warning', lifespan='off')
+        self.worker = uvicorn.Server(config)
+        threading.Thread(target=self.worker.run, daemon=True).start()
+        while not self.worker.started:
+            time.sleep(0.05)
+        porta = self.worker.servers[0].sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{porta}'
+        return self
+
+    def __exit__(self, *exc):
+        self.worker.should_exit = True
+
+
+def apontar_para(servidor, backend_embeddings='fake', cache_de_respostas=False):
+    """Aponta os clientes da OpenAI para o servidor falso, com embeddings locais.
+
+    O cache de respostas do agente fica desligado por padrão, para que cada pergunta chegue ao LLM.
+    """
+    os.environ['OPENAI_BASE_URL'] = servidor.url
+    os.environ['OPENAI_API_KEY'] = 'sk-bench'
+    settings.EMBEDDING_BACKEND = backend_embeddings
+    embeddings_compartilhados.cache_clear()
+    cache_respostas.limpar()
+    cache_respostas.max_itens = settings.RESPOSTAS_CACHE_MAX_ITENS if cache_de_respostas else 0
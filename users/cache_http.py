@@ -0,0 +1,71 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from .versoes import escopo_usuario, versao_em_cache
+
+# Cache dos GETs de leitura (dashboard e listagem): a resposta só depende do dono, da versão dos
+# dados e da URL, então vale até o próximo upload ou exclusão. O ETag é derivado dessa chave: um
+# If-None-Match igual ao atual recebe 304 sem consultar o cache das respostas (nem o banco, se a
+# versão estiver em cache).
+
+
+class AutenticacaoSemConsulta:
+    """Nos GETs, o usuário vem só do token JWT assinado, sem buscá-lo no banco."""
+
+    def get_authenticators(self):
+        if self.request.method in ('GET', 'HEAD'):
+            return [JWTStatelessUserAuthentication()]
+        return super().get_authenticators()
+
+
+def calcular_etag(escopo, versao, request):
+    # Representações diferentes da mesma URL (JSON, API navegável) têm ETags diferentes
+    chave = f"{escopo}:{versao}:{request.get_full_path()}:{request.META.get('HTTP_ACCEPT', '')}"
+    return '"' + hashlib.sha1(chave.encode()).hexdigest()[:32] + '"'
+
+
+def etag_confere(if_none_match, etag):
+    # Comparação fraca (RFC 9110): W/"x" e "x" são o mesmo ETag
+    etags = [valor.strip().removeprefix('W/') for valor in if_none_match.split(',')]
+    return '*' in etags or etag in etags
+
+
+def em_cache_por_versao(get):
+    """Decora o get de uma APIView: ETag/304 e a resposta em cache por usuário e versão dos dados.
+
+    Só respostas 200 do DRF vão para o cache (com os cabeçalhos definidos pela view); respostas em
+    streaming recebem o ETag, mas são geradas de novo a cada GET sem If-None-Match.
+    """
+    @wraps(get)
+    def responder(view, request, *args, **kwargs):
+        if settings.RESPOSTAS_HTTP_CACHE_TIMEOUT <= 0:
+            return get(view, request, *args, **kwargs)
+        escopo = escopo_usuario(request.user if request.user.is_authenticated else None)
+        etag = calcular_etag(escopo, versao_em_cache(escopo), request)
+        if etag_confere(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            resposta = Response(status=304)
+        else:
+            chave = 'http:' + etag.strip('"')
+            guardada = cache.get(chave)
+            if guardada is not None:
+                dados, cabecalhos = guardada
+                resposta = Response(dados, headers=cabecalhos)
+            else:
+                resposta = get(view, request, *args, **kwargs)
+                if resposta.status_code != 200:
+                    return resposta
+                if isinstance(resposta, Response):
+                    cabecalhos = {nome: valor for nome, valor in resposta.items() if nome.lower() != 'content-type'}
+                    cache.set(chave, (resposta.data, cabecalhos), settings.RESPOSTAS_HTTP_CACHE_TIMEOUT)
+        resposta['ETag'] = etag
+        # O navegador guarda a resposta, mas sempre revalida com If-None-Match
+        resposta['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(resposta, ['Accept', 'Authorization'])
+        return resposta
+    return responder
@@ -0,0 +1,161 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .instrumentacao import metricas
+
+# Nomes de mês (já sem acento) -> número: perguntas sobre meses diferentes nunca se reaproveitam
+MESES = {
+    nome: numero
+    for numero, nomes in enumerate((
+        ('janeiro', 'jan'), ('fevereiro', 'fev'), ('marco', 'mar'), ('abril', 'abr'), ('maio', 'mai'),
+        ('junho', 'jun'), ('julho', 'jul'), ('agosto', 'ago'), ('setembro', 'set'), ('outubro', 'out'),
+        ('novembro', 'nov'), ('dezembro', 'dez'),
+    ), start=1)
+    for nome in nomes
+}
+
+
+def normalizar_pergunta(texto):
+    # 'Qual foi  meu LUCRO?' -> 'qual foi meu lucro'
+    texto = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII').lower()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', texto).split())
+
+
+def termos_chave(pergunta):
+    # Números (anos, dias, valores) e meses da pergunta normalizada: embeddings de perguntas que só
+    # diferem nesses termos ficam muito próximos, mas as respostas são outras
+    return frozenset(
+        palavra if palavra.isdigit() else f'mes{MESES[palavra]}'
+        for palavra in pergunta.split() if palavra.isdigit() or palavra in MESES
+    )
+
+
+class CacheRespostas:
+    """Respostas do agente reaproveitadas entre perguntas iguais ou parecidas.
+
+    Cada escopo (usuário, versão dos dados e vectorstore) tem suas próprias entradas. A busca é
+    primeiro pelo texto normalizado e depois pela similaridade de cosseno entre embeddings
+    (>= `similaridade`), só entre perguntas com os mesmos números e meses. Guarda no máximo
+    `max_itens` respostas (LRU), cada uma válida por `ttl` segundos.
+    """
+
+    def __init__(self, max_itens, ttl, similaridade):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.similaridade = similaridade
+        # escopo -> {pergunta normalizada: (expira_em, vetor normalizado ou None, resposta, termos_chave)}
+        self._escopos = {}
+        # (escopo, pergunta normalizada), da menos para a mais recentemente usada
+        self._ordem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_exatos = 0
+        self.hits_semanticos = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirados = 0
+
+    @property
+    def habilitado(self):
+        return self.max_itens > 0
+
+    def buscar_exato(self, escopo, pergunta):
+        with self._lock:
+            item = self._escopos.get(escopo, {}).get(pergunta)
+            if item is None or not self._valido(escopo, pergunta, item):
+                return None
+            self._ordem.move_to_end((escopo, pergunta))
+            self.hits_exatos += 1
+            return item[2]
+
+    def buscar_similar(self, escopo, pergunta, vetor):
+        # Conta como miss se nada passar do limiar (a busca exata já foi feita antes); sem vetor, só conta
+        with self._lock:
+            if vetor is None:
+                self.misses += 1
+                return None
+            vetor = _normalizar_vetor(vetor)
+            termos = termos_chave(pergunta)
+            candidatos = [
+                (outra, item) for outra, item in list(self._escopos.get(escopo, {}).items())
+                if item[1] is not None and item[3] == termos and self._valido(escopo, outra, item)
+            ]
+            if candidatos:
+                similaridades = np.stack([item[1] for _, item in candidatos]) @ vetor
+                melhor = int(np.argmax(similaridades))
+                if similaridades[melhor] >= self.similaridade:
+                    outra, item = candidatos[melhor]
+                    self._ordem.move_to_end((escopo, outra))
+                    self.hits_semanticos += 1
+                    return item[2]
+            self.misses += 1
+            return None
+
+    def guardar(self, escopo, pergunta, vetor, resposta):
+        if not self.habilitado:
+            return
+        item = (
+            time.monotonic() + self.ttl, _normalizar_vetor(vetor) if vetor is not None else None, resposta,
+            termos_chave(pergunta),
+        )
+        with self._lock:
+            self._escopos.setdefault(escopo, {})[pergunta] = item
+            self._ordem[(escopo, pergunta)] = None
+            self._ordem.move_to_end((escopo, pergunta))
+            while len(self._ordem) > self.max_itens:
+                self._remover(*next(iter(self._ordem)))
+                self.evictions += 1
+
+    def limpar(self):
+        with self._lock:
+            self._escopos.clear()
+            self._ordem.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            hits = self.hits_exatos + self.hits_semanticos
+            total = hits + self.misses
+            return {
+                'itens': len(self._ordem),
+                'max_itens': self.max_itens,
+                'hits': hits,
+                'hits_exatos': self.hits_exatos,
+                'hits_semanticos': self.hits_semanticos,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirados': self.expirados,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+            }
+
+    def _valido(self, escopo, pergunta, item):
+        # Chamado com o lock: entradas vencidas são removidas ao serem encontradas
+        if item[0] > time.monotonic():
+            return True
+        self._remover(escopo, pergunta)
+        self.expirados += 1
+        return False
+
+    def _remover(self, escopo, pergunta):
+        self._ordem.pop((escopo, pergunta), None)
+        entradas = self._escopos.get(escopo)
+        if entradas is not None:
+            entradas.pop(pergunta, None)
+            if not entradas:
+                del self._escopos[escopo]
+
+
+def _normalizar_vetor(vetor):
+    vetor = np.asarray(vetor, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+cache_respostas = CacheRespostas(
+    settings.RESPOSTAS_CACHE_MAX_ITENS, settings.RESPOSTAS_CACHE_TTL, settings.RESPOSTAS_CACHE_SIMILARIDADE
+)
+metricas.registrar_cache('respostas', cache_respostas.estatisticas)
@@ -0,0 +1,209 @@
+import asyncio
+import atexit
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from langchain_openai import OpenAI, OpenAIEmbeddings
+
+from .instrumentacao import etapa, registrar_tokens
+
+# Clientes da OpenAI compartilhados pelo processo. As conexões HTTP (keep-alive, TLS) ficam em
+# pools reaproveitados entre requisições: um httpx.Client para as chamadas síncronas e um único
+# httpx.AsyncClient, que vive num event loop próprio (thread 'clientes-llm'). O pool assíncrono só
+# funciona no loop em que foi criado e, sob WSGI, cada requisição roda num loop novo: as chamadas
+# assíncronas de qualquer loop são executadas nesse loop compartilhado e aguardadas de volta.
+#
+# Cada uso (agente, saude, resumo, embeddings) tem seu timeout em LLM_TIMEOUTS; as novas tentativas
+# com backoff exponencial ficam a cargo do SDK (LLM_MAX_RETRIES) e LLM_MAX_CONCURRENCY limita as
+# chamadas simultâneas do processo.
+
+
+class _Falha:
+    def __init__(self, erro):
+        self.erro = erro
+
+
+_FIM = object()
+
+
+class LLMLimitado:
+    """Repassa invoke/ainvoke/astream ao LLM respeitando o limite de chamadas simultâneas.
+
+    As chamadas assíncronas rodam no loop dos clientes (`registro`), com o semáforo do processo.
+    Cada chamada é a etapa 'llm.<uso>' da instrumentação, com os tokens estimados do prompt e da resposta.
+    """
+
+    def __init__(self, llm, registro, uso='agente'):
+        self.llm = llm
+        self.uso = uso
+        self._registro = registro
+
+    def invoke(self, prompt):
+        with self._registro.semaforo, etapa(f'llm.{self.uso}'):
+            resposta = self.llm.invoke(prompt)
+        registrar_tokens(self.uso, prompt, resposta)
+        return resposta
+
+    async def _limitado(self, prompt):
+        async with self._registro.semaforo_async:
+            return await self.llm.ainvoke(prompt)
+
+    async def ainvoke(self, prompt):
+        with etapa(f'llm.{self.uso}'):
+            resposta = await self._registro.aguardar(self._limitado(prompt))
+        registrar_tokens(self.uso, prompt, resposta)
+        return resposta
+
+    async def _produzir(self, prompt, entregar):
+        # No loop dos clientes: a vaga fica ocupada até o fim do stream
+        try:
+            async with self._registro.semaforo_async:
+                async for token in self.llm.astream(prompt):
+                    entregar(token)
+        except Exception as e:
+            entregar(_Falha(e))
+        finally:
+            entregar(_FIM)
+
+    async def astream(self, prompt):
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue()
+
+        def entregar(item):
+            try:
+                loop.call_soon_threadsafe(fila.put_nowait, item)
+            except RuntimeError:
+                # O loop de quem pediu já foi fechado
+                pass
+
+        partes = []
+        futuro = self._registro.agendar(self._produzir(prompt, entregar))
+        try:
+            with etapa(f'llm.{self.uso}'):
+                while (item := await fila.get()) is not _FIM:
+                    if isinstance(item, _Falha):
+                        raise item.erro
+                    partes.append(item)
+                    yield item
+        finally:
+            # Cliente desconectado no meio do stream: libera a vaga e a conexão
+            futuro.cancel()
+        registrar_tokens(self.uso, prompt, ''.join(partes))
+
+
+class EmbeddingsLimitadas(OpenAIEmbeddings):
+    """OpenAIEmbeddings que respeita o limite de chamadas simultâneas do processo."""
+
+    def embed_documents(self, texts, chunk_size=None, **kwargs):
+        with registro.semaforo:
+            return super().embed_documents(texts, chunk_size=chunk_size, **kwargs)
+
+    def embed_query(self, text, **kwargs):
+        with registro.semaforo:
+            return super().embed_query(text, **kwargs)
+
+
+class RegistroClientes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http = None
+        self._http_async = None
+        self._loop = None
+        self._llms = {}
+        self.semaforo = threading.BoundedSemaphore(settings.LLM_MAX_CONCURRENCY)
+        self.semaforo_async = None
+
+    def _limites(self):
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONEXOES,
+            max_keepalive_connections=settings.LLM_MAX_CONEXOES,
+        )
+
+    def http(self):
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(limits=self._limites())
+            return self._http
+
+    def _iniciar_loop(self):
+        # Chamado com self._lock: loop, AsyncClient e semáforo assíncrono do processo
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='clientes-llm', daemon=True).start()
+            self._http_async = httpx.AsyncClient(limits=self._limites())
+            self.semaforo_async = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+            self._loop = loop
+        return self._loop
+
+    def agendar(self, coro):
+        """Executa a corrotina no loop dos clientes; devolve um concurrent.futures.Future."""
+        with self._lock:
+            loop = self._iniciar_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    async def aguardar(self, coro):
+        # Aguarda, no loop de quem chama, a corrotina executada no loop dos clientes
+        return await asyncio.wrap_future(self.agendar(coro))
+
+    @staticmethod
+    async def _encerrar(loop, http_async):
+        await http_async.aclose()
+        await loop.shutdown_asyncgens()
+
+    def fechar(self):
+        """Fecha os pools de conexões e encerra o loop dos clientes."""
+        with self._lock:
+            loop, http_async, http = self._loop, self._http_async, self._http
+            self._loop = self._http_async = self._http = self.semaforo_async = None
+            self._llms = {}
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._encerrar(loop, http_async), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+        if http is not None:
+            http.close()
+
+    def _credenciais(self):
+        return os.getenv('OPENAI_API_KEY', 'SUA_CHAVE_AQUI'), os.getenv('OPENAI_BASE_URL')
+
+    def llm(self, uso, temperature=0.2):
+        chave_api, base_url = self._credenciais()
+        chave = (uso, temperature, chave_api, base_url)
+        llm = self._llms.get(chave)
+        if llm is None:
+            http = self.http()
+            with self._lock:
+                self._iniciar_loop()
+                http_async = self._http_async
+            cliente = OpenAI(
+                openai_api_key=chave_api,
+                base_url=base_url,
+                temperature=temperature,
+                timeout=settings.LLM_TIMEOUTS[uso],
+                max_retries=settings.LLM_MAX_RETRIES,
+                http_client=http,
+                http_async_client=http_async,
+            )
+            llm = self._llms[chave] = LLMLimitado(cliente, self, uso)
+        return llm
+
+    def embeddings(self, modelo):
+        # Só chamadas síncronas (threads da indexação e das consultas)
+        chave_api, base_url = self._credenciais()
+        return EmbeddingsLimitadas(
+            openai_api_key=chave_api,
+            base_url=base_url,
+            model=modelo,
+            timeout=settings.LLM_TIMEOUTS['embeddings'],
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=self.http(),
+        )
+
+
+registro = RegistroClientes()
+atexit.register(registro.fechar)
+
+
+def obter_llm(uso='agente', temperature=0.2):
+    return registro.llm(uso, temperature)
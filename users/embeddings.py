@@ -0,0 +1,191 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from .clientes import registro
+from .instrumentacao import metricas
+from .models import EmbeddingCache
+
+# Chaves por consulta/atualização no cache (limite de parâmetros do banco)
+LOTE_CONSULTA_CACHE = 500
+
+
+class EmbeddingsEmLotes(Embeddings):
+    """Divide os textos em lotes e chama o modelo com no máximo `concorrencia` chamadas simultâneas."""
+
+    def __init__(self, embeddings, tamanho_lote, concorrencia):
+        self.embeddings = embeddings
+        self.tamanho_lote = tamanho_lote
+        self.concorrencia = concorrencia
+
+    def embed_documents(self, texts):
+        lotes = [texts[i:i + self.tamanho_lote] for i in range(0, len(texts), self.tamanho_lote)]
+        if len(lotes) <= 1 or self.concorrencia <= 1:
+            return [vetor for lote in lotes for vetor in self.embeddings.embed_documents(lote)]
+        # map preserva a ordem dos lotes
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as executor:
+            return [vetor for vetores in executor.map(self.embeddings.embed_documents, lotes) for vetor in vetores]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class EmbeddingsEmCache(Embeddings):
+    """Reaproveita embeddings já calculados, guardados no banco por modelo + hash do texto.
+
+    Vale para documentos e perguntas, entre todas as conversas. O cache é limitado a
+    `max_itens` entradas; as menos usadas recentemente são removidas primeiro.
+    """
+
+    # Contadores do processo, somados entre todas as instâncias
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+    evictions = 0
+    _gravados_desde_verificacao = 0
+
+    def __init__(self, embeddings, modelo, max_itens):
+        self.embeddings = embeddings
+        self.modelo = modelo
+        self.max_itens = max_itens
+
+    def chave(self, texto):
+        return hashlib.sha256(f'{self.modelo}\0{texto}'.encode('utf-8')).hexdigest()
+
+    def embed_documents(self, texts):
+        return self._embutir(texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self._embutir([text], lambda textos: [self.embeddings.embed_query(textos[0])])[0]
+
+    def _embutir(self, texts, calcular):
+        chaves = [self.chave(texto) for texto in texts]
+        unicas = list(dict.fromkeys(chaves))
+        encontrados = {}
+        for i in range(0, len(unicas), LOTE_CONSULTA_CACHE):
+            lote = unicas[i:i + LOTE_CONSULTA_CACHE]
+            for chave, vetor in EmbeddingCache.objects.filter(chave__in=lote).values_list('chave', 'vetor'):
+                encontrados[chave] = np.frombuffer(vetor, dtype=np.float32).tolist()
+        if encontrados:
+            self._marcar_uso(list(encontrados))
+        # Calcula só os textos ausentes, uma vez cada
+        faltando = {}
+        for chave, texto in zip(chaves, texts):
+            if chave not in encontrados and chave not in faltando:
+                faltando[chave] = texto
+        if faltando:
+            vetores = calcular(list(faltando.values()))
+            agora = timezone.now()
+            novos = []
+            for chave, vetor in zip(faltando, vetores):
+                encontrados[chave] = vetor
+                novos.append(EmbeddingCache(
+                    chave=chave, modelo=self.modelo, usado_em=agora,
+                    vetor=np.asarray(vetor, dtype=np.float32).tobytes()
+                ))
+            EmbeddingCache.objects.bulk_create(novos, batch_size=LOTE_CONSULTA_CACHE, ignore_conflicts=True)
+        with EmbeddingsEmCache._lock:
+            EmbeddingsEmCache.hits += len(chaves) - len(faltando)
+            EmbeddingsEmCache.misses += len(faltando)
+            EmbeddingsEmCache._gravados_desde_verificacao += len(faltando)
+            verificar = EmbeddingsEmCache._gravados_desde_verificacao >= settings.EMBEDDING_CACHE_CHECK_EVERY
+            if verificar:
+                EmbeddingsEmCache._gravados_desde_verificacao = 0
+        if verificar:
+            self.despejar()
+        return [encontrados[chave] for chave in chaves]
+
+    def _marcar_uso(self, chaves):
+        agora = timezone.now()
+        for i in range(0, len(chaves), LOTE_CONSULTA_CACHE):
+            EmbeddingCache.objects.filter(chave__in=chaves[i:i + LOTE_CONSULTA_CACHE]).update(usado_em=agora)
+
+    def despejar(self):
+        # Remove as entradas usadas há mais tempo até o cache voltar ao limite
+        excesso = EmbeddingCache.objects.count() - self.max_itens
+        while excesso > 0:
+            ids = list(EmbeddingCache.objects.order_by('usado_em').values_list('id', flat=True)[:min(excesso, LOTE_CONSULTA_CACHE)])
+            if not ids:
+                break
+            removidos, _ = EmbeddingCache.objects.filter(id__in=ids).delete()
+            excesso -= removidos
+            with EmbeddingsEmCache._lock:
+                EmbeddingsEmCache.evictions += removidos
+
+    @classmethod
+    def estatisticas(cls):
+        with cls._lock:
+            total = cls.hits + cls.misses
+            return {
+                'hits': cls.hits,
+                'misses': cls.misses,
+                'evictions': cls.evictions,
+                'hit_rate': round(cls.hits / total, 4) if total else 0.0,
+            }
+
+
+metricas.registrar_cache('embeddings', EmbeddingsEmCache.estatisticas)
+
+
+class EmbeddingsPalavras(Embeddings):
+    """Bag of words local: cada palavra (sem acento, minúscula) soma 1 numa posição definida pelo seu hash.
+
+    Textos com as mesmas palavras ficam próximos, o que basta para testar buscas por similaridade sem rede.
+    """
+
+    def __init__(self, dimensao):
+        self.dimensao = dimensao
+
+    def embed_query(self, text):
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        texto = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII').lower()
+        for palavra in re.findall(r'\w+', texto):
+            vetor[int(hashlib.md5(palavra.encode()).hexdigest()[:8], 16) % self.dimensao] += 1.0
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma else vetor).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def nome_modelo():
+    if settings.EMBEDDING_BACKEND in ('fake', 'palavras'):
+        return f'{settings.EMBEDDING_BACKEND}-{settings.EMBEDDING_FAKE_DIM}'
+    return settings.EMBEDDING_MODEL
+
+
+def obter_modelo_base():
+    # EMBEDDING_BACKEND=fake usa um modelo local determinístico (sem rede), para testes e benchmarks;
+    # 'palavras' também é local, mas textos parecidos têm vetores parecidos
+    if settings.EMBEDDING_BACKEND == 'fake':
+        return DeterministicFakeEmbedding(size=settings.EMBEDDING_FAKE_DIM)
+    if settings.EMBEDDING_BACKEND == 'palavras':
+        return EmbeddingsPalavras(settings.EMBEDDING_FAKE_DIM)
+    # Cliente HTTP, timeout, novas tentativas e limite de concorrência do registro de clientes
+    return registro.embeddings(settings.EMBEDDING_MODEL)
+
+
+def obter_embeddings(modelo_base=None, modelo=None):
+    # Modelo base -> lotes com concorrência limitada -> cache por hash (se habilitado)
+    embeddings = EmbeddingsEmLotes(
+        modelo_base or obter_modelo_base(),
+        settings.EMBEDDING_BATCH_SIZE,
+        settings.EMBEDDING_MAX_CONCURRENCY
+    )
+    if settings.EMBEDDING_CACHE_MAX_ITEMS > 0:
+        embeddings = EmbeddingsEmCache(embeddings, modelo or nome_modelo(), settings.EMBEDDING_CACHE_MAX_ITEMS)
+    return embeddings
+
+
+@lru_cache(maxsize=1)
+def embeddings_compartilhados():
+    # Uma instância por processo para as consultas (criar o cliente do modelo custa ~100 ms)
+    return obter_embeddings()
@@ -0,0 +1,110 @@
+import logging
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from . import rollup
+from .analytics import agrupar
+from .listagem import ParametroInvalido
+from .models import FinancialRecord, FinancialRollup
+from .versoes import escopo_usuario, incrementar_todas, incrementar_versao
+
+logger = logging.getLogger(__name__)
+
+# Exclusão de FinancialRecord: nada referencia o modelo e não há sinais ligados a ele, então o
+# .delete() do ORM sai num único DELETE, sem carregar os objetos. Todos os registros de um dono
+# saem de uma vez pelo índice do dono; por upload ou período, em lotes de
+# EXCLUSAO_TAMANHO_LOTE ids em ordem, cada lote numa transação curta que também desconta o
+# rollup e muda a versão dos dados. A instalação inteira pode ser esvaziada com TRUNCATE (Postgres).
+
+
+def ler_escopo(parametros):
+    """(lote_upload, de, ate) a partir de ?lote=<uuid>&de=AAAA-MM-DD&ate=AAAA-MM-DD."""
+    lote = parametros.get('lote') or None
+    if lote:
+        try:
+            lote = uuid.UUID(lote)
+        except ValueError:
+            raise ParametroInvalido('lote deve ser um UUID.')
+    datas = []
+    for nome in ('de', 'ate'):
+        valor = parametros.get(nome) or None
+        if valor:
+            try:
+                valor = date.fromisoformat(valor)
+            except ValueError:
+                raise ParametroInvalido(f'{nome} deve estar no formato AAAA-MM-DD.')
+        datas.append(valor)
+    de, ate = datas
+    if de and ate and de > ate:
+        raise ParametroInvalido('de deve ser anterior ou igual a ate.')
+    return lote, de, ate
+
+
+def registros_do_escopo(owner, lote=None, de=None, ate=None):
+    # O período é pela data do lançamento; registros sem data válida ficam de fora
+    registros = FinancialRecord.objects.filter(owner=owner)
+    if lote:
+        registros = registros.filter(lote_upload=lote)
+    if de:
+        registros = registros.filter(data_normalizada__gte=de)
+    if ate:
+        registros = registros.filter(data_normalizada__lte=ate)
+    return registros
+
+
+def excluir_tudo(owner):
+    """Remove todos os registros do dono e o seu rollup numa transação; devolve quantos eram."""
+    with transaction.atomic():
+        removidos, _ = FinancialRecord.objects.filter(owner=owner).delete()
+        rollup.limpar(owner)
+        incrementar_versao(escopo_usuario(owner))
+    return removidos
+
+
+def esvaziar_instalacao():
+    """Remove os registros e o rollup de todos os donos; devolve quantos registros havia."""
+    with transaction.atomic():
+        removidos = FinancialRollup.objects.aggregate(total=Sum('quantidade'))['total'] or 0
+        if connection.vendor == 'postgresql':
+            tabelas = ', '.join(connection.ops.quote_name(modelo._meta.db_table) for modelo in (FinancialRecord, FinancialRollup))
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE TABLE {tabelas}')
+        else:
+            removidos, _ = FinancialRecord.objects.all().delete()
+            FinancialRollup.objects.all().delete()
+        incrementar_todas()
+    return removidos
+
+
+def excluir_em_lotes(registros, owner, tamanho_lote=None, progresso=None):
+    """Remove `registros` (todos de `owner`) em lotes por id; `progresso(removidos, lotes)` é chamado após cada lote.
+
+    Cada lote é confirmado separadamente: se a exclusão for interrompida, os lotes anteriores
+    continuam excluídos e o rollup continua consistente com eles.
+    """
+    tamanho_lote = tamanho_lote or settings.EXCLUSAO_TAMANHO_LOTE
+    inicio = time.perf_counter()
+    removidos = lotes = ultimo = 0
+    while True:
+        ids = list(registros.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            break
+        with transaction.atomic():
+            lote = FinancialRecord.objects.filter(id__in=ids)
+            grupos = agrupar(lote, rollup.CAMPOS)
+            removidos += lote.delete()[0]
+            rollup.descontar(grupos, owner)
+            incrementar_versao(escopo_usuario(owner))
+        lotes += 1
+        ultimo = ids[-1]
+        logger.info('Exclusão: lote %s, %s registros removidos', lotes, removidos)
+        if progresso is not None:
+            progresso(removidos, lotes)
+        if len(ids) < tamanho_lote:
+            break
+    return {'removidos': removidos, 'lotes': lotes, 'tempo_segundos': round(time.perf_counter() - inicio, 3)}
@@ -0,0 +1,106 @@
+import logging
+
+from django.conf import settings
+
+from .clientes import obter_llm
+from .models import Conversation, Message
+from .resumo import CARACTERES_POR_TOKEN, estimar_tokens
+
+logger = logging.getLogger(__name__)
+
+# Histórico do agente com custo limitado por turno: o prompt leva o resumo da conversa
+# (Conversation.resumo, que cobre as mensagens até resumo_ate) e as mensagens posteriores a ele, no
+# máximo HISTORICO_MAX_MENSAGENS + 2 * HISTORICO_RESUMIR_A_CADA (LIMIT no banco) e
+# HISTORICO_MAX_TOKENS. Toda mensagem está em um dos dois.
+
+PROMPT_RESUMO = (
+    "Você mantém o resumo de uma conversa entre um usuário e a Corujita, assistente financeira. "
+    "Atualize o resumo abaixo incorporando as novas mensagens. Preserve valores, datas, categorias, "
+    "decisões e preferências do usuário. Responda apenas com o novo resumo, em no máximo {max_palavras} palavras.\n\n"
+    "Resumo atual:\n{resumo}\n\n"
+    "Novas mensagens:\n{mensagens}\n\n"
+    "Novo resumo:"
+)
+
+# Mensagens muito longas entram cortadas no pedido de resumo
+MAX_CARACTERES_MENSAGEM = 2000
+
+
+def linha(msg):
+    role = 'Usuário' if msg.sender == 'user' else 'Assistente'
+    return f"{role}: {msg.text}"
+
+
+async def mensagens_recentes(conversation):
+    """Mensagens ainda fora do resumo (id > resumo_ate), da mais antiga para a mais nova.
+
+    São no máximo HISTORICO_MAX_MENSAGENS + 2 * HISTORICO_RESUMIR_A_CADA: as que passam da janela
+    continuam no prompt até entrarem no resumo.
+    """
+    limite = settings.HISTORICO_MAX_MENSAGENS + 2 * settings.HISTORICO_RESUMIR_A_CADA
+    consulta = Message.objects.filter(conversation=conversation, id__gt=conversation.resumo_ate).order_by('-id')[:limite]
+    recentes = [msg async for msg in consulta]
+    recentes.reverse()
+    return recentes
+
+
+def quantas_cabem(mensagens):
+    # Quantas das mensagens mais novas cabem em HISTORICO_MAX_TOKENS (a mais nova sempre entra, cortada)
+    tokens = 0
+    for quantidade, msg in enumerate(reversed(mensagens)):
+        tokens += estimar_tokens(linha(msg))
+        if tokens > settings.HISTORICO_MAX_TOKENS:
+            return max(quantidade, 1)
+    return len(mensagens)
+
+
+def historico_texto(mensagens):
+    # Mantém as mensagens mais novas que cabem em HISTORICO_MAX_TOKENS
+    linhas = [linha(msg) for msg in mensagens[len(mensagens) - quantas_cabem(mensagens):]]
+    if linhas and estimar_tokens(linhas[0]) > settings.HISTORICO_MAX_TOKENS:
+        linhas[0] = linhas[0][:settings.HISTORICO_MAX_TOKENS * CARACTERES_POR_TOKEN]
+    return "\n".join(linhas)
+
+
+async def atualizar_resumo(conversation):
+    """Incorpora ao resumo as mensagens que não vão mais caber no prompt do próximo turno.
+
+    Roda depois de gravar o turno, com as mesmas mensagens que o próximo prompt vai usar: o que
+    ficaria de fora dele (limite de tokens ou da busca) é resumido na hora, então toda mensagem
+    está no prompt ou no resumo. As que só passaram de HISTORICO_MAX_MENSAGENS continuam no prompt
+    e são resumidas em lotes de HISTORICO_RESUMIR_A_CADA; cada chamada resume no máximo o dobro
+    disso (conversas antigas e longas são alcançadas aos poucos).
+    """
+    a_cada = settings.HISTORICO_RESUMIR_A_CADA
+    recentes = await mensagens_recentes(conversation)
+    if not recentes:
+        return
+    no_prompt = recentes[len(recentes) - quantas_cabem(recentes):]
+    pendentes = [
+        msg async for msg in
+        Message.objects.filter(conversation=conversation, id__gt=conversation.resumo_ate, id__lt=no_prompt[0].id)
+        .order_by('id')[:a_cada * 2]
+    ]
+    if not pendentes:
+        excedentes = recentes[:max(len(recentes) - settings.HISTORICO_MAX_MENSAGENS, 0)]
+        if len(excedentes) < a_cada:
+            return
+        pendentes = excedentes[:a_cada * 2]
+    prompt = PROMPT_RESUMO.format(
+        max_palavras=settings.RESUMO_CONVERSA_MAX_TOKENS * 3 // 4,
+        resumo=conversation.resumo or '(vazio)',
+        mensagens="\n".join(linha(msg)[:MAX_CARACTERES_MENSAGEM] for msg in pendentes),
+    )
+    try:
+        resumo = str(await obter_llm('resumo').ainvoke(prompt)).strip()
+    except Exception:
+        logger.exception('Falha ao resumir a conversa %s', conversation.conversation_id)
+        return
+    resumo = resumo[:settings.RESUMO_CONVERSA_MAX_TOKENS * CARACTERES_POR_TOKEN]
+    ate = pendentes[-1].id
+    # Se outro turno já atualizou o resumo, este resultado é descartado
+    atualizados = await Conversation.objects.filter(
+        pk=conversation.pk, resumo_ate=conversation.resumo_ate
+    ).aupdate(resumo=resumo, resumo_ate=ate)
+    if atualizados:
+        conversation.resumo, conversation.resumo_ate = resumo, ate
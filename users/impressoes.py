@@ -0,0 +1,54 @@
+import hashlib
+
+import pandas as pd
+
+# Impressão digital de cada FinancialRecord: identifica a linha entre uploads para que reimportar
+# um CSV não duplique registros. A identidade é o dono, a data, o valor, o tipo, o
+# cliente/fornecedor e a descrição, mais a ocorrência da linha no arquivo (duas linhas idênticas
+# no mesmo CSV são dois lançamentos). Os demais campos podem mudar entre uploads e são atualizados.
+
+CAMPOS_ATUALIZAVEIS = ['categoria', 'forma_pagamento', 'status']
+SEPARADOR = '\x1f'
+
+
+def _texto(serie):
+    return serie.astype(str).str.strip()
+
+
+def identidades(df):
+    # Usa os campos normalizados quando existem: '1.234,5' e '1234,50' são o mesmo valor
+    datas = df['data_normalizada']
+    valores = pd.to_numeric(df['valor_normalizado'])
+    partes = [
+        datas.astype(str).where(datas.notna(), _texto(df['data'])),
+        valores.map('{:.2f}'.format).where(valores.notna(), _texto(df['valor'])),
+        df['tipo_normalizado'].astype(str),
+        _texto(df['cliente_fornecedor']),
+        _texto(df['descricao']),
+    ]
+    identidade = partes[0]
+    for parte in partes[1:]:
+        identidade = identidade + SEPARADOR + parte
+    return identidade
+
+
+class ImpressoesLinhas:
+    """Calcula as impressões dos chunks de um mesmo arquivo, contando as ocorrências entre chunks."""
+
+    def __init__(self, owner_id):
+        self.prefixo = str(owner_id) if owner_id is not None else 'anon'
+        # resumo da identidade -> linhas já vistas com ela
+        self.ocorrencias = {}
+
+    def calcular(self, df):
+        resumos = pd.Series(
+            [hashlib.blake2b(texto.encode('utf-8'), digest_size=16).digest() for texto in identidades(df)],
+            index=df.index,
+        )
+        ocorrencias = resumos.groupby(resumos, sort=False).cumcount() + resumos.map(self.ocorrencias).fillna(0).astype('int64')
+        for resumo, quantidade in resumos.value_counts(sort=False).items():
+            self.ocorrencias[resumo] = self.ocorrencias.get(resumo, 0) + quantidade
+        return [
+            hashlib.sha256(f'{self.prefixo}{SEPARADOR}{resumo.hex()}{SEPARADOR}{ocorrencia}'.encode()).hexdigest()
+            for resumo, ocorrencia in zip(resumos, ocorrencias)
+        ]
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import tempfile
+import time
+from itertools import islice
+
+from django.conf import settings
+from langchain_community.vectorstores import FAISS
+
+from . import vectorstores
+from .embeddings import obter_embeddings
+from .instrumentacao import etapa
+from .ingestion import CAMPOS_MODELO
+
+logger = logging.getLogger(__name__)
+
+
+def textos_linhas(df):
+    # Cada linha do CSV vira um documento: 'Data: ... | Cliente/Fornecedor: ... | ...'
+    texto = None
+    for col_padrao, campo in CAMPOS_MODELO.items():
+        parte = col_padrao + ': ' + df[campo].astype(str)
+        texto = parte if texto is None else texto + ' | ' + parte
+    return texto
+
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class IndexadorVectorstore:
+    """Gera embeddings das linhas ingeridas e grava o vectorstore.
+
+    Durante a ingestão os textos só são acumulados, num arquivo temporário (a memória não cresce
+    com o tamanho do CSV); os embeddings saem em `finalizar`, chamado depois do commit dos
+    registros, para que nem as chamadas ao modelo nem as gravações do EmbeddingCache fiquem dentro
+    de uma transação que ainda pode ser desfeita. São enviados em blocos de EMBEDDING_BATCH_SIZE x
+    EMBEDDING_MAX_CONCURRENCY lidos do arquivo; `obter_embeddings` cuida dos lotes, da
+    concorrência e do cache.
+
+    Linhas cujo texto já está no vectorstore (mesmo hash de conteúdo) não são embutidas de novo.
+    Falhas de embedding não interrompem a ingestão: ficam registradas em `erro`.
+    """
+
+    def __init__(self, chave, embeddings=None):
+        self.chave = chave
+        self.caminho = vectorstores.caminho_vectorstore(chave)
+        self.embeddings = embeddings or obter_embeddings()
+        self.tamanho_bloco = settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_MAX_CONCURRENCY
+        self._iniciar()
+
+    def _iniciar(self):
+        self._fechar_pendentes()
+        self.vectorstore = None
+        self.hashes = set()
+        # (texto, hash) de cada linha a embutir, um JSON por linha
+        self.pendentes = None
+        self.novos = 0
+        self.ignorados = 0
+        self.tempo_embeddings = 0.0
+        self.erro = None
+        if not vectorstores.existe(self.caminho):
+            return
+        try:
+            self.vectorstore = vectorstores.carregar(self.caminho, self.embeddings, somente_leitura=False)
+        except Exception as e:
+            logger.exception('Falha ao abrir o vectorstore %s para escrita', self.caminho)
+            self.erro = str(e)
+            return
+        for doc_id in self.vectorstore.index_to_docstore_id.values():
+            self.hashes.add(self.vectorstore.docstore.search(doc_id).metadata.get('hash'))
+
+    def _fechar_pendentes(self):
+        if getattr(self, 'pendentes', None) is not None:
+            self.pendentes.close()
+            self.pendentes = None
+
+    def descartar(self):
+        # Volta ao estado gravado em disco (a ingestão vai recomeçar do início do arquivo)
+        self._iniciar()
+
+    def adicionar_linhas(self, df):
+        if self.erro:
+            return
+        textos = textos_linhas(df)
+        for texto in textos:
+            h = hash_texto(texto)
+            if h in self.hashes:
+                self.ignorados += 1
+                continue
+            self.hashes.add(h)
+            if self.pendentes is None:
+                self.pendentes = tempfile.TemporaryFile('w+', encoding='utf-8')
+            self.pendentes.write(json.dumps([texto, h], ensure_ascii=False) + '\n')
+
+    def _embutir(self, pendentes):
+        if self.erro:
+            return
+        inicio = time.perf_counter()
+        try:
+            with etapa('ingestao.embeddings'):
+                vetores = self.embeddings.embed_documents([texto for texto, _ in pendentes])
+        except Exception as e:
+            logger.exception('Falha ao gerar embeddings para o vectorstore %s', self.caminho)
+            self.erro = str(e)
+            return
+        self.tempo_embeddings += time.perf_counter() - inicio
+        pares = [(texto, vetor) for (texto, _), vetor in zip(pendentes, vetores)]
+        metadatas = [{'hash': h} for _, h in pendentes]
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_embeddings(pares, self.embeddings, metadatas=metadatas)
+        else:
+            self.vectorstore.add_embeddings(pares, metadatas=metadatas)
+        self.novos += len(pares)
+
+    def finalizar(self):
+        if self.pendentes is not None:
+            self.pendentes.seek(0)
+            while bloco := [json.loads(linha) for linha in islice(self.pendentes, self.tamanho_bloco)]:
+                self._embutir(bloco)
+            self._fechar_pendentes()
+        if self.erro is None and self.novos:
+            try:
+                vectorstores.salvar(self.caminho, self.vectorstore)
+            except Exception as e:
+                logger.exception('Falha ao gravar o vectorstore %s', self.caminho)
+                self.erro = str(e)
+        resultado = {
+            'chave': self.chave,
+            'documentos_novos': self.novos,
+            'documentos_ignorados': self.ignorados,
+            'documentos_total': self.vectorstore.index.ntotal if self.vectorstore is not None else 0,
+            'tempo_embeddings_segundos': round(self.tempo_embeddings, 3),
+            'documentos_por_segundo': round(self.novos / self.tempo_embeddings, 1) if self.tempo_embeddings > 0 else 0.0,
+        }
+        if self.erro:
+            resultado['erro'] = self.erro
+        return resultado
@@ -0,0 +1,296 @@
+import codecs
+import csv
+import hashlib
+import time
+import unicodedata
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .analytics import agrupar
+from .impressoes import CAMPOS_ATUALIZAVEIS, ImpressoesLinhas
+from .instrumentacao import etapa, medir_iteracao
+from .leitura_paralela import ler_em_paralelo
+from .models import FinancialRecord, UploadBatch
+from .parsing import RelatorioRejeicoes, adicionar_campos_normalizados, padronizar_colunas
+from .rollup import CAMPOS as CAMPOS_ROLLUP, AcumuladorRollup, descontar
+from .versoes import escopo_usuario, incrementar_versao
+
+# Chave normalizada -> nome da coluna padrão do CSV
+COLUNAS_PADRAO = {
+    'data': 'Data',
+    'clientefornecedor': 'Cliente/Fornecedor',
+    'descricao': 'Descrição',
+    'categoria': 'Categoria',
+    'valorr$': 'Valor (R$)',
+    'tipo': 'Tipo',
+    'formadepagamento': 'Forma de Pagamento',
+    'status': 'Status'
+}
+
+# Coluna padrão do CSV -> campo do FinancialRecord
+CAMPOS_MODELO = {
+    'Data': 'data',
+    'Cliente/Fornecedor': 'cliente_fornecedor',
+    'Descrição': 'descricao',
+    'Categoria': 'categoria',
+    'Valor (R$)': 'valor',
+    'Tipo': 'tipo',
+    'Forma de Pagamento': 'forma_pagamento',
+    'Status': 'status'
+}
+
+# Quantidade de bytes lida do início do arquivo para detectar encoding e separador
+AMOSTRA_BYTES = 64 * 1024
+
+
+class ErroLeituraCSV(Exception):
+    pass
+
+
+def normalizar(col):
+    return unicodedata.normalize('NFKD', col).encode('ASCII', 'ignore').decode('ASCII').strip().lower().replace('/', '').replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
+
+
+def detectar_formato(file):
+    # Lê só uma amostra do arquivo: o restante é processado em streaming
+    file.seek(0)
+    amostra = file.read(AMOSTRA_BYTES)
+    file.seek(0)
+    try:
+        # Decoder incremental tolera um caractere multibyte cortado no fim da amostra
+        texto = codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        texto = amostra.decode('latin1')
+        encoding = 'latin1'
+    # Detectar separador automaticamente
+    sample = texto[:1024]
+    sniffer = csv.Sniffer()
+    sep = ','
+    try:
+        if sniffer.has_header(sample):
+            dialect = sniffer.sniff(sample)
+            sep = dialect.delimiter
+    except csv.Error:
+        pass
+    return encoding, sep
+
+
+def mapear_colunas(colunas):
+    # Coluna padrão -> coluna correspondente no CSV (ou None se ausente)
+    colunas_csv = {normalizar(str(col)): col for col in colunas}
+    return {col_padrao: colunas_csv.get(key) for key, col_padrao in COLUNAS_PADRAO.items()}
+
+
+def colunas_modelo(colunas):
+    # Campo do FinancialRecord -> coluna correspondente no CSV (ou None se ausente)
+    return {CAMPOS_MODELO[col_padrao]: col_csv for col_padrao, col_csv in mapear_colunas(colunas).items()}
+
+
+def ler_chunks(file, encoding, sep, tamanho_chunk):
+    file.seek(0)
+    # O pandas ignora o encoding no wrapper UploadedFile do Django; usa o arquivo subjacente
+    handle = getattr(file, 'file', file)
+    try:
+        leitor = pd.read_csv(
+            handle, sep=sep, encoding=encoding, dtype=str,
+            keep_default_na=False, chunksize=tamanho_chunk
+        )
+        with leitor:
+            for chunk in leitor:
+                yield chunk
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, csv.Error) as e:
+        raise ErroLeituraCSV(str(e))
+
+
+def ler_padronizados(file, encoding, sep, tamanho_chunk, processos=1):
+    """Gera chunks de até `tamanho_chunk` linhas com os campos do modelo já normalizados.
+
+    Com mais de um processo, o arquivo é lido e normalizado em blocos por um pool de processos
+    (leitura_paralela); os blocos voltam na ordem do arquivo e são fatiados em chunks.
+    """
+    if processos <= 1:
+        colunas = None
+        # Leitura: decodificação e parse do CSV pelo pandas; normalização: valores, datas e tipos
+        for chunk in medir_iteracao('ingestao.leitura', ler_chunks(file, encoding, sep, tamanho_chunk)):
+            if colunas is None:
+                colunas = colunas_modelo(chunk.columns)
+            with etapa('ingestao.normalizacao'):
+                padrao = adicionar_campos_normalizados(padronizar_colunas(chunk, colunas))
+            yield padrao
+        return
+    file.seek(0)
+    handle = getattr(file, 'file', file)
+    try:
+        # Leitura e normalização acontecem nos processos do pool: mede-se a espera por cada bloco
+        blocos = ler_em_paralelo(handle, encoding, sep, colunas_modelo, processos, settings.CSV_BLOCO_BYTES)
+        for bloco in medir_iteracao('ingestao.leitura_paralela', blocos):
+            for inicio in range(0, len(bloco), tamanho_chunk):
+                yield bloco.iloc[inicio:inicio + tamanho_chunk].copy()
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, csv.Error) as e:
+        raise ErroLeituraCSV(str(e))
+
+
+def resumo_arquivo(file):
+    # sha256 e tamanho do arquivo, lido em blocos
+    file.seek(0)
+    sha256 = hashlib.sha256()
+    tamanho = 0
+    for bloco in iter(lambda: file.read(1024 * 1024), b''):
+        sha256.update(bloco)
+        tamanho += len(bloco)
+    file.seek(0)
+    return sha256.hexdigest(), tamanho
+
+
+def _classificar(linhas):
+    # Separa as linhas em novas, alteradas e já existentes pela impressão digital
+    existentes = {
+        impressao: valores
+        for impressao, *valores in FinancialRecord.objects.filter(impressao__in=[linha['impressao'] for linha in linhas])
+        .values_list('impressao', 'id', *CAMPOS_ATUALIZAVEIS)
+    }
+    novos, alterados, recategorizados, ids_recategorizados = [], [], [], []
+    for linha in linhas:
+        atual = existentes.get(linha['impressao'])
+        if atual is None:
+            novos.append(linha)
+        elif [linha[campo] for campo in CAMPOS_ATUALIZAVEIS] != atual[1:]:
+            alterados.append(linha)
+            if linha['categoria'] != atual[1]:
+                recategorizados.append(linha)
+                ids_recategorizados.append(atual[0])
+    return novos, alterados, recategorizados, ids_recategorizados
+
+
+def _inserir(novos, upload, tamanho_chunk):
+    # Insere sem sobrescrever (ON CONFLICT DO NOTHING) e devolve {impressão: id} das linhas que este
+    # upload gravou de fato: as que ficaram com o seu lote
+    if not novos:
+        return {}
+    FinancialRecord.objects.bulk_create(
+        [FinancialRecord(**linha, owner=upload.owner, lote_upload=upload.id) for linha in novos],
+        batch_size=tamanho_chunk, ignore_conflicts=True
+    )
+    return dict(
+        FinancialRecord.objects.filter(impressao__in=[linha['impressao'] for linha in novos], lote_upload=upload.id)
+        .values_list('impressao', 'id')
+    )
+
+
+def _gravar(padrao, upload, acumulador, tamanho_chunk):
+    with etapa('ingestao.existentes'):
+        novos, alterados, recategorizados, ids_recategorizados = _classificar(padrao.to_dict('records'))
+    with etapa('ingestao.insercao'):
+        inseridos = _inserir(novos, upload, tamanho_chunk)
+    if len(inseridos) < len(novos):
+        # Gravadas por outro upload depois da consulta acima: são tratadas como já existentes, senão
+        # entrariam também no rollup como novas
+        with etapa('ingestao.existentes'):
+            _, *concorrentes = _classificar([linha for linha in novos if linha['impressao'] not in inseridos])
+        alterados, recategorizados, ids_recategorizados = (
+            anteriores + posteriores
+            for anteriores, posteriores in zip((alterados, recategorizados, ids_recategorizados), concorrentes)
+        )
+        novos = [linha for linha in novos if linha['impressao'] in inseridos]
+    upload.inseridos += len(novos)
+    upload.atualizados += len(alterados)
+    upload.ignorados += len(padrao) - len(novos) - len(alterados)
+    # Linhas que mudam de categoria saem do grupo antigo do rollup e entram no novo
+    grupos_antigos = agrupar(FinancialRecord.objects.filter(id__in=ids_recategorizados), CAMPOS_ROLLUP) if recategorizados else []
+    if alterados:
+        with etapa('ingestao.upsert'):
+            FinancialRecord.objects.bulk_create(
+                [FinancialRecord(**linha, owner=upload.owner, lote_upload=upload.id) for linha in alterados],
+                batch_size=tamanho_chunk, update_conflicts=True,
+                unique_fields=['impressao'], update_fields=CAMPOS_ATUALIZAVEIS
+            )
+    with etapa('ingestao.rollup'):
+        if grupos_antigos:
+            descontar(grupos_antigos, upload.owner)
+        if novos or recategorizados:
+            acumulador.adicionar(
+                pd.DataFrame(novos + recategorizados),
+                [inseridos[linha['impressao']] for linha in novos] + ids_recategorizados
+            )
+
+
+def _ingerir(file, encoding, sep, tamanho_chunk, processos, indexador, upload, inicio, progresso):
+    upload.linhas = upload.inseridos = upload.atualizados = upload.ignorados = 0
+    acumulador = AcumuladorRollup(upload.owner)
+    impressoes = ImpressoesLinhas(upload.owner_id)
+    rejeicoes = RelatorioRejeicoes()
+    with transaction.atomic():
+        for padrao in ler_padronizados(file, encoding, sep, tamanho_chunk, processos):
+            rejeicoes.registrar(padrao, upload.linhas + 1)
+            with etapa('ingestao.impressoes'):
+                padrao['impressao'] = impressoes.calcular(padrao)
+            _gravar(padrao, upload, acumulador, tamanho_chunk)
+            if indexador is not None:
+                with etapa('ingestao.indexacao'):
+                    indexador.adicionar_linhas(padrao)
+            upload.linhas += len(padrao)
+            if progresso is not None:
+                progresso(upload.linhas)
+        # Atualiza os totais do rollup e a versão dos dados na mesma transação dos registros;
+        # reimportar um arquivo sem mudanças não invalida os caches
+        with etapa('ingestao.rollup'):
+            acumulador.aplicar()
+        if upload.inseridos or upload.atualizados:
+            incrementar_versao(escopo_usuario(upload.owner))
+        upload.tempo_segundos = round(time.perf_counter() - inicio, 3)
+        upload.save()
+    return rejeicoes.resumo()
+
+
+def ingerir_csv(file, tamanho_chunk=None, indexador=None, owner=None, nome_arquivo=None, progresso=None, processos=None):
+    """Grava o CSV em FinancialRecord em lotes de tamanho fixo, numa única transação.
+
+    Os registros pertencem a `owner` (None: sem dono). Linhas que já existem (mesma impressão
+    digital) não são duplicadas: são ignoradas ou, se categoria, forma de pagamento ou status
+    mudaram, atualizadas. O upload fica registrado num UploadBatch, cujo id volta como
+    `lote_upload`. Valores e datas que não puderam ser convertidos ficam nulos e são listados em
+    `rejeitados`. Se `indexador` for informado, as linhas também vão para o vectorstore, com os
+    embeddings gerados depois do commit (não chamar dentro de outra transação).
+    `progresso(linhas)` é chamado após cada chunk. Arquivos a partir de CSV_PARALELO_MIN_BYTES são
+    lidos e normalizados por `processos` processos (padrão: CSV_PROCESSOS).
+    """
+    tamanho_chunk = tamanho_chunk or settings.CSV_CHUNK_SIZE
+    inicio = time.perf_counter()
+    with etapa('ingestao.hash'):
+        hash_arquivo, tamanho_bytes = resumo_arquivo(file)
+    arquivo_repetido = UploadBatch.objects.filter(owner=owner, hash_arquivo=hash_arquivo).exists()
+    upload = UploadBatch(
+        owner=owner, nome_arquivo=(nome_arquivo or getattr(file, 'name', '') or '')[:255],
+        hash_arquivo=hash_arquivo, tamanho_bytes=tamanho_bytes
+    )
+    if processos is None:
+        processos = settings.CSV_PROCESSOS if tamanho_bytes >= settings.CSV_PARALELO_MIN_BYTES else 1
+    with etapa('ingestao.deteccao'):
+        encoding, sep = detectar_formato(file)
+    try:
+        rejeicoes = _ingerir(file, encoding, sep, tamanho_chunk, processos, indexador, upload, inicio, progresso)
+    except UnicodeDecodeError:
+        # Byte inválido depois da amostra: a transação já foi desfeita, reprocessa como latin1
+        if indexador is not None:
+            indexador.descartar()
+        rejeicoes = _ingerir(file, 'latin1', sep, tamanho_chunk, processos, indexador, upload, inicio, progresso)
+    tempo = time.perf_counter() - inicio
+    resultado = {
+        'registros': upload.linhas,
+        'inseridos': upload.inseridos,
+        'atualizados': upload.atualizados,
+        'ignorados': upload.ignorados,
+        'arquivo_repetido': arquivo_repetido,
+        'rejeitados': rejeicoes,
+        'lote_upload': str(upload.id),
+        'tempo_segundos': round(tempo, 3),
+        'linhas_por_segundo': round(upload.linhas / tempo, 1) if tempo > 0 else 0.0
+    }
+    if indexador is not None:
+        # Registros já gravados: os embeddings saem fora da transação da ingestão
+        with etapa('ingestao.vectorstore'):
+            resultado['vectorstore'] = indexador.finalizar()
+    return resultado
@@ -0,0 +1,357 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .resumo import estimar_tokens
+
+# Instrumentação dos caminhos quentes (agente, RAG, ingestão): etapas cronometradas, consultas ao
+# banco e tokens estimados por chamada ao LLM. Cada requisição (ou job de ingestão) acumula as
+# suas medições numa Medicao, devolvida no header Server-Timing; o processo acumula os totais,
+# expostos no formato texto do Prometheus. Com INSTRUMENTACAO desligada, `etapa` devolve um
+# contexto vazio, o middleware não é carregado e as consultas ao banco não passam pelo contador.
+
+# Limites (segundos) dos buckets dos histogramas
+LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Campo de `estatisticas()` dos caches -> (métrica, tipo, descrição); cada cache exporta os que tiver
+METRICAS_CACHE = (
+    ('hits', 'corujita_cache_hits_total', 'counter', 'Buscas encontradas no cache, por cache.'),
+    ('misses', 'corujita_cache_misses_total', 'counter', 'Buscas não encontradas no cache, por cache.'),
+    ('evictions', 'corujita_cache_evictions_total', 'counter', 'Entradas removidas por falta de espaço, por cache.'),
+    ('expirados', 'corujita_cache_expirados_total', 'counter', 'Entradas removidas por terem vencido, por cache.'),
+    ('itens', 'corujita_cache_itens', 'gauge', 'Entradas guardadas no cache, por cache.'),
+    ('bytes', 'corujita_cache_bytes', 'gauge', 'Memória estimada ocupada pelo cache, por cache.'),
+)
+
+_medicao = ContextVar('medicao', default=None)
+_DESLIGADA = nullcontext()
+
+# Cópia de settings.INSTRUMENTACAO: cada leitura do LazySettings custa mais que a etapa desligada
+ligada = settings.INSTRUMENTACAO
+
+
+def _configuracao_alterada(setting, value, **kwargs):
+    # override_settings (benchmarks)
+    global ligada
+    if setting == 'INSTRUMENTACAO':
+        ligada = bool(value)
+
+
+setting_changed.connect(_configuracao_alterada, dispatch_uid='instrumentacao_ligada')
+
+
+class Histograma:
+    __slots__ = ('contagens', 'soma', 'total')
+
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES_SEGUNDOS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, segundos):
+        self.contagens[bisect.bisect_left(LIMITES_SEGUNDOS, segundos)] += 1
+        self.soma += segundos
+        self.total += 1
+
+
+class Medicao:
+    """Etapas, consultas ao banco e tokens de uma requisição ou job."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        # nome -> [chamadas, segundos]
+        self.etapas = {}
+        self.consultas = 0
+        self.segundos_banco = 0.0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self._lock = threading.Lock()
+
+    def adicionar_etapa(self, nome, segundos):
+        # Etapas de uma mesma requisição podem terminar em threads diferentes (em_thread)
+        with self._lock:
+            etapa = self.etapas.setdefault(nome, [0, 0.0])
+            etapa[0] += 1
+            etapa[1] += segundos
+
+    def adicionar_consulta(self, segundos):
+        with self._lock:
+            self.consultas += 1
+            self.segundos_banco += segundos
+
+    def adicionar_tokens(self, prompt, resposta):
+        with self._lock:
+            self.tokens_prompt += prompt
+            self.tokens_resposta += resposta
+
+    def server_timing(self, total):
+        partes = [f'{nome};dur={segundos * 1000:.1f}' for nome, (_, segundos) in self.etapas.items()]
+        partes.append(f'db;dur={self.segundos_banco * 1000:.1f};desc="{self.consultas} consultas"')
+        if self.tokens_prompt or self.tokens_resposta:
+            partes.append(f'llm.tokens;desc="{self.tokens_prompt} prompt, {self.tokens_resposta} resposta"')
+        partes.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(partes)
+
+    def resumo(self):
+        return {
+            'etapas': {
+                nome: {'chamadas': chamadas, 'ms': round(segundos * 1000, 1)}
+                for nome, (chamadas, segundos) in self.etapas.items()
+            },
+            'consultas_banco': self.consultas,
+            'ms_banco': round(self.segundos_banco * 1000, 1),
+            'tokens_prompt': self.tokens_prompt,
+            'tokens_resposta': self.tokens_resposta,
+            'ms_total': round((time.perf_counter() - self.inicio) * 1000, 1),
+        }
+
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+
+class MetricasProcesso:
+    """Totais do processo desde a inicialização (cada worker tem os seus)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # nome -> função que devolve as estatísticas do cache (registrar_cache)
+        self.caches = {}
+        self.limpar()
+
+    def registrar_cache(self, nome, estatisticas):
+        # Chamado por cada cache na importação do seu módulo; os contadores são lidos a cada exportação
+        self.caches[nome] = estatisticas
+
+    def limpar(self):
+        with self._lock:
+            self.etapas = {}
+            # (view, método, status) -> quantidade
+            self.requisicoes = {}
+            # view -> Histograma da duração; view -> [consultas, segundos no banco]
+            self.duracao = {}
+            self.banco = {}
+            # (uso, tipo) -> tokens
+            self.tokens = {}
+
+    def registrar_etapa(self, nome, segundos):
+        with self._lock:
+            histograma = self.etapas.get(nome)
+            if histograma is None:
+                histograma = self.etapas[nome] = Histograma()
+            histograma.observar(segundos)
+
+    def registrar_requisicao(self, view, metodo, status, segundos, medicao):
+        with self._lock:
+            chave = (view, metodo, status)
+            self.requisicoes[chave] = self.requisicoes.get(chave, 0) + 1
+            histograma = self.duracao.get(view)
+            if histograma is None:
+                histograma = self.duracao[view] = Histograma()
+            histograma.observar(segundos)
+            banco = self.banco.setdefault(view, [0, 0.0])
+            banco[0] += medicao.consultas
+            banco[1] += medicao.segundos_banco
+
+    def registrar_tokens(self, uso, prompt, resposta):
+        with self._lock:
+            for tipo, tokens in (('prompt', prompt), ('resposta', resposta)):
+                self.tokens[(uso, tipo)] = self.tokens.get((uso, tipo), 0) + tokens
+
+    def _histograma(self, linhas, nome, rotulo, histogramas):
+        linhas.append(f'# TYPE {nome} histogram')
+        for valor, histograma in sorted(histogramas.items()):
+            acumulado = 0
+            for limite, contagem in zip((*LIMITES_SEGUNDOS, '+Inf'), histograma.contagens):
+                acumulado += contagem
+                linhas.append(f'{nome}_bucket{_rotulos(**{rotulo: valor, "le": limite})} {acumulado}')
+            linhas.append(f'{nome}_sum{_rotulos(**{rotulo: valor})} {histograma.soma:.6f}')
+            linhas.append(f'{nome}_count{_rotulos(**{rotulo: valor})} {histograma.total}')
+
+    def prometheus(self):
+        """Métricas no formato texto do Prometheus (text/plain; version=0.0.4)."""
+        # Fora do lock: cada cache tem o seu
+        caches = {nome: estatisticas() for nome, estatisticas in sorted(self.caches.items())}
+        with self._lock:
+            linhas = ['# HELP corujita_requisicoes_total Requisições atendidas por view, método e status.',
+                      '# TYPE corujita_requisicoes_total counter']
+            for (view, metodo, status), total in sorted(self.requisicoes.items()):
+                linhas.append(f'corujita_requisicoes_total{_rotulos(view=view, metodo=metodo, status=status)} {total}')
+            linhas.append('# HELP corujita_requisicao_segundos Duração das requisições por view.')
+            self._histograma(linhas, 'corujita_requisicao_segundos', 'view', self.duracao)
+            linhas += ['# HELP corujita_consultas_banco_total Consultas ao banco feitas pelas requisições, por view.',
+                       '# TYPE corujita_consultas_banco_total counter']
+            for view, (consultas, _) in sorted(self.banco.items()):
+                linhas.append(f'corujita_consultas_banco_total{_rotulos(view=view)} {consultas}')
+            linhas += ['# HELP corujita_banco_segundos_total Tempo das consultas ao banco das requisições, por view.',
+                       '# TYPE corujita_banco_segundos_total counter']
+            for view, (_, segundos) in sorted(self.banco.items()):
+                linhas.append(f'corujita_banco_segundos_total{_rotulos(view=view)} {segundos:.6f}')
+            linhas.append('# HELP corujita_etapa_segundos Duração das etapas instrumentadas (agente, RAG, ingestão, LLM).')
+            self._histograma(linhas, 'corujita_etapa_segundos', 'etapa', self.etapas)
+            linhas += ['# HELP corujita_llm_tokens_total Tokens estimados enviados e recebidos do LLM, por uso.',
+                       '# TYPE corujita_llm_tokens_total counter']
+            for (uso, tipo), tokens in sorted(self.tokens.items()):
+                linhas.append(f'corujita_llm_tokens_total{_rotulos(uso=uso, tipo=tipo)} {tokens}')
+        for campo, nome, tipo, descricao in METRICAS_CACHE:
+            valores = [(cache, dados[campo]) for cache, dados in caches.items() if campo in dados]
+            if valores:
+                linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} {tipo}']
+                linhas += [f'{nome}{_rotulos(cache=cache)} {valor}' for cache, valor in valores]
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = MetricasProcesso()
+
+
+class _Etapa:
+    __slots__ = ('nome', 'inicio')
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        segundos = time.perf_counter() - self.inicio
+        metricas.registrar_etapa(self.nome, segundos)
+        medicao = _medicao.get()
+        if medicao is not None:
+            medicao.adicionar_etapa(self.nome, segundos)
+
+
+def etapa(nome):
+    """Contexto que cronometra um trecho: `with etapa('rag.busca'): ...` (também em código async)."""
+    if not ligada:
+        return _DESLIGADA
+    return _Etapa(nome)
+
+
+def medir_iteracao(nome, iteravel):
+    # Cronometra cada next() do iterável (ex.: leitura dos chunks do CSV) como a etapa `nome`
+    if not ligada:
+        return iteravel
+    return _iterar_medindo(nome, iteravel)
+
+
+def _iterar_medindo(nome, iteravel):
+    iterador = iter(iteravel)
+    try:
+        while True:
+            with _Etapa(nome):
+                try:
+                    item = next(iterador)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        # Interrompido pelo consumidor: fecha o gerador de origem (libera arquivos e processos)
+        if hasattr(iterador, 'close'):
+            iterador.close()
+
+
+def registrar_tokens(uso, prompt, resposta):
+    """Tokens estimados de uma chamada ao LLM (prompt e resposta)."""
+    if not ligada:
+        return
+    tokens_prompt, tokens_resposta = estimar_tokens(str(prompt)), estimar_tokens(str(resposta))
+    metricas.registrar_tokens(uso, tokens_prompt, tokens_resposta)
+    medicao = _medicao.get()
+    if medicao is not None:
+        medicao.adicionar_tokens(tokens_prompt, tokens_resposta)
+
+
+@contextmanager
+def medindo():
+    """Medição de um trecho fora de uma requisição (ex.: job de ingestão); None se desligada."""
+    if not ligada:
+        yield None
+        return
+    medicao = Medicao()
+    token = _medicao.set(medicao)
+    try:
+        yield medicao
+    finally:
+        _medicao.reset(token)
+
+
+def _contar_consulta(execute, sql, params, many, context):
+    medicao = _medicao.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.adicionar_consulta(time.perf_counter() - inicio)
+
+
+def _instalar_contador(sender, connection, **kwargs):
+    # No início da lista: connection.execute_wrapper() de terceiros remove sempre o último
+    if _contar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _contar_consulta)
+
+
+def instalar():
+    # Chamado no ready() do app: com a instrumentação desligada, nenhuma consulta passa pelo contador
+    if ligada:
+        connection_created.connect(_instalar_contador, dispatch_uid='instrumentacao_consultas')
+        for conexao in connections.all(initialized_only=True):
+            _instalar_contador(None, conexao)
+
+
+class InstrumentacaoMiddleware:
+    """Mede cada requisição: header Server-Timing e totais do processo (view, status, consultas)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not ligada:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._chamar_async(request)
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            resposta = self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        return self._concluir(request, resposta, medicao)
+
+    async def _chamar_async(self, request):
+        medicao = Medicao()
+        token = _medicao.set(medicao)
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            _medicao.reset(token)
+        return self._concluir(request, resposta, medicao)
+
+    def _concluir(self, request, resposta, medicao):
+        # Em respostas em streaming, só entra o que foi medido antes do primeiro byte
+        total = time.perf_counter() - medicao.inicio
+        view = getattr(request.resolver_match, 'view_name', None) or 'nao_encontrada'
+        metricas.registrar_requisicao(view, request.method, resposta.status_code, total, medicao)
+        timing = medicao.server_timing(total)
+        resposta['Server-Timing'] = f"{resposta['Server-Timing']}, {timing}" if resposta.has_header('Server-Timing') else timing
+        return resposta
@@ -0,0 +1,110 @@
+import io
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .parsing import adicionar_campos_normalizados, padronizar_colunas
+
+# Leitura de CSVs grandes em vários processos: o arquivo é dividido em blocos de bytes terminados
+# em fim de linha, cada processo lê e normaliza um bloco e os blocos voltam na ordem do arquivo.
+# Este módulo não importa o Django: é o que os processos do pool carregam.
+
+ASPAS = b'"'
+
+# Número de processos -> executor, criados uma vez por processo
+_executores = {}
+_executores_lock = threading.Lock()
+
+
+def _corte(dados, inicio=0, primeiro=False):
+    """Posição logo após um fim de linha que não está dentro de um campo entre aspas (ou -1).
+
+    Um bloco começa fora de aspas; o fim de linha só encerra um registro se houver um número par
+    de aspas antes dele (aspas escapadas como "" contam duas vezes).
+    """
+    if primeiro:
+        fim = dados.find(b'\n', inicio)
+        while fim != -1:
+            if dados.count(ASPAS, inicio, fim) % 2 == 0:
+                return fim + 1
+            fim = dados.find(b'\n', fim + 1)
+        return -1
+    fim = dados.rfind(b'\n', inicio)
+    while fim != -1:
+        if dados.count(ASPAS, inicio, fim) % 2 == 0:
+            return fim + 1
+        fim = dados.rfind(b'\n', inicio, fim)
+    return -1
+
+
+def dividir_blocos(handle, tamanho_bloco):
+    """Lê o cabeçalho e gera blocos de ~tamanho_bloco bytes com linhas inteiras."""
+    pendente = b''
+    cabecalho = None
+    while True:
+        lido = handle.read(tamanho_bloco)
+        dados = pendente + lido
+        if cabecalho is None:
+            corte = _corte(dados, primeiro=True)
+            if corte == -1 and lido:
+                pendente = dados
+                continue
+            cabecalho, dados = (dados, b'') if corte == -1 else (dados[:corte], dados[corte:])
+            yield cabecalho
+        if not lido:
+            if dados.strip():
+                yield dados
+            return
+        corte = _corte(dados)
+        if corte <= 0:
+            # Nenhum registro completo ainda (campo entre aspas muito longo): continua lendo
+            pendente = dados
+            continue
+        pendente = dados[corte:]
+        yield dados[:corte]
+
+
+def colunas_do_cabecalho(cabecalho, encoding, sep):
+    return list(pd.read_csv(io.BytesIO(cabecalho), sep=sep, encoding=encoding, dtype=str, nrows=0).columns)
+
+
+def normalizar_bloco(cabecalho, bloco, encoding, sep, colunas):
+    # Executado nos processos do pool: lê o bloco com o cabeçalho do arquivo e normaliza os campos
+    df = pd.read_csv(io.BytesIO(cabecalho + bloco), sep=sep, encoding=encoding, dtype=str, keep_default_na=False)
+    return adicionar_campos_normalizados(padronizar_colunas(df, colunas))
+
+
+def executor(processos):
+    with _executores_lock:
+        if processos not in _executores:
+            # spawn: os processos não herdam conexões de banco nem threads do processo web
+            _executores[processos] = ProcessPoolExecutor(
+                max_workers=processos, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executores[processos]
+
+
+def ler_em_paralelo(handle, encoding, sep, mapear, processos, tamanho_bloco):
+    """Gera os blocos do CSV já normalizados, na ordem do arquivo.
+
+    `mapear(colunas_csv)` devolve o dicionário campo do modelo -> coluna do CSV. No máximo
+    2 * processos blocos ficam em memória ao mesmo tempo.
+    """
+    blocos = dividir_blocos(handle, tamanho_bloco)
+    cabecalho = next(blocos)
+    colunas = mapear(colunas_do_cabecalho(cabecalho, encoding, sep))
+    pool = executor(processos)
+    pendentes = deque()
+    try:
+        for bloco in blocos:
+            pendentes.append(pool.submit(normalizar_bloco, cabecalho, bloco, encoding, sep, colunas))
+            if len(pendentes) >= 2 * processos:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+    finally:
+        for futuro in pendentes:
+            futuro.cancel()
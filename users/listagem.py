@@ -0,0 +1,160 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+
+from .ingestion import CAMPOS_MODELO
+from .models import FinancialRecord
+
+# Listagem dos FinancialRecord de um dono sem carregar a tabela inteira: páginas por cursor
+# (keyset) em (owner, uploaded_at, id), do mais novo para o mais antigo, e exportação em
+# streaming (JSON, NDJSON ou CSV) lida do banco em lotes de TAMANHO_LOTE linhas, cada lote uma
+# consulta pelo mesmo índice.
+
+ORDEM = ('-uploaded_at', '-id')
+PAGINA_PADRAO = 100
+PAGINA_MAXIMA = 1000
+# Linhas lidas do banco e enviadas ao cliente por vez no streaming
+TAMANHO_LOTE = 2000
+
+COLUNAS = list(CAMPOS_MODELO) + ['uploaded_at']
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(uploaded_at, pk):
+    return base64.urlsafe_b64encode(f'{uploaded_at.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        uploaded_at, pk = texto.rsplit('|', 1)
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ParametroInvalido('Cursor inválido.')
+
+
+def ler_limite(valor):
+    if valor in (None, ''):
+        return PAGINA_PADRAO
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ParametroInvalido('limite deve ser um número inteiro.')
+    if not 1 <= limite <= PAGINA_MAXIMA:
+        raise ParametroInvalido(f'limite deve estar entre 1 e {PAGINA_MAXIMA}.')
+    return limite
+
+
+def registros(owner, posicao=None):
+    # Tuplas (campos do CSV..., uploaded_at, id) depois de posicao=(uploaded_at, id), sem instanciar o modelo
+    consulta = FinancialRecord.objects.filter(owner=owner).order_by(*ORDEM)
+    if posicao:
+        uploaded_at, pk = posicao
+        consulta = consulta.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk))
+    return consulta.values_list(*CAMPOS_MODELO.values(), 'uploaded_at', 'id')
+
+
+def _posicao(cursor):
+    return decodificar_cursor(cursor) if cursor else None
+
+
+def linha(valores):
+    dados = dict(zip(CAMPOS_MODELO, valores))
+    dados['uploaded_at'] = valores[-2].strftime('%Y-%m-%d %H:%M')
+    return dados
+
+
+def pagina(owner, cursor, limite):
+    """Até `limite` registros depois do cursor e o cursor da próxima página (None na última)."""
+    valores = list(registros(owner, _posicao(cursor))[:limite + 1])
+    proximo = codificar_cursor(valores[limite - 1][-2], valores[limite - 1][-1]) if len(valores) > limite else None
+    return [linha(v) for v in valores[:limite]], proximo
+
+
+def _lote(owner, posicao):
+    return list(registros(owner, posicao)[:TAMANHO_LOTE])
+
+
+def _em_lotes(owner, posicao, formatar):
+    # Um bloco de texto por lote; o próximo lote continua depois da última linha do anterior
+    while True:
+        valores = _lote(owner, posicao)
+        if valores:
+            yield ''.join(formatar(v) for v in valores)
+        if len(valores) < TAMANHO_LOTE:
+            break
+        posicao = valores[-1][-2:]
+
+
+async def _assincrono(blocos):
+    # Sob ASGI: cada passo do gerador (no máximo uma consulta de lote) roda fora do event loop
+    proximo = sync_to_async(next)
+    while (bloco := await proximo(blocos, None)) is not None:
+        yield bloco
+
+
+def _json(valores):
+    # Mesmo formato do JSONRenderer do DRF (UTF-8, sem espaços)
+    return json.dumps(linha(valores), ensure_ascii=False, separators=(',', ':'))
+
+
+def _lista_json(owner, posicao):
+    # '[' + objetos separados por vírgula + ']', sem montar a lista em memória
+    yield '['
+    primeiro = True
+    for bloco in _em_lotes(owner, posicao, lambda valores: ',' + _json(valores)):
+        yield bloco[1:] if primeiro else bloco
+        primeiro = False
+    yield ']'
+
+
+def _ndjson(owner, posicao):
+    return _em_lotes(owner, posicao, lambda valores: _json(valores) + '\n')
+
+
+def _csv(valores):
+    saida = io.StringIO()
+    csv.writer(saida).writerow(list(linha(valores).values()))
+    return saida.getvalue()
+
+
+def _csv_com_cabecalho(owner, posicao):
+    saida = io.StringIO()
+    csv.writer(saida).writerow(COLUNAS)
+    yield saida.getvalue()
+    yield from _em_lotes(owner, posicao, _csv)
+
+
+FORMATOS = {
+    'json': (_lista_json, 'application/json'),
+    'ndjson': (_ndjson, 'application/x-ndjson'),
+    'csv': (_csv_com_cabecalho, 'text/csv'),
+}
+
+
+def resposta_streaming(owner, formato, cursor=None, assincrono=False):
+    """Todos os registros do dono depois do cursor (ou todos), enviados conforme são lidos do banco.
+
+    A memória não cresce com o tamanho da tabela: via WSGI o iterador é síncrono (o worker fica
+    ocupado até o fim); via ASGI (assincrono=True) é assíncrono, senão o Django o consumiria
+    inteiro numa thread antes de enviar.
+    """
+    if formato not in FORMATOS:
+        raise ParametroInvalido(f"formato deve ser um de: {', '.join(FORMATOS)}.")
+    gerar, content_type = FORMATOS[formato]
+    blocos = gerar(owner, _posicao(cursor))
+    if assincrono:
+        blocos = _assincrono(blocos)
+    resposta = StreamingHttpResponse(blocos, content_type=f'{content_type}; charset=utf-8')
+    if formato == 'csv':
+        resposta['Content-Disposition'] = 'attachment; filename="registros_financeiros.csv"'
+    return resposta
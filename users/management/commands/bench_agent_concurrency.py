@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+from users.bench import ServidorASGI, ServidorLLMFalso, apontar_para
+from users.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Dispara perguntas simultâneas ao financial-agent/ (servido por uvicorn) contra um LLM falso local e mede a concorrência obtida.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200)
+        parser.add_argument('--latencia-ms', type=float, default=1000.0, help='Latência simulada de cada chamada ao LLM.')
+
+    async def disparar(self, url, quantidade):
+        limites = httpx.Limits(max_connections=quantidade)
+        # Host 'localhost' para passar pelo ALLOWED_HOSTS
+        async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120, headers={'Host': 'localhost'}) as cliente:
+            async def perguntar(i):
+                resposta = await cliente.post(
+                    '/users/financial-agent/',
+                    json={'question': 'Qual foi meu lucro?', 'conversation_id': f'bench-agente-{i}'}
+                )
+                return resposta.status_code
+
+            return await asyncio.gather(*(perguntar(i) for i in range(quantidade)))
+
+    def handle(self, *args, **options):
+        latencia = options['latencia_ms'] / 1000
+        quantidade = options['requisicoes']
+        with ServidorLLMFalso(latencia=latencia) as servidor:
+            apontar_para(servidor)
+            # Um único worker uvicorn (um processo, um event loop), como em produção
+            with ServidorASGI() as app:
+                try:
+                    inicio = time.perf_counter()
+                    status = asyncio.run(self.disparar(app.url, quantidade))
+                    tempo = time.perf_counter() - inicio
+                finally:
+                    Conversation.objects.filter(conversation_id__startswith='bench-agente-').delete()
+        ok = sum(1 for s in status if s == 200)
+        self.stdout.write(f'{ok}/{quantidade} respostas 200 em {tempo:.2f}s ({quantidade / tempo:.1f} req/s)')
+        self.stdout.write(f'chamadas ao LLM falso: {servidor.requisicoes}')
+        self.stdout.write(f'um worker síncrono levaria ~{quantidade * latencia:.1f}s (uma chamada por vez)')
+        self.stdout.write(f'concorrência efetiva: {quantidade * latencia / tempo:.0f} chamadas em andamento')
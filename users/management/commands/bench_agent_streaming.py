@@ -0,0 +1,68 @@
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+from users.bench import ServidorASGI, ServidorLLMFalso, apontar_para
+from users.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Compara o tempo até o primeiro byte do financial-agent/ com e sem streaming, contra um LLM falso local.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--latencia-ms', type=float, default=300.0, help='Latência até o primeiro token.')
+        parser.add_argument('--tokens', type=int, default=50)
+        parser.add_argument('--intervalo-ms', type=float, default=40.0, help='Intervalo entre tokens.')
+
+    async def medir(self, url, stream, repeticoes):
+        ttfb, ttft, totais, respostas = [], [], [], []
+        async with httpx.AsyncClient(base_url=url, timeout=120, headers={'Host': 'localhost'}) as cliente:
+            for i in range(repeticoes):
+                corpo = {'question': 'Qual foi meu lucro?', 'conversation_id': f'bench-stream-{int(stream)}-{i}', 'stream': stream}
+                inicio = time.perf_counter()
+                primeiro_byte = primeiro_token = None
+                conteudo = []
+                async with cliente.stream('POST', '/users/financial-agent/', json=corpo) as resposta:
+                    async for linha in resposta.aiter_lines():
+                        if primeiro_byte is None:
+                            primeiro_byte = time.perf_counter() - inicio
+                        if stream and primeiro_token is None and linha.startswith('data: {"token"'):
+                            primeiro_token = time.perf_counter() - inicio
+                        conteudo.append(linha)
+                totais.append(time.perf_counter() - inicio)
+                ttfb.append(primeiro_byte)
+                ttft.append(primeiro_token if stream else totais[-1])
+                if stream:
+                    fim = [json.loads(l[len('data: '):]) for l in conteudo if l.startswith('data: {"resposta"')]
+                    respostas.append(fim[-1]['resposta'] if fim else '')
+                else:
+                    respostas.append(json.loads(''.join(conteudo))['resposta'])
+        return ttfb, ttft, totais, respostas
+
+    def handle(self, *args, **options):
+        repeticoes = options['repeticoes']
+        with ServidorLLMFalso(
+            latencia=options['latencia_ms'] / 1000, tokens=options['tokens'], intervalo_tokens=options['intervalo_ms'] / 1000
+        ) as servidor:
+            apontar_para(servidor)
+            with ServidorASGI() as app:
+                try:
+                    for stream in (False, True):
+                        ttfb, ttft, totais, respostas = asyncio.run(self.medir(app.url, stream, repeticoes))
+                        gravadas = Message.objects.filter(
+                            conversation__conversation_id__startswith=f'bench-stream-{int(stream)}-', sender='agent'
+                        ).values_list('text', flat=True)
+                        self.stdout.write(
+                            f'{"streaming" if stream else "resposta única"}: '
+                            f'primeiro byte {statistics.median(ttfb) * 1000:.0f} ms, '
+                            f'primeiro token {statistics.median(ttft) * 1000:.0f} ms, '
+                            f'total {statistics.median(totais) * 1000:.0f} ms '
+                            f'(mensagens gravadas = resposta: {sorted(gravadas) == sorted(respostas)})'
+                        )
+                finally:
+                    Conversation.objects.filter(conversation_id__startswith='bench-stream-').delete()
@@ -0,0 +1,59 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from users.bench import ServidorLLMFalso, apontar_para
+from users.cache_respostas import cache_respostas
+from users.models import Conversation
+
+# (pergunta original, mesma pergunta com outra grafia, pergunta parecida)
+PERGUNTAS = [
+    ('Qual foi meu lucro?', 'qual foi meu LUCRO', 'Qual foi o meu lucro?'),
+    ('Quanto gastei com fornecedores?', 'quanto gastei com fornecedores', 'Quanto eu gastei com fornecedores?'),
+    ('Qual é a minha maior despesa?', 'Qual e a minha maior despesa!', 'Qual é a minha maior despesa do ano?'),
+    ('Como está meu fluxo de caixa?', 'como esta meu fluxo de caixa', 'Como está o meu fluxo de caixa?'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Mede o cache de respostas do agente (exato e semântico) contra um LLM falso local.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latencia-ms', type=float, default=1000.0)
+        parser.add_argument('--similaridade', type=float, default=None, help='Padrão: RESPOSTAS_CACHE_SIMILARIDADE.')
+
+    async def rodada(self, cliente, indice):
+        tempos, status = [], []
+        for i, variantes in enumerate(PERGUNTAS):
+            inicio = time.perf_counter()
+            resposta = await cliente.post(
+                '/users/financial-agent/',
+                {'question': variantes[indice], 'conversation_id': f'bench-cache-{indice}-{i}'},
+                content_type='application/json'
+            )
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            status.append(resposta['X-Cache'])
+        return statistics.median(tempos), status
+
+    async def rodadas(self):
+        cliente = AsyncClient()
+        for indice, titulo in enumerate(['perguntas novas', 'mesmo texto normalizado', 'perguntas parecidas']):
+            tempo, status = await self.rodada(cliente, indice)
+            self.stdout.write(f'{titulo}: mediana {tempo:.0f} ms ({" ".join(status)})')
+
+    def handle(self, *args, **options):
+        with ServidorLLMFalso(latencia=options['latencia_ms'] / 1000) as servidor:
+            # Embeddings locais em que textos parecidos têm vetores próximos
+            apontar_para(servidor, backend_embeddings='palavras', cache_de_respostas=True)
+            if options['similaridade'] is not None:
+                cache_respostas.similaridade = options['similaridade']
+            self.stdout.write(f'similaridade mínima: {cache_respostas.similaridade}')
+            try:
+                asyncio.run(self.rodadas())
+            finally:
+                Conversation.objects.filter(conversation_id__startswith='bench-cache-').delete()
+            self.stdout.write(f'chamadas ao LLM: {servidor.requisicoes}')
+        self.stdout.write(f'cache: {cache_respostas.estatisticas()}')
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from langchain_openai import OpenAI
+
+from users.bench import ServidorLLMFalso, apontar_para
+from users.clientes import RegistroClientes
+
+
+class Command(BaseCommand):
+    help = 'Mede o custo por chamada ao LLM com cliente novo a cada chamada e com o registro de clientes compartilhados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chamadas', type=int, default=50)
+        parser.add_argument('--simultaneas', type=int, default=100)
+
+    def medir(self, servidor, chamadas, obter):
+        antes = len(servidor.conexoes)
+        inicio = time.perf_counter()
+        for _ in range(chamadas):
+            obter().invoke('Qual foi meu lucro?')
+        por_chamada = (time.perf_counter() - inicio) * 1000 / chamadas
+        return por_chamada, len(servidor.conexoes) - antes
+
+    async def simultaneas(self, registro, quantidade):
+        llm = registro.llm('agente')
+        return await asyncio.gather(*(llm.ainvoke('Qual foi meu lucro?') for _ in range(quantidade)))
+
+    def handle(self, *args, **options):
+        chamadas = options['chamadas']
+        registro = RegistroClientes()
+        with ServidorLLMFalso(latencia=0) as servidor:
+            apontar_para(servidor)
+            # Como era antes: um OpenAI() novo (pool HTTP, contexto TLS) a cada chamada
+            tempo, conexoes = self.medir(servidor, chamadas, lambda: OpenAI(openai_api_key='sk-bench', temperature=0.2))
+            self.stdout.write(f'cliente novo por chamada: {tempo:.1f} ms/chamada, {conexoes} conexões TCP')
+            tempo, conexoes = self.medir(servidor, chamadas, lambda: registro.llm('agente'))
+            self.stdout.write(f'registro compartilhado: {tempo:.1f} ms/chamada, {conexoes} conexões TCP')
+            # Sob WSGI cada requisição assíncrona roda num event loop novo
+            antes = len(servidor.conexoes)
+            for _ in range(chamadas):
+                asyncio.run(registro.llm('agente').ainvoke('Qual foi meu lucro?'))
+            self.stdout.write(
+                f'{chamadas} chamadas assíncronas, um event loop por chamada: {len(servidor.conexoes) - antes} conexões TCP'
+            )
+
+        with ServidorLLMFalso(latencia=0.2) as servidor:
+            apontar_para(servidor)
+            asyncio.run(self.simultaneas(registro, options['simultaneas']))
+            self.stdout.write(
+                f"{options['simultaneas']} chamadas simultâneas: no máximo {servidor.max_em_andamento} em andamento "
+                f'(LLM_MAX_CONCURRENCY={settings.LLM_MAX_CONCURRENCY})'
+            )
+
+        with ServidorLLMFalso(latencia=0, falhas=2) as servidor:
+            apontar_para(servidor)
+            inicio = time.perf_counter()
+            registro.llm('agente').invoke('Qual foi meu lucro?')
+            self.stdout.write(
+                f'2 respostas 503 seguidas: sucesso na tentativa {servidor.requisicoes} '
+                f'após {(time.perf_counter() - inicio) * 1000:.0f} ms de backoff (LLM_MAX_RETRIES={settings.LLM_MAX_RETRIES})'
+            )
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from users import rollup
+from users.bench import cronometrar, popular
+from users.models import FinancialRecord
+from users.views import (
+    CashFlowView, DashboardView, ExpenseDistributionView, ExpenseTypePercentageView,
+    FinancialIndicatorsView, FinancialTrendsView,
+)
+
+ENDPOINTS = [
+    ('financial-indicators', FinancialIndicatorsView),
+    ('financial-trends', FinancialTrendsView),
+    ('expense-distribution', ExpenseDistributionView),
+    ('expense-type-percentage', ExpenseTypePercentageView),
+    ('cash-flow', CashFlowView),
+    ('dashboard', DashboardView),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a latência dos endpoints de dashboard para tabelas de tamanhos crescentes: sem cache, com a '
+        'resposta em cache e com If-None-Match (304). Os dados são descartados ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default='1000,10000,100000,1000000')
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def medir(self, view, nome, repeticoes):
+        # (ms sem cache, ms com cache, ms do 304, consultas ao banco no 304)
+        with override_settings(RESPOSTAS_HTTP_CACHE_TIMEOUT=0):
+            sem_cache = cronometrar(lambda: view(self.factory.get(f'/users/{nome}/')), repeticoes)
+        etag = view(self.factory.get(f'/users/{nome}/'))['ETag']
+        com_cache = cronometrar(lambda: view(self.factory.get(f'/users/{nome}/')), repeticoes)
+        condicional = self.factory.get(f'/users/{nome}/', HTTP_IF_NONE_MATCH=etag)
+        nao_modificado = cronometrar(lambda: view(condicional), repeticoes)
+        with CaptureQueriesContext(connection) as consultas:
+            assert view(condicional).status_code == 304
+        return sem_cache, com_cache, nao_modificado, len(consultas)
+
+    def handle(self, *args, **options):
+        tamanhos = [int(t) for t in options['tamanhos'].split(',')]
+        self.factory = APIRequestFactory()
+        views = [(nome, view.as_view()) for nome, view in ENDPOINTS]
+        self.stdout.write('registros\tendpoint\tsem cache\tcom cache\t304\t(ms, mediana)\tconsultas no 304')
+        # Tudo roda numa transação desfeita no fim: a base real não é alterada
+        with transaction.atomic():
+            total = FinancialRecord.objects.filter(owner=None).count()
+            for tamanho in sorted(tamanhos):
+                if tamanho > total:
+                    popular(tamanho - total, semente=total)
+                    rollup.reconstruir()
+                    total = tamanho
+                # A versão dos dados não muda dentro da transação: o cache é limpo a cada tamanho
+                cache.clear()
+                for nome, view in views:
+                    sem_cache, com_cache, nao_modificado, consultas = self.medir(view, nome, options['repeticoes'])
+                    self.stdout.write(
+                        f'{total}\t{nome}\t{sem_cache:.1f}\t{com_cache:.1f}\t{nao_modificado:.1f}\t\t{consultas}'
+                    )
+            transaction.set_rollback(True)
+        cache.clear()
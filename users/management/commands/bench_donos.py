@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users import rollup
+from users.bench import cronometrar, popular
+from users.models import FinancialRecord, User
+from users.saude import montar_prompt
+from users.views import DashboardView, FinancialRecordListView
+
+
+class Command(BaseCommand):
+    help = 'Mede as views de um usuário enquanto os dados dos outros usuários crescem (os dados são descartados ao final).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros-usuario', type=int, default=1000)
+        parser.add_argument('--tamanhos', default='0,100000,1000000', help='Registros dos outros usuários.')
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        dashboard, listagem = DashboardView.as_view(), FinancialRecordListView.as_view()
+
+        def requisicao(view, caminho, user):
+            request = factory.get(caminho)
+            force_authenticate(request, user=user)
+            return view(request)
+
+        self.stdout.write('outros usuários\tdashboard\tpágina (100)\tprompt de saúde\t(ms, mediana)')
+        # Tudo roda numa transação desfeita no fim: a base real não é alterada
+        with transaction.atomic():
+            usuario = User.objects.create(username='bench_donos')
+            outro = User.objects.create(username='bench_donos_outro')
+            popular(options['registros_usuario'], owner=usuario)
+            total = 0
+            for tamanho in sorted(int(t) for t in options['tamanhos'].split(',')):
+                if tamanho > total:
+                    popular(tamanho - total, semente=total + 1, owner=outro)
+                    total = tamanho
+                rollup.reconstruir()
+                tempos = [
+                    cronometrar(lambda: requisicao(dashboard, '/users/dashboard/', usuario), options['repeticoes']),
+                    cronometrar(lambda: requisicao(listagem, '/users/financial-records/?limite=100', usuario), options['repeticoes']),
+                    cronometrar(lambda: montar_prompt(usuario), options['repeticoes']),
+                ]
+                self.stdout.write(f"{FinancialRecord.objects.filter(owner=outro).count()}\t" + '\t'.join(f'{t:.1f}' for t in tempos))
+            transaction.set_rollback(True)
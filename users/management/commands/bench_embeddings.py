@@ -0,0 +1,50 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from users.bench import EmbeddingsFalsos, gerar_dataframe
+from users.embeddings import EmbeddingsEmCache, obter_embeddings
+from users.indexacao import IndexadorVectorstore
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão da indexação do upload com um modelo de embedding falso local (sem rede).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=20000)
+        parser.add_argument('--latencia-ms', type=float, default=50.0, help='Latência simulada por chamada de embedding.')
+        parser.add_argument('--lote', type=int, default=256)
+        parser.add_argument('--concorrencias', default='1,4,8')
+        parser.add_argument('--sem-cache', action='store_true', help='Desliga o cache de embeddings.')
+
+    def indexar(self, chave, df, embeddings):
+        inicio = time.perf_counter()
+        indexador = IndexadorVectorstore(chave, embeddings)
+        indexador.adicionar_linhas(df)
+        indexador.finalizar()
+        return len(df) / (time.perf_counter() - inicio)
+
+    def handle(self, *args, **options):
+        df = gerar_dataframe(options['linhas'])
+        max_itens = 0 if options['sem_cache'] else 10 * len(df)
+        self.stdout.write('concorrência\tchamadas\tdocs/s upload\tdocs/s reenvio (dedup)\tdocs/s outra conversa (cache)')
+        for concorrencia in [int(c) for c in options['concorrencias'].split(',')]:
+            # Diretório temporário e transação desfeita: nada fica no disco nem no banco
+            with tempfile.TemporaryDirectory() as diretorio, transaction.atomic(), override_settings(
+                VECTORSTORE_DIR=diretorio, EMBEDDING_BATCH_SIZE=options['lote'],
+                EMBEDDING_MAX_CONCURRENCY=concorrencia, EMBEDDING_CACHE_MAX_ITEMS=max_itens,
+            ):
+                falso = EmbeddingsFalsos(latencia=options['latencia_ms'] / 1000)
+                embeddings = obter_embeddings(falso, modelo=f'bench-{concorrencia}')
+                vazoes = [
+                    self.indexar('bench_a', df, embeddings),
+                    self.indexar('bench_a', df, embeddings),
+                    self.indexar('bench_b', df, embeddings),
+                ]
+                self.stdout.write(f'{concorrencia}\t{falso.chamadas}\t' + '\t'.join(f'{v:.0f}' for v in vazoes))
+                transaction.set_rollback(True)
+        if not options['sem_cache']:
+            self.stdout.write(f'cache: {EmbeddingsEmCache.estatisticas()}')
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from users.bench import ServidorLLMFalso, apontar_para
+from users.models import Conversation
+from users.resumo import estimar_tokens
+
+CONVERSA = 'bench-historico'
+
+
+class Command(BaseCommand):
+    help = 'Simula uma conversa longa com o agente (LLM falso local) e mostra o tamanho do prompt por turno.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turnos', type=int, default=100)
+        parser.add_argument('--tokens-resposta', type=int, default=60)
+
+    async def turno(self, cliente, pergunta):
+        resposta = await cliente.post(
+            '/users/financial-agent/', {'question': pergunta, 'conversation_id': CONVERSA}, content_type='application/json'
+        )
+        return resposta.json()['resposta']
+
+    async def conversar(self, servidor, turnos):
+        cliente = AsyncClient()
+        historico_completo = 0
+        self.stdout.write('turno\tprompt (tokens)\tcom o histórico completo (tokens)\tms')
+        for i in range(1, turnos + 1):
+            pergunta = f'Pergunta {i}: quanto gastei com fornecedores no mês {i % 12 + 1}?'
+            antes = len(servidor.prompts)
+            inicio = time.perf_counter()
+            resposta = await self.turno(cliente, pergunta)
+            tempo = (time.perf_counter() - inicio) * 1000
+            # O primeiro prompt do turno é o da pergunta; um segundo, se houver, é o do resumo
+            prompt = estimar_tokens(servidor.prompts[antes])
+            if i == 1 or i % 10 == 0:
+                self.stdout.write(f'{i}\t{prompt}\t{prompt + historico_completo}\t{tempo:.0f}')
+            # Sem janela, o prompt cresceria com todas as mensagens anteriores
+            historico_completo += estimar_tokens(f'Usuário: {pergunta}\nAssistente: {resposta}\n')
+
+    def handle(self, *args, **options):
+        turnos = options['turnos']
+        Conversation.objects.filter(conversation_id=CONVERSA).delete()
+        with ServidorLLMFalso(latencia=0, tokens=options['tokens_resposta']) as servidor:
+            apontar_para(servidor)
+            try:
+                asyncio.run(self.conversar(servidor, turnos))
+            finally:
+                Conversation.objects.filter(conversation_id=CONVERSA).delete()
+            self.stdout.write(f'chamadas ao LLM: {servidor.requisicoes} ({servidor.requisicoes - turnos} para resumir o histórico)')
@@ -0,0 +1,96 @@
+import asyncio
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from users import instrumentacao
+from users.bench import ServidorLLMFalso, apontar_para, gerar_dataframe
+from users.ingestion import CAMPOS_MODELO, ingerir_csv
+from users.models import Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo da instrumentação (desligada e ligada) e mostra o Server-Timing do agente, as etapas '
+        'de uma ingestão de CSV e as métricas no formato do Prometheus.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200)
+        parser.add_argument('--linhas', type=int, default=20000)
+
+    def custo_etapa(self, vezes=200_000):
+        inicio = time.perf_counter()
+        for _ in range(vezes):
+            with instrumentacao.etapa('bench'):
+                pass
+        return (time.perf_counter() - inicio) / vezes * 1e9
+
+    def requisicoes(self, quantidade):
+        # Cliente novo a cada medição: o handler recarrega os middlewares com a configuração atual
+        cliente = Client(HTTP_HOST='localhost')
+        cliente.get('/users/dashboard/')
+        tempos = []
+        for _ in range(quantidade):
+            inicio = time.perf_counter()
+            resposta = cliente.get('/users/dashboard/')
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        return tempos[len(tempos) // 2], resposta
+
+    async def perguntar(self):
+        resposta = await AsyncClient(HTTP_HOST='localhost').post(
+            '/users/financial-agent/', {'question': 'Quanto gastei com aluguel?'}, content_type='application/json'
+        )
+        return resposta
+
+    def handle(self, *args, **options):
+        with override_settings(RESPOSTAS_HTTP_CACHE_TIMEOUT=0):
+            with override_settings(INSTRUMENTACAO=False):
+                desligada = self.custo_etapa()
+                mediana_desligada, _ = self.requisicoes(options['requisicoes'])
+            with override_settings(INSTRUMENTACAO=True):
+                instrumentacao.instalar()
+                ligada = self.custo_etapa()
+                mediana_ligada, resposta = self.requisicoes(options['requisicoes'])
+        # Descarta as etapas da medição de custo
+        instrumentacao.metricas.limpar()
+        self.stdout.write(f'etapa(): {desligada:.0f} ns desligada, {ligada:.0f} ns ligada')
+        self.stdout.write(
+            f'GET dashboard/ (sem cache), mediana de {options["requisicoes"]}: '
+            f'{mediana_desligada:.2f} ms desligada, {mediana_ligada:.2f} ms ligada'
+        )
+        self.stdout.write(f'  Server-Timing: {resposta["Server-Timing"]}')
+
+        with override_settings(INSTRUMENTACAO=True), ServidorLLMFalso(latencia=0.2) as servidor:
+            apontar_para(servidor)
+            resposta = asyncio.run(self.perguntar())
+            Conversation.objects.filter(conversation_id=resposta.json()['conversation_id']).delete()
+            self.stdout.write(f'POST financial-agent/: HTTP {resposta.status_code}')
+            self.stdout.write(f'  Server-Timing: {resposta["Server-Timing"]}')
+
+            df = gerar_dataframe(options['linhas'])
+            df.columns = list(CAMPOS_MODELO)
+            conteudo = io.BytesIO(df.to_csv(index=False).encode('utf-8'))
+            # Registros gravados numa transação desfeita ao final
+            with transaction.atomic(), instrumentacao.medindo() as medicao:
+                ingerir_csv(conteudo)
+                transaction.set_rollback(True)
+            resumo = medicao.resumo()
+            self.stdout.write(
+                f"ingestão de {options['linhas']} linhas: {resumo['ms_total']:.0f} ms, "
+                f"{resumo['consultas_banco']} consultas ({resumo['ms_banco']:.0f} ms)"
+            )
+            for nome, dados in sorted(resumo['etapas'].items(), key=lambda item: -item[1]['ms']):
+                self.stdout.write(f"  {nome:<26}{dados['ms']:>9.1f} ms{dados['chamadas']:>6}x")
+
+            texto = Client(HTTP_HOST='localhost').get('/users/metricas/').content.decode()
+        linhas = [linha for linha in texto.splitlines() if not linha.startswith('#')]
+        self.stdout.write(f'users/metricas/: {len(linhas)} séries, por exemplo:')
+        for linha in linhas:
+            if '_count' in linha or '_total' in linha:
+                self.stdout.write(f'  {linha}')
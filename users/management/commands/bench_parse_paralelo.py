@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.bench import CATEGORIAS, FORMAS_PAGAMENTO
+from users.ingestion import detectar_formato, ler_padronizados
+from users.leitura_paralela import executor, normalizar_bloco
+
+
+def gerar_csv(caminho, quantidade, semente=0, lote=500_000):
+    # Extrato sintético no formato do upload (valores e datas no padrão brasileiro), gerado com numpy
+    rnd = np.random.default_rng(semente)
+    for inicio in range(0, quantidade, lote):
+        n = min(lote, quantidade - inicio)
+        centavos = pd.Series(rnd.integers(100, 5_000_000, n))
+        receita = rnd.random(n) < 0.35
+        datas = (
+            pd.Series(rnd.integers(1, 29, n)).astype(str).str.zfill(2) + '/'
+            + pd.Series(rnd.integers(1, 13, n)).astype(str).str.zfill(2) + '/'
+            + pd.Series(rnd.integers(2020, 2026, n)).astype(str)
+        )
+        df = pd.DataFrame({
+            'Data': datas,
+            'Cliente/Fornecedor': 'Cliente ' + pd.Series(rnd.integers(1, 501, n)).astype(str),
+            'Descrição': 'Lançamento ' + pd.Series(np.arange(inicio, inicio + n)).astype(str),
+            'Categoria': np.where(receita, 'Vendas', np.array(CATEGORIAS, dtype=object)[rnd.integers(0, len(CATEGORIAS), n)]),
+            'Valor (R$)': (centavos // 100).map('{:,}'.format).str.replace(',', '.') + ',' + (centavos % 100).astype(str).str.zfill(2),
+            'Tipo': np.where(receita, 'Receita', 'Despesa'),
+            'Forma de Pagamento': np.array(FORMAS_PAGAMENTO, dtype=object)[rnd.integers(0, len(FORMAS_PAGAMENTO), n)],
+            'Status': 'Pago',
+        })
+        df.to_csv(caminho, mode='a' if inicio else 'w', header=not inicio, index=False)
+
+
+class Command(BaseCommand):
+    help = 'Mede a leitura e normalização de um CSV grande com 1 e com vários processos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=2_000_000)
+        parser.add_argument(
+            '--processos', type=int, nargs='+',
+            help='Quantidades de processos a medir (padrão: 1, 2, 4, ... até o número de CPUs).'
+        )
+
+    def handle(self, *args, **options):
+        cpus = os.cpu_count() or 1
+        processos = options['processos'] or sorted({1, cpus} | {2 ** i for i in range(1, 8) if 2 ** i < cpus})
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'extrato.csv')
+            inicio = time.perf_counter()
+            gerar_csv(caminho, options['linhas'])
+            tamanho = os.path.getsize(caminho)
+            self.stdout.write(
+                f"{options['linhas']} linhas, {tamanho / 1024 ** 2:.0f} MB gerados em "
+                f"{time.perf_counter() - inicio:.1f} s; {cpus} CPU(s)"
+            )
+            base = None
+            for n in processos:
+                if n > 1:
+                    # Sobe os processos do pool antes de medir
+                    pool = executor(n)
+                    amostra = (b'Data,Valor (R$),Tipo\n', b'01/01/2024,"1,00",Receita\n', 'utf-8', ',', {'data': 'Data', 'valor': 'Valor (R$)', 'tipo': 'Tipo'})
+                    for futuro in [pool.submit(normalizar_bloco, *amostra) for _ in range(2 * n)]:
+                        futuro.result()
+                with open(caminho, 'rb') as arquivo:
+                    encoding, sep = detectar_formato(arquivo)
+                    inicio = time.perf_counter()
+                    linhas = sum(len(chunk) for chunk in ler_padronizados(arquivo, encoding, sep, settings.CSV_CHUNK_SIZE, n))
+                    tempo = time.perf_counter() - inicio
+                base = base or tempo
+                self.stdout.write(
+                    f'{n:>3} processo(s): {tempo:.2f} s, {linhas / tempo:,.0f} linhas/s, '
+                    f'{tamanho / 1024 ** 2 / tempo:.0f} MB/s, speedup {base / tempo:.2f}x'
+                )
@@ -0,0 +1,110 @@
+import random
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from users.bench import cronometrar, formatar_valor_br
+from users.parsing import converter_datas, converter_valores, parse_datas, parse_valores
+
+
+def valor_por_linha(valor):
+    # Conversão antiga, repetida nas views: uma linha por vez e 0.0 para o que não for número
+    try:
+        return float(str(valor).replace('.', '').replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+
+def data_por_linha(data):
+    # Divisão manual de dd/mm/yyyy ou yyyy-mm-dd feita antes em FinancialTrendsView/CashFlowView
+    data = str(data)
+    try:
+        if '/' in data:
+            dia, mes, ano = data.split('/')
+            ano = int(ano[:4])
+            return date(ano + 2000 if ano < 100 else ano, int(mes), int(dia))
+        if '-' in data:
+            ano, mes, dia = data[:10].split('-')
+            return date(int(ano), int(mes), int(dia))
+    except ValueError:
+        pass
+    return None
+
+
+def valores_pandas(serie):
+    # Versão anterior do parse_valores: pandas, sem 'R$', negativos entre parênteses nem '1234.56'
+    texto = serie.astype(str).str.strip().str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce').replace([np.inf, -np.inf], np.nan).round(2)
+
+
+def datas_pandas(serie):
+    # Versão anterior do parse_datas: duas expressões regulares e pd.to_datetime
+    texto = serie.astype(str).str.strip()
+    br = texto.str.extract(r'^(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})(?!\d)')
+    iso = texto.str.extract(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?!\d)')
+    partes = pd.DataFrame({
+        'year': pd.to_numeric(br[2].fillna(iso[0]), errors='coerce'),
+        'month': pd.to_numeric(br[1].fillna(iso[1]), errors='coerce'),
+        'day': pd.to_numeric(br[0].fillna(iso[2]), errors='coerce'),
+    })
+    partes['year'] = partes['year'].where(partes['year'] >= 100, partes['year'] + 2000)
+    return pd.to_datetime(partes, errors='coerce')
+
+
+def gerar_colunas(quantidade, semente=0):
+    # Mistura de formatos vista em extratos reais, com ~1% de valores inválidos
+    rnd = random.Random(semente)
+    valores, datas = [], []
+    for _ in range(quantidade):
+        centavos = rnd.randint(100, 5_000_000)
+        valor = formatar_valor_br(centavos)
+        sorteio = rnd.random()
+        if sorteio < 0.1:
+            valor = f'R$ {valor}'
+        elif sorteio < 0.2:
+            valor = f'-{valor}'
+        elif sorteio < 0.21:
+            valor = 'n/d'
+        valores.append(valor)
+        dia = date(rnd.randint(2020, 2025), rnd.randint(1, 12), rnd.randint(1, 28))
+        datas.append(dia.strftime('%d/%m/%Y') if rnd.random() < 0.8 else dia.isoformat())
+    return valores, datas
+
+
+class Command(BaseCommand):
+    help = 'Compara a conversão de valores e datas linha a linha com a do parsing.py.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=200_000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        valores, datas = gerar_colunas(options['linhas'])
+        serie_valores, serie_datas = pd.Series(valores), pd.Series(datas)
+        medicoes = [
+            ('valores', 'por linha', lambda: [valor_por_linha(v) for v in valores]),
+            ('valores', 'pandas (versão anterior)', lambda: valores_pandas(serie_valores)),
+            ('valores', 'parsing.py (float64)', lambda: converter_valores(serie_valores)),
+            ('valores', 'parsing.py (objetos do modelo)', lambda: parse_valores(serie_valores)),
+            ('datas', 'por linha', lambda: [data_por_linha(d) for d in datas]),
+            ('datas', 'pandas (versão anterior)', lambda: datas_pandas(serie_datas)),
+            ('datas', 'parsing.py (datetime64)', lambda: converter_datas(serie_datas)),
+            ('datas', 'parsing.py (objetos do modelo)', lambda: parse_datas(serie_datas)),
+        ]
+        self.stdout.write(f"{options['linhas']} linhas, mediana de {options['repeticoes']} execuções")
+        base = {}
+        for campo, nome, funcao in medicoes:
+            tempo = cronometrar(funcao, options['repeticoes'])
+            base.setdefault(campo, tempo)
+            self.stdout.write(
+                f"{campo:<8}{nome:<32}{tempo:>9.1f} ms{options['linhas'] / tempo * 1000:>14,.0f} linhas/s"
+                f'{base[campo] / tempo:>8.2f}x'
+            )
+        # O caminho antigo transforma valores inválidos em 0.0 sem avisar; o novo os deixa nulos
+        zerados = sum(1 for v in valores if valor_por_linha(v) == 0.0)
+        self.stdout.write(
+            f'valores inválidos: {zerados} viraram 0.0 linha a linha; '
+            f'{int(converter_valores(serie_valores).isna().sum())} rejeitados pelo parsing.py'
+        )
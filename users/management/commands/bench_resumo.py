@@ -0,0 +1,40 @@
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users import rollup
+from users.bench import cronometrar, popular
+from users.indexacao import textos_linhas
+from users.ingestion import CAMPOS_MODELO
+from users.models import FinancialRecord, FinancialRollup
+from users.resumo import estimar_tokens, resumo_financeiro
+from users.saude import montar_prompt
+
+
+class Command(BaseCommand):
+    help = 'Mostra o tamanho do prompt de análise de saúde para tabelas crescentes (os dados são descartados ao final).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default='1000,10000,100000')
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        tamanhos = [int(t) for t in options['tamanhos'].split(',')]
+        self.stdout.write('registros\tprompt (tokens)\tresumo (ms)\tregistros brutos no prompt (tokens estimados)')
+        # Tudo roda numa transação desfeita no fim: a base real não é alterada
+        with transaction.atomic():
+            total = FinancialRecord.objects.filter(owner=None).count()
+            for tamanho in sorted(tamanhos):
+                if tamanho > total:
+                    popular(tamanho - total, semente=total)
+                    rollup.reconstruir()
+                    total = tamanho
+                tempo = cronometrar(lambda: resumo_financeiro(FinancialRollup.objects.filter(owner=None)), options['repeticoes'])
+                prompt = montar_prompt(None)
+                # Alternativa ingênua: uma linha de texto por registro (estimada por amostra)
+                amostra = pd.DataFrame(FinancialRecord.objects.values(*CAMPOS_MODELO.values())[:1000])
+                caracteres_por_registro = textos_linhas(amostra).str.len().mean() + 1
+                self.stdout.write(
+                    f'{total}\t{estimar_tokens(prompt)}\t{tempo:.1f}\t{int(caracteres_por_registro * total / 4)}'
+                )
+            transaction.set_rollback(True)
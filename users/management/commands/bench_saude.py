@@ -0,0 +1,57 @@
+import asyncio
+import json
+import time
+
+import httpx
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from users.bench import ServidorASGI, ServidorLLMFalso, apontar_para
+from users.versoes import escopo_usuario, incrementar_versao
+
+ENDPOINTS = ['indice-saude', 'analise-saude', 'pontos-fortes', 'pontos-fracos', 'nota-saude']
+
+RESPOSTA_FALSA = json.dumps({
+    'indice': 72, 'label': 'Bom', 'analise': 'A empresa tem lucro, mas as despesas cresceram.',
+    'pontos_fortes': ['Receita estável.', 'Margem positiva.'],
+    'melhorias': ['Reduzir despesas fixas.', 'Criar reserva de caixa.'], 'nota': 72,
+}, ensure_ascii=False)
+
+
+class Command(BaseCommand):
+    help = 'Mede quantas chamadas ao LLM os cinco endpoints de saúde financeira fazem por carregamento de página.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=10, help='Carregamentos de página simultâneos (5 requisições cada).')
+        parser.add_argument('--latencia-ms', type=float, default=1000.0)
+
+    async def carregar_paginas(self, url, paginas):
+        async with httpx.AsyncClient(base_url=url, timeout=120, headers={'Host': 'localhost'}) as cliente:
+            respostas = await asyncio.gather(*(
+                cliente.get(f'/users/{endpoint}/') for _ in range(paginas) for endpoint in ENDPOINTS
+            ))
+        return [r.status_code for r in respostas]
+
+    def rodada(self, titulo, servidor, app, paginas):
+        antes = servidor.requisicoes
+        inicio = time.perf_counter()
+        status = asyncio.run(self.carregar_paginas(app.url, paginas))
+        tempo = time.perf_counter() - inicio
+        ok = sum(1 for s in status if s == 200)
+        self.stdout.write(
+            f'{titulo}: {ok}/{len(status)} respostas 200 em {tempo * 1000:.0f} ms, '
+            f'{servidor.requisicoes - antes} chamada(s) ao LLM'
+        )
+
+    def handle(self, *args, **options):
+        paginas = options['paginas']
+        with ServidorLLMFalso(latencia=options['latencia_ms'] / 1000, resposta=RESPOSTA_FALSA) as servidor:
+            apontar_para(servidor)
+            cache.clear()
+            incrementar_versao(escopo_usuario(None))
+            self.stdout.write(f'{paginas} carregamentos simultâneos x {len(ENDPOINTS)} endpoints (antes: uma chamada por requisição)')
+            with ServidorASGI() as app:
+                self.rodada('cache vazio', servidor, app, paginas)
+                self.rodada('cache cheio', servidor, app, paginas)
+                incrementar_versao(escopo_usuario(None))
+                self.rodada('após novo upload', servidor, app, paginas)
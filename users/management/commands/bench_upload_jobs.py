@@ -0,0 +1,67 @@
+import asyncio
+import shutil
+import time
+import uuid
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import exclusao
+from users.bench import ServidorASGI, gerar_dataframe
+from users.embeddings import embeddings_compartilhados
+from users.ingestion import CAMPOS_MODELO
+from users.models import Conversation, UploadBatch, UploadJob
+from users.vectorstores import caminho_vectorstore, chave_conversa
+
+
+class Command(BaseCommand):
+    help = 'Mede a resposta do upload de CSV em segundo plano e a latência de outras requisições durante a ingestão.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=50000)
+
+    async def medir(self, url, conteudo, conversation_id):
+        async with httpx.AsyncClient(base_url=url, timeout=600, headers={'Host': 'localhost'}) as cliente:
+            inicio = time.perf_counter()
+            resposta = await cliente.post(
+                '/users/upload-csv-vectorstore/',
+                files={'file': ('bench.csv', conteudo, 'text/csv')}, data={'conversation_id': conversation_id}
+            )
+            self.stdout.write(f'upload: HTTP {resposta.status_code} em {(time.perf_counter() - inicio) * 1000:.0f} ms')
+            job_id = resposta.json()['job_id']
+            latencias, situacao = [], {}
+            while situacao.get('status') not in (UploadJob.CONCLUIDO, UploadJob.ERRO):
+                inicio = time.perf_counter()
+                await cliente.get('/users/dashboard/?secoes=indicadores')
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                situacao = (await cliente.get(f'/users/upload-jobs/{job_id}/')).json()
+                self.stdout.write(
+                    f"  {situacao['status']}: {situacao['linhas_processadas']} linhas, "
+                    f"{situacao['linhas_por_segundo']} linhas/s"
+                )
+                await asyncio.sleep(0.5)
+            latencias.sort()
+            self.stdout.write(
+                f"job {situacao['status']} em {situacao['tempo_segundos']} s; dashboard durante a ingestão: "
+                f"mediana {latencias[len(latencias) // 2]:.0f} ms, máx {latencias[-1]:.0f} ms ({len(latencias)} requisições)"
+            )
+            return situacao
+
+    def handle(self, *args, **options):
+        settings.EMBEDDING_BACKEND = 'fake'
+        embeddings_compartilhados.cache_clear()
+        df = gerar_dataframe(options['linhas'], semente=int(time.time()))
+        df.columns = list(CAMPOS_MODELO)
+        conteudo = df.to_csv(index=False).encode('utf-8')
+        conversation_id = f'bench_{uuid.uuid4().hex}'
+        with ServidorASGI() as app:
+            situacao = asyncio.run(self.medir(app.url, conteudo, conversation_id))
+        # Descarta os registros, o upload e o vectorstore criados pelo benchmark
+        lote = (situacao.get('resultado') or {}).get('lote_upload')
+        if lote:
+            exclusao.excluir_em_lotes(exclusao.registros_do_escopo(None, lote=lote), None)
+            UploadBatch.objects.filter(pk=lote).delete()
+        UploadJob.objects.filter(pk=situacao['job_id']).delete()
+        Conversation.objects.filter(conversation_id=conversation_id).delete()
+        shutil.rmtree(caminho_vectorstore(chave_conversa(None, conversation_id)), ignore_errors=True)
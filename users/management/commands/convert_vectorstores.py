@@ -0,0 +1,39 @@
+import glob
+import os
+import pickle
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import vectorstores
+
+
+class Command(BaseCommand):
+    help = 'Converte os vectorstores em pickle (vectorstore_<id>.pkl) para índice FAISS nativo + docstore JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--remover-pickles', action='store_true', help='Apaga cada .pkl depois de convertido.')
+
+    def handle(self, *args, **options):
+        padrao = os.path.join(settings.VECTORSTORE_DIR, 'vectorstore_*.pkl')
+        convertidos = falhas = 0
+        for arquivo in sorted(glob.glob(padrao)):
+            chave = os.path.basename(arquivo)[len('vectorstore_'):-len('.pkl')]
+            caminho = vectorstores.caminho_vectorstore(chave)
+            if caminho is None:
+                self.stderr.write(f'{arquivo}: id inválido, ignorado.')
+                falhas += 1
+                continue
+            try:
+                with open(arquivo, 'rb') as f:
+                    vectorstore = pickle.load(f)
+                vectorstores.salvar(caminho, vectorstore)
+            except Exception as e:
+                self.stderr.write(f'{arquivo}: não foi possível converter ({e!r}).')
+                falhas += 1
+                continue
+            convertidos += 1
+            self.stdout.write(f'{arquivo} -> {caminho} ({vectorstore.index.ntotal} vetores)')
+            if options['remover_pickles']:
+                os.remove(arquivo)
+        self.stdout.write(self.style.SUCCESS(f'{convertidos} vectorstores convertidos, {falhas} falhas.'))
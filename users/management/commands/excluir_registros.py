@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import exclusao
+from users.listagem import ParametroInvalido
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Exclui registros financeiros de um dono por upload e/ou período (ou todos), em lotes, mostrando o progresso.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='username do dono dos registros (sem ele: registros sem dono)')
+        parser.add_argument('--lote', help='lote_upload devolvido pelo upload do CSV')
+        parser.add_argument('--de', help='Data inicial do lançamento (AAAA-MM-DD)')
+        parser.add_argument('--ate', help='Data final do lançamento (AAAA-MM-DD)')
+        parser.add_argument('--tamanho-lote', type=int, default=None)
+        parser.add_argument('--tudo', action='store_true', help='Exclui todos os registros do dono')
+        parser.add_argument('--instalacao', action='store_true', help='Exclui os registros de todos os donos')
+
+    def handle(self, *args, **options):
+        if options['instalacao']:
+            removidos = exclusao.esvaziar_instalacao()
+            self.stdout.write(self.style.SUCCESS(f'{removidos} registros excluídos.'))
+            return
+        owner = None
+        if options['usuario']:
+            owner = User.objects.filter(username=options['usuario']).first()
+            if owner is None:
+                raise CommandError(f"Usuário {options['usuario']} não encontrado.")
+        try:
+            lote, de, ate = exclusao.ler_escopo(options)
+        except ParametroInvalido as e:
+            raise CommandError(str(e))
+        if not (lote or de or ate):
+            if not options['tudo']:
+                raise CommandError('Informe --lote, --de/--ate, --tudo ou --instalacao.')
+            removidos = exclusao.excluir_tudo(owner)
+            self.stdout.write(self.style.SUCCESS(f'{removidos} registros excluídos.'))
+            return
+        resultado = exclusao.excluir_em_lotes(
+            exclusao.registros_do_escopo(owner, lote, de, ate), owner,
+            tamanho_lote=options['tamanho_lote'],
+            progresso=lambda removidos, lotes: self.stdout.write(f'lote {lotes}: {removidos} registros excluídos'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['removidos']} registros excluídos em {resultado['lotes']} lotes ({resultado['tempo_segundos']}s)."
+        ))
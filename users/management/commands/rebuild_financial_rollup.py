@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users import rollup
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a tabela FinancialRollup do zero a partir de FinancialRecord.'
+
+    def handle(self, *args, **options):
+        grupos = rollup.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Rollup reconstruído: {grupos} grupos.'))
@@ -0,0 +1,39 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from users import tarefas
+
+
+class Command(BaseCommand):
+    help = 'Executa os jobs de ingestão de CSV pendentes (fila no banco, sem broker externo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.INGESTAO_WORKERS)
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre consultas à fila vazia.')
+        parser.add_argument('--uma-vez', action='store_true', help='Sai quando não houver mais jobs pendentes.')
+
+    def handle(self, *args, **options):
+        # Os workers devolvem à fila os jobs expirados (ao começar e periodicamente)
+        parar = threading.Event()
+        threads = [
+            threading.Thread(
+                target=tarefas.rodar_worker, args=(options['intervalo'], parar, options['uma_vez']),
+                name=f'run_jobs-{i}', daemon=True
+            )
+            for i in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"{options['workers']} worker(s) aguardando jobs.")
+        try:
+            for thread in threads:
+                # join com timeout para o Ctrl+C ser atendido
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Encerrando após os jobs em andamento...')
+            parar.set()
+            for thread in threads:
+                thread.join()
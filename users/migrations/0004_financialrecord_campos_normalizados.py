@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_financialrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialrecord',
+            name='data_normalizada',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='financialrecord',
+            name='tipo_normalizado',
+            field=models.CharField(choices=[('receita', 'Receita'), ('despesa', 'Despesa')], default='despesa', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='financialrecord',
+            name='valor_normalizado',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+    ]
@@ -0,0 +1,85 @@
+from django.db import migrations
+import numpy as np
+import pandas as pd
+
+TAMANHO_LOTE = 2000
+
+# Conversão copiada de users/parsing.py na época desta migração: a migração não depende do
+# código atual do app, que pode mudar depois.
+TIPO_RECEITA = 'receita'
+TIPO_DESPESA = 'despesa'
+PADRAO_DATA_BR = r'^(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})(?!\d)'
+PADRAO_DATA_ISO = r'^(\d{4})-(\d{1,2})-(\d{1,2})(?!\d)'
+
+
+def parse_valores(serie):
+    # Formato brasileiro: '1.234,56' -> 1234.56. Valores inválidos viram None.
+    texto = serie.astype(str).str.strip()
+    texto = texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    numeros = pd.to_numeric(texto, errors='coerce').replace([np.inf, -np.inf], np.nan).round(2)
+    return numeros.astype(object).where(numeros.notna(), None)
+
+
+def parse_datas(serie):
+    texto = serie.astype(str).str.strip()
+    br = texto.str.extract(PADRAO_DATA_BR)
+    iso = texto.str.extract(PADRAO_DATA_ISO)
+    partes = pd.DataFrame({
+        'year': pd.to_numeric(br[2].fillna(iso[0]), errors='coerce'),
+        'month': pd.to_numeric(br[1].fillna(iso[1]), errors='coerce'),
+        'day': pd.to_numeric(br[0].fillna(iso[2]), errors='coerce'),
+    })
+    partes['year'] = partes['year'].where(partes['year'] >= 100, partes['year'] + 2000)
+    datas = pd.to_datetime(partes, errors='coerce')
+    return datas.dt.date.astype(object).where(datas.notna(), None)
+
+
+def normalizar_tipos(serie):
+    receita = serie.astype(str).str.strip().str.lower() == TIPO_RECEITA
+    return pd.Series(np.where(receita, TIPO_RECEITA, TIPO_DESPESA), index=serie.index)
+
+
+def adicionar_campos_normalizados(df):
+    df['valor_normalizado'] = parse_valores(df['valor'])
+    df['data_normalizada'] = parse_datas(df['data'])
+    df['tipo_normalizado'] = normalizar_tipos(df['tipo'])
+    return df
+
+
+def preencher_campos_normalizados(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    ultimo_id = 0
+    # Percorre a tabela em lotes ordenados por id, sem carregar tudo em memória
+    while True:
+        linhas = list(
+            FinancialRecord.objects.filter(id__gt=ultimo_id)
+            .order_by('id')
+            .values('id', 'valor', 'data', 'tipo')[:TAMANHO_LOTE]
+        )
+        if not linhas:
+            break
+        df = adicionar_campos_normalizados(pd.DataFrame(linhas))
+        objs = [
+            FinancialRecord(
+                id=linha['id'],
+                valor_normalizado=linha['valor_normalizado'],
+                data_normalizada=linha['data_normalizada'],
+                tipo_normalizado=linha['tipo_normalizado'],
+            )
+            for linha in df.to_dict('records')
+        ]
+        FinancialRecord.objects.bulk_update(objs, ['valor_normalizado', 'data_normalizada', 'tipo_normalizado'])
+        ultimo_id = linhas[-1]['id']
+
+
+class Migration(migrations.Migration):
+    # Cada lote é gravado na sua própria transação
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_financialrecord_campos_normalizados'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_campos_normalizados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_backfill_campos_normalizados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinancialRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(blank=True, null=True)),
+                ('tipo_normalizado', models.CharField(choices=[('receita', 'Receita'), ('despesa', 'Despesa')], max_length=10)),
+                ('categoria', models.CharField(blank=True, max_length=100)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('primeiro', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes', 'tipo_normalizado', 'categoria'], name='users_finan_mes_68bee6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncMonth
+
+
+def preencher_rollup(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    FinancialRollup = apps.get_model('users', 'FinancialRollup')
+    # Mesma agregação de users.analytics.agrupar, copiada para não depender do código atual do app
+    grupos = (
+        FinancialRecord.objects.annotate(mes=TruncMonth('data_normalizada'))
+        .values('mes', 'tipo_normalizado', 'categoria')
+        .annotate(total=Sum('valor_normalizado'), quantidade=Count('id'), primeiro=Min('id'))
+        .order_by()
+    )
+    FinancialRollup.objects.bulk_create(
+        (FinancialRollup(**{**grupo, 'total': grupo['total'] or 0}) for grupo in grupos),
+        batch_size=1000
+    )
+
+
+def limpar_rollup(apps, schema_editor):
+    apps.get_model('users', 'FinancialRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_financialrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_rollup, limpar_rollup),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_preencher_financialrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64, unique=True)),
+                ('modelo', models.CharField(max_length=100)),
+                ('vetor', models.BinaryField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('usado_em', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
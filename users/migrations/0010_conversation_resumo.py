@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='resumo',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='resumo_ate',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='users_messa_convers_26d3a2_idx'),
+        ),
+    ]
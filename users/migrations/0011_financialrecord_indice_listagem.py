@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_conversation_resumo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['uploaded_at', 'id'], name='users_finan_uploade_62e985_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_financialrecord_indice_listagem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialrecord',
+            name='lote_upload',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['lote_upload', 'id'], name='users_finan_lote_up_fb1753_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['data_normalizada'], name='users_finan_data_no_c50936_idx'),
+        ),
+    ]
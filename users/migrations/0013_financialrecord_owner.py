@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_financialrecord_lote_upload'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='financialrecord',
+            name='users_finan_uploade_62e985_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='financialrecord',
+            name='users_finan_data_no_c50936_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='financialrollup',
+            name='users_finan_mes_68bee6_idx',
+        ),
+        migrations.AddField(
+            model_name='financialrecord',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='registros_financeiros', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='financialrollup',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['owner', 'uploaded_at', 'id'], name='users_finan_owner_i_302791_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['owner', 'data_normalizada'], name='users_finan_owner_i_e4f2b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialrecord',
+            index=models.Index(fields=['owner', 'tipo_normalizado', 'categoria'], name='users_finan_owner_i_182e4f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialrollup',
+            index=models.Index(fields=['owner', 'mes', 'tipo_normalizado', 'categoria'], name='users_finan_owner_i_fc4478_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:18
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_financialrecord_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialrecord',
+            name='impressao',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='UploadBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome_arquivo', models.CharField(blank=True, max_length=255)),
+                ('hash_arquivo', models.CharField(max_length=64)),
+                ('tamanho_bytes', models.PositiveBigIntegerField(default=0)),
+                ('linhas', models.PositiveIntegerField(default=0)),
+                ('inseridos', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('ignorados', models.PositiveIntegerField(default=0)),
+                ('tempo_segundos', models.FloatField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'hash_arquivo'], name='users_uploa_owner_i_e53d6e_idx')],
+            },
+        ),
+    ]
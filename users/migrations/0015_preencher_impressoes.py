@@ -0,0 +1,94 @@
+import hashlib
+
+from django.db import migrations, transaction
+import pandas as pd
+
+TAMANHO_LOTE = 2000
+CAMPOS = [
+    'id', 'data', 'valor', 'cliente_fornecedor', 'descricao',
+    'data_normalizada', 'valor_normalizado', 'tipo_normalizado',
+]
+
+# Cálculo copiado de users/impressoes.py na época desta migração, para não depender do código
+# atual do app. Se a impressão mudar lá, os registros existentes precisam de uma nova migração.
+SEPARADOR = '\x1f'
+
+
+def _texto(serie):
+    return serie.astype(str).str.strip()
+
+
+def identidades(df):
+    datas = df['data_normalizada']
+    valores = pd.to_numeric(df['valor_normalizado'])
+    partes = [
+        datas.astype(str).where(datas.notna(), _texto(df['data'])),
+        valores.map('{:.2f}'.format).where(valores.notna(), _texto(df['valor'])),
+        df['tipo_normalizado'].astype(str),
+        _texto(df['cliente_fornecedor']),
+        _texto(df['descricao']),
+    ]
+    identidade = partes[0]
+    for parte in partes[1:]:
+        identidade = identidade + SEPARADOR + parte
+    return identidade
+
+
+class ImpressoesLinhas:
+
+    def __init__(self, owner_id):
+        self.prefixo = str(owner_id) if owner_id is not None else 'anon'
+        self.ocorrencias = {}
+
+    def calcular(self, df):
+        resumos = pd.Series(
+            [hashlib.blake2b(texto.encode('utf-8'), digest_size=16).digest() for texto in identidades(df)],
+            index=df.index,
+        )
+        ocorrencias = resumos.groupby(resumos, sort=False).cumcount() + resumos.map(self.ocorrencias).fillna(0).astype('int64')
+        for resumo, quantidade in resumos.value_counts(sort=False).items():
+            self.ocorrencias[resumo] = self.ocorrencias.get(resumo, 0) + quantidade
+        return [
+            hashlib.sha256(f'{self.prefixo}{SEPARADOR}{resumo.hex()}{SEPARADOR}{ocorrencia}'.encode()).hexdigest()
+            for resumo, ocorrencia in zip(resumos, ocorrencias)
+        ]
+
+
+def preencher_impressoes(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    # UPDATE por id com executemany: o bulk_update (CASE WHEN) é dezenas de vezes mais lento aqui
+    sql = 'UPDATE {} SET impressao = %s WHERE id = %s'.format(schema_editor.quote_name(FinancialRecord._meta.db_table))
+    donos = FinancialRecord.objects.order_by().values_list('owner_id', flat=True).distinct()
+    for owner_id in list(donos):
+        # Registros já duplicados recebem ocorrências diferentes, como linhas repetidas de um CSV
+        impressoes = ImpressoesLinhas(owner_id)
+        ultimo_id = 0
+        while True:
+            linhas = list(
+                FinancialRecord.objects.filter(owner_id=owner_id, id__gt=ultimo_id)
+                .order_by('id')
+                .values(*CAMPOS)[:TAMANHO_LOTE]
+            )
+            if not linhas:
+                break
+            df = pd.DataFrame(linhas)
+            with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+                cursor.executemany(sql, list(zip(impressoes.calcular(df), df['id'].tolist())))
+            ultimo_id = linhas[-1]['id']
+
+
+def limpar_impressoes(apps, schema_editor):
+    apps.get_model('users', 'FinancialRecord').objects.update(impressao=None)
+
+
+class Migration(migrations.Migration):
+    # Cada lote é gravado na sua própria transação
+    atomic = False
+
+    dependencies = [
+        ('users', '0014_uploadbatch_impressao'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_impressoes, limpar_impressoes),
+    ]
@@ -0,0 +1,226 @@
+import hashlib
+import re
+
+from django.core.cache import cache
+from django.db import migrations, transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncMonth
+import numpy as np
+import pandas as pd
+
+TAMANHO_LOTE = 2000
+CAMPOS = ['id', 'data', 'valor', 'tipo', 'cliente_fornecedor', 'descricao']
+
+# O parsing.py passou a aceitar 'R$', negativos entre parênteses, '1234.56', datas com '-', '.'
+# e mês por extenso, e a rejeitar valores com mais de 2 casas. Os registros gravados antes ficam
+# com a conversão antiga: esta migração converte de novo valor, data e tipo, recalcula as
+# impressões (senão reenviar o mesmo CSV duplica as linhas) e reconstrói o rollup.
+#
+# Conversão e impressão copiadas de users/parsing.py e users/impressoes.py na época desta
+# migração, para não depender do código atual do app.
+TIPO_RECEITA = 'receita'
+TIPO_DESPESA = 'despesa'
+NUMERO = r'\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:,\d{1,2})?|\d+\.\d{1,2}'
+PADRAO_VALOR = re.compile(rf'(?:R\$)?(?:\((?:R\$)?(?:{NUMERO})\)|[-+]?(?:R\$)?(?:{NUMERO})|(?:{NUMERO})-)')
+PADRAO_VALOR_SIMPLES = re.compile(r'-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d{1,2})?')
+SINAL_NEGATIVO = re.compile(r'[-(]')
+SIMBOLOS = re.compile(r'[^\d.,]|\.(?=\d{3})')
+ESPACOS = re.compile(r'\s')
+VALOR_MAXIMO = 10 ** 12
+PADRAO_DATA_BR = re.compile(r'(\d{1,2})([/.-])(\d{1,2})\2(\d{4}|\d{2})(?!\d)')
+PADRAO_DATA_ISO = re.compile(r'(\d{4})([/.-])(\d{1,2})\2(\d{1,2})(?!\d)')
+PADRAO_DATA_MES = re.compile(
+    r'(\d{1,2})(?:\s+de\s+|[/ .-])([a-zç]{3})[a-zç]*\.?(?:\s+de\s+|[/ .-])(\d{4}|\d{2})(?!\d)', re.IGNORECASE
+)
+MESES = {
+    'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
+}
+PIVO_ANO = 69
+DATA_INVALIDA = (np.nan, np.nan, np.nan)
+SEPARADOR = '\x1f'
+
+
+def _valores_gerais(texto):
+    texto = texto.str.replace(ESPACOS, '', regex=True)
+    valido = texto.str.fullmatch(PADRAO_VALOR)
+    negativo = texto.str.contains(SINAL_NEGATIVO, regex=True)
+    numero = texto.str.replace(SIMBOLOS, '', regex=True).str.replace(',', '.', regex=False)
+    valores = pd.to_numeric(numero.where(valido), errors='coerce')
+    return valores.where(~negativo, -valores).to_numpy(dtype='float64')
+
+
+def converter_valores(serie):
+    texto = serie.astype(str)
+    simples = texto.str.fullmatch(PADRAO_VALOR_SIMPLES).to_numpy(dtype=bool)
+    valores = np.full(len(texto), np.nan)
+    valores[simples] = (
+        texto[simples].str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype('float64')
+    )
+    if not simples.all():
+        valores[~simples] = _valores_gerais(texto[~simples])
+    return pd.Series(np.where(np.abs(valores) < VALOR_MAXIMO, valores, np.nan), index=serie.index)
+
+
+def _data(texto):
+    texto = texto.strip()
+    if encontrado := PADRAO_DATA_BR.match(texto):
+        dia, _, mes, ano = encontrado.groups()
+    elif encontrado := PADRAO_DATA_ISO.match(texto):
+        ano, _, mes, dia = encontrado.groups()
+    elif encontrado := PADRAO_DATA_MES.match(texto):
+        dia, mes, ano = encontrado.groups()
+        mes = MESES.get(mes.lower())
+        if mes is None:
+            return DATA_INVALIDA
+    else:
+        return DATA_INVALIDA
+    ano = int(ano)
+    if ano < 100:
+        ano += 2000 if ano < PIVO_ANO else 1900
+    return ano, int(mes), int(dia)
+
+
+def converter_datas(serie):
+    codigos, textos = pd.factorize(serie.astype(str))
+    partes = pd.DataFrame([_data(texto) for texto in textos], columns=['year', 'month', 'day'], dtype='float64')
+    datas = pd.to_datetime(partes, errors='coerce').to_numpy()
+    return pd.Series(datas[codigos], index=serie.index, dtype='datetime64[ns]')
+
+
+def adicionar_campos_normalizados(df):
+    numeros = converter_valores(df['valor'])
+    df['valor_normalizado'] = numeros.astype(object).where(numeros.notna(), None)
+    datas = converter_datas(df['data'])
+    df['data_normalizada'] = datas.dt.date.astype(object).where(datas.notna(), None)
+    receita = df['tipo'].astype(str).str.strip().str.lower() == TIPO_RECEITA
+    df['tipo_normalizado'] = np.where(receita, TIPO_RECEITA, TIPO_DESPESA)
+    return df
+
+
+def _texto(serie):
+    return serie.astype(str).str.strip()
+
+
+def identidades(df):
+    datas = df['data_normalizada']
+    valores = pd.to_numeric(df['valor_normalizado'])
+    partes = [
+        datas.astype(str).where(datas.notna(), _texto(df['data'])),
+        valores.map('{:.2f}'.format).where(valores.notna(), _texto(df['valor'])),
+        df['tipo_normalizado'].astype(str),
+        _texto(df['cliente_fornecedor']),
+        _texto(df['descricao']),
+    ]
+    identidade = partes[0]
+    for parte in partes[1:]:
+        identidade = identidade + SEPARADOR + parte
+    return identidade
+
+
+class ImpressoesLinhas:
+
+    def __init__(self, owner_id):
+        self.prefixo = str(owner_id) if owner_id is not None else 'anon'
+        self.ocorrencias = {}
+
+    def calcular(self, df):
+        resumos = pd.Series(
+            [hashlib.blake2b(texto.encode('utf-8'), digest_size=16).digest() for texto in identidades(df)],
+            index=df.index,
+        )
+        ocorrencias = resumos.groupby(resumos, sort=False).cumcount() + resumos.map(self.ocorrencias).fillna(0).astype('int64')
+        for resumo, quantidade in resumos.value_counts(sort=False).items():
+            self.ocorrencias[resumo] = self.ocorrencias.get(resumo, 0) + quantidade
+        return [
+            hashlib.sha256(f'{self.prefixo}{SEPARADOR}{resumo.hex()}{SEPARADOR}{ocorrencia}'.encode()).hexdigest()
+            for resumo, ocorrencia in zip(resumos, ocorrencias)
+        ]
+
+
+def renormalizar(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    conexao = schema_editor.connection
+    campo_valor = FinancialRecord._meta.get_field('valor_normalizado')
+    campo_data = FinancialRecord._meta.get_field('data_normalizada')
+    sql = (
+        'UPDATE {} SET valor_normalizado = %s, data_normalizada = %s, tipo_normalizado = %s, impressao = %s '
+        'WHERE id = %s'
+    ).format(schema_editor.quote_name(FinancialRecord._meta.db_table))
+    # As impressões novas podem coincidir com as antigas de outros registros ainda não atualizados
+    # (impressao é única): todas são apagadas antes. As novas não colidem entre si, porque
+    # registros com a mesma identidade recebem ocorrências diferentes, como linhas repetidas de
+    # um CSV.
+    FinancialRecord.objects.update(impressao=None)
+    donos = FinancialRecord.objects.order_by().values_list('owner_id', flat=True).distinct()
+    for owner_id in list(donos):
+        impressoes = ImpressoesLinhas(owner_id)
+        ultimo_id = 0
+        while True:
+            linhas = list(
+                FinancialRecord.objects.filter(owner_id=owner_id, id__gt=ultimo_id)
+                .order_by('id')
+                .values(*CAMPOS)[:TAMANHO_LOTE]
+            )
+            if not linhas:
+                break
+            df = adicionar_campos_normalizados(pd.DataFrame(linhas))
+            parametros = [
+                (
+                    campo_valor.get_db_prep_save(valor, conexao),
+                    campo_data.get_db_prep_save(data, conexao),
+                    tipo, impressao, id_,
+                )
+                for valor, data, tipo, impressao, id_ in zip(
+                    df['valor_normalizado'], df['data_normalizada'], df['tipo_normalizado'],
+                    impressoes.calcular(df), df['id'].tolist(),
+                )
+            ]
+            with transaction.atomic(), conexao.cursor() as cursor:
+                cursor.executemany(sql, parametros)
+            ultimo_id = linhas[-1]['id']
+
+
+def linhas(grupos):
+    for grupo in grupos:
+        yield grupo.pop('owner'), grupo.pop('total'), grupo
+
+
+def reconstruir_rollup(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    FinancialRollup = apps.get_model('users', 'FinancialRollup')
+    # Mesma agregação de users.rollup.reconstruir
+    grupos = (
+        FinancialRecord.objects.annotate(mes=TruncMonth('data_normalizada'))
+        .values('owner', 'mes', 'tipo_normalizado', 'categoria')
+        .annotate(total=Sum('valor_normalizado'), quantidade=Count('id'), primeiro=Min('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        FinancialRollup.objects.all().delete()
+        FinancialRollup.objects.bulk_create(
+            (FinancialRollup(owner_id=owner, total=total or 0, **campos) for owner, total, campos in linhas(grupos)),
+            batch_size=1000
+        )
+
+
+def invalidar_caches(apps, schema_editor):
+    # Análises e respostas em cache foram calculadas com a conversão antiga
+    DataVersion = apps.get_model('users', 'DataVersion')
+    DataVersion.objects.update(versao=F('versao') + 1)
+    cache.delete_many([f'versao:{escopo}' for escopo in DataVersion.objects.values_list('escopo', flat=True)])
+
+
+class Migration(migrations.Migration):
+    # Cada lote é gravado na sua própria transação; interrompida, a migração pode ser repetida
+    atomic = False
+
+    dependencies = [
+        ('users', '0016_uploadjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalizar, migrations.RunPython.noop),
+        migrations.RunPython(reconstruir_rollup, migrations.RunPython.noop),
+        migrations.RunPython(invalidar_caches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+import os
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Os vectorstores de conversa passaram a ter o dono na chave (users.vectorstores.chave_conversa:
+# '<user_N|anon>__<conversation_id>'). Os diretórios antigos, com o conversation_id puro, são
+# movidos para a chave do dono da conversa ou, se a conversa não existe, do dono do último upload
+# para eles. Sem dono conhecido, o diretório fica onde está e não é mais lido.
+ID_VALIDO = re.compile(r'^[A-Za-z0-9_-]+$')
+CHAVE_COM_DONO = re.compile(r'^(?:user_\d+|anon)__(.+)$')
+CHAVE_USUARIO = re.compile(r'^user_\d+$')
+
+
+def escopo(owner_id):
+    return f'user_{owner_id}' if owner_id is not None else 'anon'
+
+
+def legada(chave):
+    return bool(chave) and not CHAVE_COM_DONO.match(chave) and not CHAVE_USUARIO.match(chave)
+
+
+def mover_para_o_dono(apps, schema_editor):
+    Conversation = apps.get_model('users', 'Conversation')
+    UploadJob = apps.get_model('users', 'UploadJob')
+    diretorio = settings.VECTORSTORE_DIR
+    chaves = sorted(os.listdir(diretorio)) if os.path.isdir(diretorio) else []
+    for chave in chaves:
+        caminho = os.path.join(diretorio, chave)
+        if not os.path.isdir(caminho) or not ID_VALIDO.match(chave) or not legada(chave):
+            continue
+        conversa = Conversation.objects.filter(conversation_id=chave).first()
+        if conversa is None:
+            job = UploadJob.objects.filter(chave_vectorstore=chave).order_by('-criado_em').first()
+            if job is None:
+                continue
+            conversa = Conversation.objects.create(conversation_id=chave, user_id=job.owner_id)
+        destino = os.path.join(diretorio, f'{escopo(conversa.user_id)}__{chave}')
+        if not os.path.exists(destino):
+            os.rename(caminho, destino)
+    # Jobs ainda na fila gravam no vectorstore de quem enviou o arquivo
+    legados = UploadJob.objects.exclude(chave_vectorstore='').values_list('chave_vectorstore', 'owner_id').distinct()
+    for chave, owner_id in list(legados):
+        if legada(chave):
+            UploadJob.objects.filter(chave_vectorstore=chave, owner_id=owner_id).update(
+                chave_vectorstore=f'{escopo(owner_id)}__{chave}'
+            )
+
+
+def voltar_para_a_conversa(apps, schema_editor):
+    diretorio = settings.VECTORSTORE_DIR
+    chaves = sorted(os.listdir(diretorio)) if os.path.isdir(diretorio) else []
+    for chave in chaves:
+        encontrado = CHAVE_COM_DONO.match(chave)
+        destino = encontrado and os.path.join(diretorio, encontrado.group(1))
+        if destino and not os.path.exists(destino):
+            os.rename(os.path.join(diretorio, chave), destino)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0017_renormalizar_registros'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='chave_vectorstore',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.RunPython(mover_para_o_dono, voltar_para_a_conversa),
+    ]
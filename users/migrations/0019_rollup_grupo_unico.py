@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+import datetime
+import django.db.models.functions.comparison
+from django.db import migrations, models, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncMonth
+
+# Ingestões simultâneas do mesmo dono podiam criar duas linhas do mesmo grupo no rollup (e contar
+# registros em dobro). Antes da restrição única, o rollup é reconstruído a partir dos registros.
+
+
+def linhas(grupos):
+    for grupo in grupos:
+        yield grupo.pop('owner'), grupo.pop('total'), grupo
+
+
+def reconstruir_rollup(apps, schema_editor):
+    FinancialRecord = apps.get_model('users', 'FinancialRecord')
+    FinancialRollup = apps.get_model('users', 'FinancialRollup')
+    # Mesma agregação de users.rollup.reconstruir
+    grupos = (
+        FinancialRecord.objects.annotate(mes=TruncMonth('data_normalizada'))
+        .values('owner', 'mes', 'tipo_normalizado', 'categoria')
+        .annotate(total=Sum('valor_normalizado'), quantidade=Count('id'), primeiro=Min('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        FinancialRollup.objects.all().delete()
+        FinancialRollup.objects.bulk_create(
+            (FinancialRollup(owner_id=owner, total=total or 0, **campos) for owner, total, campos in linhas(grupos)),
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+    # A reconstrução é gravada antes da criação do índice único, em transações separadas
+    atomic = False
+
+    dependencies = [
+        ('users', '0018_vectorstores_por_dono'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconstruir_rollup, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='financialrollup',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('owner', models.Value(0)), django.db.models.functions.comparison.Coalesce('mes', models.Value(datetime.date(1, 1, 1))), models.F('tipo_normalizado'), models.F('categoria'), name='rollup_grupo_unico'),
+        ),
+    ]
@@ -1,4 +1,9 @@
+import uuid
+from datetime import date
+
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
@@ -12,6 +17,9 @@ class Conversation(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     conversation_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Resumo das mensagens antigas (fora da janela do histórico), até a mensagem de id `resumo_ate`
+    resumo = models.TextField(blank=True, default='')
+    resumo_ate = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"Conversa {self.conversation_id}"
@@ -22,10 +30,21 @@ class Message(models.Model):
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Últimas mensagens da conversa sem ordenar o histórico inteiro
+        indexes = [models.Index(fields=['conversation', 'id'])]
+
     def __str__(self):
         return f"{self.sender}: {self.text[:30]}..."
 
+TIPOS_NORMALIZADOS = [('receita', 'Receita'), ('despesa', 'Despesa')]
+
 class FinancialRecord(models.Model):
+    # Dono dos dados (None: registros enviados sem login); toda consulta filtra por ele
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='registros_financeiros', db_index=False
+    )
     data = models.CharField(max_length=50, blank=True)
     cliente_fornecedor = models.CharField(max_length=255, blank=True)
     descricao = models.CharField(max_length=255, blank=True)
@@ -35,6 +54,126 @@ class FinancialRecord(models.Model):
     forma_pagamento = models.CharField(max_length=100, blank=True)
     status = models.CharField(max_length=50, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Campos tipados preenchidos na ingestão a partir de valor, data e tipo
+    valor_normalizado = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    data_normalizada = models.DateField(null=True, blank=True)
+    tipo_normalizado = models.CharField(max_length=10, choices=TIPOS_NORMALIZADOS, default='despesa')
+    # Identifica o upload (UploadBatch) que gravou o registro (permite excluir um upload inteiro)
+    lote_upload = models.UUIDField(null=True, blank=True)
+    # Impressão digital do conteúdo (users.impressoes): a mesma linha reenviada não é duplicada
+    impressao = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        # Todos começam pelo dono: cada consulta percorre só os dados de um usuário
+        indexes = [
+            # Paginação por cursor em (uploaded_at, id), do mais novo para o mais antigo
+            models.Index(fields=['owner', 'uploaded_at', 'id']),
+            # Exclusão em lotes por período e agrupamentos por data, tipo e categoria
+            models.Index(fields=['owner', 'data_normalizada']),
+            models.Index(fields=['owner', 'tipo_normalizado', 'categoria']),
+            # Exclusão em lotes por upload
+            models.Index(fields=['lote_upload', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.data} - {self.descricao} - {self.valor}"
+
+class UploadBatch(models.Model):
+    # Um upload de CSV; os registros gravados por ele têm lote_upload = id
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='uploads', db_index=False
+    )
+    nome_arquivo = models.CharField(max_length=255, blank=True)
+    hash_arquivo = models.CharField(max_length=64)  # sha256 do arquivo enviado
+    tamanho_bytes = models.PositiveBigIntegerField(default=0)
+    linhas = models.PositiveIntegerField(default=0)
+    inseridos = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    ignorados = models.PositiveIntegerField(default=0)
+    tempo_segundos = models.FloatField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'hash_arquivo'])]
+
+    def __str__(self):
+        return f"{self.nome_arquivo or self.id} - {self.linhas} linhas"
+
+class UploadJob(models.Model):
+    # Ingestão de um CSV em segundo plano (users.tarefas); o arquivo espera em INGESTAO_DIR
+    PENDENTE, PROCESSANDO, CONCLUIDO, ERRO = 'pendente', 'processando', 'concluido', 'erro'
+    STATUS = [(PENDENTE, 'Pendente'), (PROCESSANDO, 'Processando'), (CONCLUIDO, 'Concluído'), (ERRO, 'Erro')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='jobs_upload', db_index=False
+    )
+    status = models.CharField(max_length=20, choices=STATUS, default=PENDENTE)
+    nome_arquivo = models.CharField(max_length=255, blank=True)
+    # Vectorstore que recebe as linhas (conversa ou usuário; users.vectorstores.chave_conversa)
+    chave_vectorstore = models.CharField(max_length=150, blank=True)
+    conversation_id = models.CharField(max_length=100, blank=True)
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    resultado = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    # Último sinal de vida do worker (jobs parados há muito tempo voltam para a fila)
+    atualizado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'criado_em'])]
+
+    def __str__(self):
+        return f"{self.nome_arquivo or self.id} - {self.status}"
+
+class FinancialRollup(models.Model):
+    # Totais por dono, mês, tipo e categoria, mantidos incrementalmente na ingestão
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='+', db_index=False
+    )
+    mes = models.DateField(null=True, blank=True)
+    tipo_normalizado = models.CharField(max_length=10, choices=TIPOS_NORMALIZADOS)
+    categoria = models.CharField(max_length=100, blank=True)
+    total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    quantidade = models.PositiveIntegerField(default=0)
+    # Menor id de FinancialRecord do grupo: preserva a ordem de primeira ocorrência das categorias
+    primeiro = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'mes', 'tipo_normalizado', 'categoria'])]
+        constraints = [
+            # Uma linha por grupo. NULL não se repete num índice único: sem dono e sem data entram
+            # como valores fixos, senão ingestões simultâneas duplicariam esses grupos
+            models.UniqueConstraint(
+                Coalesce('owner', Value(0)), Coalesce('mes', Value(date(1, 1, 1))), 'tipo_normalizado', 'categoria',
+                name='rollup_grupo_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.mes} - {self.tipo_normalizado} - {self.categoria}: {self.total}"
+
+class EmbeddingCache(models.Model):
+    # Embedding já calculado, identificado pelo hash de modelo + texto
+    chave = models.CharField(max_length=64, unique=True)
+    modelo = models.CharField(max_length=100)
+    vetor = models.BinaryField()  # float32
+    criado_em = models.DateTimeField(auto_now_add=True)
+    usado_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.modelo}: {self.chave[:12]}..."
+
+class DataVersion(models.Model):
+    # Contador incrementado a cada alteração nos registros financeiros; invalida análises em cache
+    escopo = models.CharField(max_length=64, unique=True)
+    versao = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.escopo}: v{self.versao}"
@@ -0,0 +1,164 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+TIPO_RECEITA = 'receita'
+TIPO_DESPESA = 'despesa'
+
+# Conversão dos campos texto do CSV: cada função recebe a coluna inteira e devolve um array
+# tipado (float64 com NaN, datetime64 com NaT). Texto preenchido que não vira valor é rejeitado e
+# aparece no RelatorioRejeicoes em vez de virar 0 ou ser arredondado. Os valores são convertidos
+# com operações de coluna (Series.str, pd.to_numeric); as datas, que se repetem muito num extrato,
+# uma vez por texto distinto.
+
+# Número: '1.234,56' / '1234,56' / '1234' (padrão brasileiro) ou '1234.56' (ponto decimal), com
+# até 2 casas. Sem vírgula, '1.234' é separador de milhar; '1,234' (milhar em inglês ou 3 casas)
+# é rejeitado.
+NUMERO = r'\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:,\d{1,2})?|\d+\.\d{1,2}'
+# Valor com espaços já removidos: 'R$' opcional e o negativo indicado uma vez só, como '-10,00',
+# '(10,00)' ou '10,00-'
+PADRAO_VALOR = re.compile(rf'(?:R\$)?(?:\((?:R\$)?(?:{NUMERO})\)|[-+]?(?:R\$)?(?:{NUMERO})|(?:{NUMERO})-)')
+# O formato mais comum dos extratos ('-1.234,56', '1234,5', '12'): vai direto para float
+PADRAO_VALOR_SIMPLES = re.compile(r'-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d{1,2})?')
+# Num valor válido, '-' ou '(' só aparecem para indicar o negativo
+SINAL_NEGATIVO = re.compile(r'[-(]')
+# Removidos do número: 'R$', sinal, parênteses e os pontos de milhar (seguidos de 3 dígitos; o
+# ponto decimal tem no máximo 2)
+SIMBOLOS = re.compile(r'[^\d.,]|\.(?=\d{3})')
+ESPACOS = re.compile(r'\s')
+# Limite do FinancialRecord.valor_normalizado (14 dígitos, 2 decimais)
+VALOR_MAXIMO = 10 ** 12
+
+# dd/mm/yyyy, dd-mm-yyyy ou dd.mm.yyyy (ano com 2 ou 4 dígitos), com horário opcional depois
+PADRAO_DATA_BR = re.compile(r'(\d{1,2})([/.-])(\d{1,2})\2(\d{4}|\d{2})(?!\d)')
+# yyyy-mm-dd, yyyy/mm/dd ou yyyy.mm.dd, com horário opcional depois
+PADRAO_DATA_ISO = re.compile(r'(\d{4})([/.-])(\d{1,2})\2(\d{1,2})(?!\d)')
+# Mês por extenso ou abreviado: '05/jan/2024', '5 de janeiro de 2024', '05-Mar-24'
+PADRAO_DATA_MES = re.compile(
+    r'(\d{1,2})(?:\s+de\s+|[/ .-])([a-zç]{3})[a-zç]*\.?(?:\s+de\s+|[/ .-])(\d{4}|\d{2})(?!\d)', re.IGNORECASE
+)
+MESES = {
+    'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
+}
+# Ano com 2 dígitos (mesma regra do %y do strptime): até 68 é 20yy, a partir de 69 é 19yy
+PIVO_ANO = 69
+DATA_INVALIDA = (np.nan, np.nan, np.nan)
+
+
+def _valores_gerais(texto):
+    # Qualquer formato aceito: a máscara do PADRAO_VALOR rejeita o resto (inclusive 3 ou mais casas)
+    texto = texto.str.replace(ESPACOS, '', regex=True)
+    valido = texto.str.fullmatch(PADRAO_VALOR)
+    negativo = texto.str.contains(SINAL_NEGATIVO, regex=True)
+    numero = texto.str.replace(SIMBOLOS, '', regex=True).str.replace(',', '.', regex=False)
+    valores = pd.to_numeric(numero.where(valido), errors='coerce')
+    return valores.where(~negativo, -valores).to_numpy(dtype='float64')
+
+
+def converter_valores(serie):
+    """Valores em texto -> float64; NaN onde não há um valor válido."""
+    texto = serie.astype(str)
+    simples = texto.str.fullmatch(PADRAO_VALOR_SIMPLES).to_numpy(dtype=bool)
+    valores = np.full(len(texto), np.nan)
+    # Já validado pela máscara: só troca os separadores
+    valores[simples] = (
+        texto[simples].str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype('float64')
+    )
+    if not simples.all():
+        valores[~simples] = _valores_gerais(texto[~simples])
+    return pd.Series(np.where(np.abs(valores) < VALOR_MAXIMO, valores, np.nan), index=serie.index)
+
+
+def _data(texto):
+    # (ano, mês, dia) da data no começo do texto
+    texto = texto.strip()
+    if encontrado := PADRAO_DATA_BR.match(texto):
+        dia, _, mes, ano = encontrado.groups()
+    elif encontrado := PADRAO_DATA_ISO.match(texto):
+        ano, _, mes, dia = encontrado.groups()
+    elif encontrado := PADRAO_DATA_MES.match(texto):
+        dia, mes, ano = encontrado.groups()
+        mes = MESES.get(mes.lower())
+        if mes is None:
+            return DATA_INVALIDA
+    else:
+        return DATA_INVALIDA
+    ano = int(ano)
+    if ano < 100:
+        ano += 2000 if ano < PIVO_ANO else 1900
+    return ano, int(mes), int(dia)
+
+
+def converter_datas(serie):
+    """Datas em texto -> datetime64; NaT onde não há uma data válida.
+
+    Aceita dd/mm/yyyy (também com '-' ou '.', ano com 2 dígitos), yyyy-mm-dd (também com '/' ou '.')
+    e o mês por extenso ou abreviado. Um horário depois da data é ignorado.
+    """
+    codigos, textos = pd.factorize(serie.astype(str))
+    partes = pd.DataFrame([_data(texto) for texto in textos], columns=['year', 'month', 'day'], dtype='float64')
+    # Dia além do fim do mês (31/02) ou ano fora do datetime64[ns] viram NaT
+    datas = pd.to_datetime(partes, errors='coerce').to_numpy()
+    return pd.Series(datas[codigos], index=serie.index, dtype='datetime64[ns]')
+
+
+def parse_valores(serie):
+    # Valores para o FinancialRecord: floats, None onde inválido
+    numeros = converter_valores(serie)
+    return numeros.astype(object).where(numeros.notna(), None)
+
+
+def parse_datas(serie):
+    datas = converter_datas(serie)
+    return datas.dt.date.astype(object).where(datas.notna(), None)
+
+
+def normalizar_tipos(serie):
+    receita = serie.astype(str).str.strip().str.lower() == TIPO_RECEITA
+    return pd.Series(np.where(receita, TIPO_RECEITA, TIPO_DESPESA), index=serie.index)
+
+
+def padronizar_colunas(df, colunas):
+    # colunas: campo do FinancialRecord -> coluna do CSV (None: campo ausente, fica vazio)
+    dados = {campo: df[col] if col is not None else '' for campo, col in colunas.items()}
+    return pd.DataFrame(dados, index=df.index)
+
+
+def adicionar_campos_normalizados(df):
+    # Recebe um DataFrame com os campos texto do FinancialRecord e preenche os campos tipados
+    df['valor_normalizado'] = parse_valores(df['valor'])
+    df['data_normalizada'] = parse_datas(df['data'])
+    df['tipo_normalizado'] = normalizar_tipos(df['tipo'])
+    return df
+
+
+def rejeitados(textos, convertidos):
+    # Linhas com texto preenchido que não virou valor
+    return convertidos.isna().to_numpy() & (textos.astype(str).str.strip() != '').to_numpy()
+
+
+class RelatorioRejeicoes:
+    """Conta, por campo, as linhas de um arquivo cujo valor ou data foi rejeitado, com exemplos."""
+
+    CAMPOS = {'valor': 'valor_normalizado', 'data': 'data_normalizada'}
+
+    def __init__(self, max_exemplos=20):
+        self.max_exemplos = max_exemplos
+        self.quantidades = dict.fromkeys(self.CAMPOS, 0)
+        self.exemplos = []
+
+    def registrar(self, df, primeira_linha):
+        # df: chunk já normalizado; primeira_linha: número da linha de dados do primeiro registro
+        for campo, normalizado in self.CAMPOS.items():
+            posicoes = np.flatnonzero(rejeitados(df[campo], df[normalizado]))
+            self.quantidades[campo] += len(posicoes)
+            for posicao in posicoes[:max(self.max_exemplos - len(self.exemplos), 0)]:
+                self.exemplos.append({
+                    'linha': primeira_linha + int(posicao), 'campo': campo, 'valor': str(df[campo].iloc[posicao])
+                })
+
+    def resumo(self):
+        self.exemplos.sort(key=lambda exemplo: exemplo['linha'])
+        return {'total': sum(self.quantidades.values()), 'por_campo': self.quantidades, 'exemplos': self.exemplos}
@@ -0,0 +1,102 @@
+from django.conf import settings
+
+from . import analytics
+from .parsing import TIPO_DESPESA, TIPO_RECEITA
+
+# Resumo financeiro compacto para os prompts do LLM, montado a partir de uma única consulta
+# agrupada no FinancialRollup: o tamanho depende do número de meses e categorias exibidos,
+# não da quantidade de registros.
+
+CARACTERES_POR_TOKEN = 4
+
+# Níveis de detalhe (meses, categorias de despesa, categorias de receita), do mais completo ao
+# mais enxuto; usa-se o primeiro que cabe no orçamento de tokens
+NIVEIS = [(12, 5, 3), (6, 5, 3), (6, 3, 1), (3, 3, 0), (3, 1, 0), (1, 0, 0)]
+
+
+def estimar_tokens(texto):
+    # Aproximação de ~4 caracteres por token (sem depender do tokenizer do modelo)
+    return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+
+def _reais(valor):
+    # 1234567.8 -> 'R$ 1.234.568'
+    return 'R$ ' + f'{valor:,.0f}'.replace(',', '.')
+
+
+def _percentual(parte, total):
+    return f'{parte / total * 100:.1f}%'.replace('.', ',') if total else '0%'
+
+
+def _categorias(grupos, tipo):
+    # (categoria, total) em ordem decrescente
+    totais = {}
+    for grupo in grupos:
+        if grupo['tipo_normalizado'] == tipo:
+            categoria = grupo['categoria'] or 'Outros'
+            totais[categoria] = totais.get(categoria, 0.0) + float(grupo['total'] or 0)
+    return sorted(totais.items(), key=lambda item: item[1], reverse=True)
+
+
+def _tendencia(meses):
+    # Saldo médio dos últimos 3 meses comparado com os 3 anteriores
+    saldos = [receita - despesa for _, receita, despesa in meses]
+    recentes, anteriores = saldos[-3:], saldos[-6:-3]
+    if not anteriores:
+        return None
+    media_recente = sum(recentes) / len(recentes)
+    media_anterior = sum(anteriores) / len(anteriores)
+    margem = max(abs(media_anterior) * 0.05, 1.0)
+    direcao = 'alta' if media_recente > media_anterior + margem else 'queda' if media_recente < media_anterior - margem else 'estável'
+    return f'{direcao} (saldo médio {_reais(media_recente)}/mês nos últimos 3 meses, {_reais(media_anterior)}/mês nos 3 anteriores)'
+
+
+def _categorias_texto(categorias, limite, total):
+    partes = [f'{categoria} {_reais(valor)} ({_percentual(valor, total)})' for categoria, valor in categorias[:limite]]
+    resto = sum(valor for _, valor in categorias[limite:])
+    if resto:
+        partes.append(f'demais {_reais(resto)} ({_percentual(resto, total)})')
+    return '; '.join(partes)
+
+
+def _montar(indicadores, meses, despesas, receitas, nivel):
+    max_meses, max_despesas, max_receitas = nivel
+    linhas = [
+        f"Totais: receita {_reais(indicadores['receita'])}; despesas {_reais(indicadores['gastos'])}; "
+        f"lucro {_reais(indicadores['lucro_liquido'])}; margem {_percentual(indicadores['lucro_liquido'], indicadores['receita'])}"
+    ]
+    if meses:
+        linhas.append(f'Período: {meses[0][0]} a {meses[-1][0]} ({len(meses)} meses com lançamentos)')
+        linhas.append(f'Últimos {min(max_meses, len(meses))} meses (receita/despesa/saldo): ' + '; '.join(
+            f'{chave} {_reais(receita)}/{_reais(despesa)}/{_reais(receita - despesa)}'
+            for chave, receita, despesa in meses[-max_meses:]
+        ))
+        tendencia = _tendencia(meses)
+        if tendencia:
+            linhas.append(f'Tendência do fluxo de caixa: {tendencia}')
+    if max_despesas and despesas:
+        linhas.append('Maiores despesas por categoria: ' + _categorias_texto(despesas, max_despesas, indicadores['gastos']))
+    if max_receitas and receitas:
+        linhas.append('Maiores receitas por categoria: ' + _categorias_texto(receitas, max_receitas, indicadores['receita']))
+    return '\n'.join(linhas)
+
+
+def resumo_financeiro(rollup, max_tokens=None):
+    """Texto curto com totais, meses recentes, tendência do saldo e maiores categorias.
+
+    `rollup` são as linhas de FinancialRollup de um dono. Nunca passa de `max_tokens`
+    (RESUMO_FINANCEIRO_MAX_TOKENS) tokens estimados.
+    """
+    max_tokens = max_tokens or settings.RESUMO_FINANCEIRO_MAX_TOKENS
+    grupos = analytics.agrupar_rollup(rollup, ['mes', 'tipo_normalizado', 'categoria'])
+    if not grupos:
+        return 'Nenhum registro financeiro cadastrado.'
+    indicadores = analytics.indicadores(grupos)
+    meses = analytics.totais_mensais(grupos)
+    despesas = _categorias(grupos, TIPO_DESPESA)
+    receitas = _categorias(grupos, TIPO_RECEITA)
+    for nivel in NIVEIS:
+        texto = _montar(indicadores, meses, despesas, receitas, nivel)
+        if estimar_tokens(texto) <= max_tokens:
+            return texto
+    return texto[:max_tokens * CARACTERES_POR_TOKEN]
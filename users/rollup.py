@@ -0,0 +1,139 @@
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+
+from .analytics import agrupar
+from .models import FinancialRecord, FinancialRollup
+
+# Manutenção da tabela FinancialRollup (totais por mês, tipo e categoria)
+
+CAMPOS = ['mes', 'tipo_normalizado', 'categoria']
+
+
+class AcumuladorRollup:
+    """Acumula em memória os totais dos chunks ingeridos até serem gravados no FinancialRollup do dono."""
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        # (mes, tipo, categoria) -> [centavos, quantidade, menor id]
+        self.grupos = {}
+
+    def adicionar(self, df, ids):
+        datas = pd.to_datetime(df['data_normalizada'])
+        chunk = pd.DataFrame({
+            'mes': datas.dt.strftime('%Y-%m-01').fillna(''),
+            'tipo_normalizado': df['tipo_normalizado'],
+            'categoria': df['categoria'],
+            # Soma em centavos inteiros para não acumular erro de ponto flutuante
+            'centavos': (pd.to_numeric(df['valor_normalizado']) * 100).round().fillna(0).astype('int64'),
+            'id': ids,
+        }, index=df.index)
+        resumo = chunk.groupby(CAMPOS, sort=False).agg(
+            centavos=('centavos', 'sum'), quantidade=('id', 'size'), primeiro=('id', 'min')
+        )
+        for (mes, tipo, categoria), centavos, quantidade, primeiro in resumo.itertuples(name=None):
+            chave = (date.fromisoformat(mes) if mes else None, tipo, categoria)
+            atual = self.grupos.setdefault(chave, [0, 0, int(primeiro)])
+            atual[0] += int(centavos)
+            atual[1] += int(quantidade)
+            atual[2] = min(atual[2], int(primeiro))
+
+    def aplicar(self):
+        # Deve rodar dentro da transação da ingestão: as linhas do rollup ficam bloqueadas até o commit.
+        # select_for_update só bloqueia linhas que já existem: se outra ingestão do mesmo dono criar um
+        # grupo depois da leitura, a inserção viola a restrição única e a leitura é refeita
+        if not self.grupos:
+            return
+        while True:
+            novos, alterados = self._separar(_bloquear_existentes(self.owner))
+            try:
+                with transaction.atomic():
+                    FinancialRollup.objects.bulk_create(novos)
+            except IntegrityError:
+                continue
+            break
+        FinancialRollup.objects.bulk_update(alterados, ['total', 'quantidade', 'primeiro'])
+        self.grupos = {}
+
+    def _separar(self, existentes):
+        # (linhas a inserir, linhas existentes já somadas)
+        novos, alterados = [], []
+        for (mes, tipo, categoria), (centavos, quantidade, primeiro) in self.grupos.items():
+            total = Decimal(centavos) / 100
+            linha = existentes.get((mes, tipo, categoria))
+            if linha is None:
+                novos.append(FinancialRollup(
+                    owner=self.owner, mes=mes, tipo_normalizado=tipo, categoria=categoria,
+                    total=total, quantidade=quantidade, primeiro=primeiro
+                ))
+            else:
+                linha.total += total
+                linha.quantidade += quantidade
+                linha.primeiro = min(linha.primeiro, primeiro)
+                alterados.append(linha)
+        return novos, alterados
+
+
+def _bloquear_existentes(owner):
+    return {
+        (linha.mes, linha.tipo_normalizado, linha.categoria): linha
+        for linha in FinancialRollup.objects.select_for_update().filter(owner=owner)
+    }
+
+
+def limpar(owner):
+    FinancialRollup.objects.filter(owner=owner).delete()
+
+
+def _registros_do_grupo(owner, mes, tipo, categoria):
+    registros = FinancialRecord.objects.filter(owner=owner, tipo_normalizado=tipo, categoria=categoria)
+    if mes is None:
+        return registros.filter(data_normalizada__isnull=True)
+    proximo = date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+    return registros.filter(data_normalizada__gte=mes, data_normalizada__lt=proximo)
+
+
+def descontar(grupos, owner):
+    """Retira do rollup do dono os totais de registros já excluídos (`grupos` no formato de `agrupar`).
+
+    Deve rodar na mesma transação da exclusão, depois dela.
+    """
+    removidos = {(g['mes'], g['tipo_normalizado'], g['categoria']): g for g in grupos}
+    if not removidos:
+        return
+    vazios, alterados = [], []
+    for linha in FinancialRollup.objects.select_for_update().filter(owner=owner):
+        chave = (linha.mes, linha.tipo_normalizado, linha.categoria)
+        grupo = removidos.get(chave)
+        if grupo is None:
+            continue
+        linha.quantidade -= grupo['quantidade']
+        if linha.quantidade <= 0:
+            vazios.append(linha.pk)
+            continue
+        linha.total -= grupo['total'] or 0
+        if linha.primeiro == grupo['primeiro']:
+            # O primeiro registro do grupo saiu: procura o novo
+            linha.primeiro = _registros_do_grupo(owner, *chave).aggregate(primeiro=Min('id'))['primeiro'] or linha.primeiro
+        alterados.append(linha)
+    FinancialRollup.objects.filter(pk__in=vazios).delete()
+    FinancialRollup.objects.bulk_update(alterados, ['total', 'quantidade', 'primeiro'])
+
+
+def _linha_rollup(owner, total, **campos):
+    return FinancialRollup(owner_id=owner, total=total or 0, **campos)
+
+
+def reconstruir():
+    # Recalcula o rollup inteiro (de todos os donos) a partir de FinancialRecord
+    with transaction.atomic():
+        FinancialRollup.objects.all().delete()
+        grupos = agrupar(FinancialRecord.objects.all(), ['owner'] + CAMPOS)
+        FinancialRollup.objects.bulk_create(
+            (_linha_rollup(**grupo) for grupo in grupos),
+            batch_size=1000
+        )
+    return len(grupos)
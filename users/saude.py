@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .async_utils import em_thread
+from .clientes import obter_llm, registro
+from .models import FinancialRollup
+from .resumo import resumo_financeiro
+from .versoes import escopo_usuario, versao_dados
+
+logger = logging.getLogger(__name__)
+
+# Uma única chamada ao LLM produz tudo o que os cinco endpoints de saúde financeira exibem
+PROMPT_ANALISE = (
+    "Dados financeiros da empresa (resumo):\n{resumo}\n\n"
+    "Analise esses dados financeiros e responda apenas com um JSON no formato: "
+    "{\"indice\": <nota de 0 a 100>, \"label\": <rótulo curto como Bom, Ruim, Excelente, Regular, etc>, "
+    "\"analise\": <texto de no máximo 30 palavras, explicando de forma simples a situação financeira da empresa>, "
+    "\"pontos_fortes\": [duas frases curtas, cada uma representando um ponto forte], "
+    "\"melhorias\": [duas frases curtas, cada uma representando um ponto fraco ou sugestão de melhoria], "
+    "\"nota\": <número de 0 a 100 representando a nota de saúde financeira da empresa>}"
+)
+
+ANALISE_PADRAO = {
+    'indice': 0,
+    'label': 'Desconhecido',
+    'analise': 'Não foi possível analisar a situação financeira.',
+    'pontos_fortes': [],
+    'melhorias': [],
+    'nota': 0,
+}
+
+# Análises em cálculo por chave de cache: requisições simultâneas (de qualquer thread ou event
+# loop) aguardam o mesmo Future, cuja chamada ao LLM roda no loop dos clientes
+_em_andamento = {}
+_em_andamento_lock = threading.Lock()
+
+
+def _nota(valor):
+    try:
+        return min(max(int(float(valor)), 0), 100)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _frases(valor):
+    # Garante que só venham 2 frases
+    return [str(frase) for frase in valor[:2]] if isinstance(valor, list) else []
+
+
+def normalizar_analise(texto):
+    encontrado = re.search(r'\{.*\}', texto or '', re.DOTALL)
+    if not encontrado:
+        raise ValueError('Resposta do LLM sem JSON.')
+    dados = json.loads(encontrado.group(0))
+    if not isinstance(dados, dict):
+        raise ValueError('Resposta do LLM não é um objeto JSON.')
+    analise = str(dados.get('analise') or '').strip()
+    return {
+        'indice': _nota(dados.get('indice', dados.get('nota'))),
+        'label': str(dados.get('label') or ANALISE_PADRAO['label']),
+        'analise': analise or ANALISE_PADRAO['analise'],
+        'pontos_fortes': _frases(dados.get('pontos_fortes')),
+        'melhorias': _frases(dados.get('melhorias')),
+        'nota': _nota(dados.get('nota', dados.get('indice'))),
+    }
+
+
+def montar_prompt(user):
+    # Resumo agregado dos dados do usuário com orçamento de tokens, em vez dos registros brutos
+    return PROMPT_ANALISE.replace('{resumo}', resumo_financeiro(FinancialRollup.objects.filter(owner=user)))
+
+
+def _em_cache(user):
+    escopo = escopo_usuario(user)
+    chave = f'saude:{escopo}:{versao_dados(escopo)}'
+    return chave, cache.get(chave)
+
+
+async def _calcular(chave, user):
+    # No loop dos clientes: continua mesmo que as requisições que esperam por ela sejam canceladas
+    try:
+        analise = await em_thread(cache.get, chave)
+        if analise is not None:
+            # Gravada por um cálculo que terminou depois da leitura de quem pediu este
+            return analise
+        try:
+            analise = normalizar_analise(await obter_llm('saude').ainvoke(await em_thread(montar_prompt, user)))
+            timeout = settings.SAUDE_CACHE_TIMEOUT
+        except Exception:
+            logger.exception('Falha na análise de saúde financeira (%s)', chave)
+            analise = ANALISE_PADRAO
+            timeout = settings.SAUDE_CACHE_TIMEOUT_ERRO
+        await em_thread(cache.set, chave, analise, timeout)
+        return analise
+    finally:
+        with _em_andamento_lock:
+            _em_andamento.pop(chave, None)
+
+
+async def obter_analise(user):
+    """Análise de saúde financeira do usuário, em cache por usuário e versão dos dados.
+
+    Só é recalculada quando os registros mudam; falhas do LLM ficam em cache por pouco tempo.
+    """
+    chave, analise = await em_thread(_em_cache, user)
+    if analise is not None:
+        return analise
+    with _em_andamento_lock:
+        futuro = _em_andamento.get(chave)
+        if futuro is None:
+            futuro = _em_andamento[chave] = registro.agendar(_calcular(chave, user))
+    # shield: uma requisição cancelada (cliente desconectado) não cancela o cálculo das outras
+    return await asyncio.shield(asyncio.wrap_future(futuro))
@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import instrumentacao, vectorstores
+from .indexacao import IndexadorVectorstore
+from .ingestion import ErroLeituraCSV, ingerir_csv
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+# Fila de ingestão de CSV sem broker externo: cada job é uma linha de UploadJob e o arquivo fica
+# em INGESTAO_DIR até ser processado. Com INGESTAO_EM_PROCESSO o próprio processo web executa os
+# jobs num pool de threads; `manage.py run_jobs` retira do banco os que ficarem pendentes. Um job
+# só é executado por quem conseguir passá-lo de 'pendente' para 'processando' (UPDATE condicional).
+
+# Jobs em execução neste processo: job id -> RelatorProgresso
+_em_andamento = {}
+
+
+def caminho_arquivo(job_id):
+    return os.path.join(settings.INGESTAO_DIR, f'{job_id}.csv')
+
+
+def criar_job(file, owner=None, chave_vectorstore='', conversation_id=''):
+    """Grava o arquivo enviado em INGESTAO_DIR e cria o job pendente."""
+    job = UploadJob(
+        owner=owner, nome_arquivo=(file.name or '')[:255],
+        chave_vectorstore=chave_vectorstore, conversation_id=conversation_id or ''
+    )
+    os.makedirs(settings.INGESTAO_DIR, exist_ok=True)
+    with open(caminho_arquivo(job.pk), 'wb') as destino:
+        for bloco in file.chunks():
+            destino.write(bloco)
+    job.save()
+    return job
+
+
+class RelatorProgresso:
+    """Publica as linhas processadas e o sinal de vida de um job enquanto a ingestão roda.
+
+    A cada INGESTAO_PROGRESSO_INTERVALO segundos, com ou sem progresso, outra thread renova a data
+    de modificação do arquivo do job (lida por `recuperar_expirados`) e grava linhas_processadas e
+    atualizado_em por outra conexão, já que a ingestão é uma transação só. No SQLite, que tem um
+    único escritor (bloqueado pela ingestão), só o arquivo é renovado e o progresso fica em memória,
+    lido pelo endpoint de status do mesmo processo.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.linhas = 0
+        self._gravar_no_banco = connection.vendor != 'sqlite'
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def atualizar(self, linhas):
+        self.linhas = linhas
+
+    def _executar(self):
+        try:
+            while not self._parar.wait(settings.INGESTAO_PROGRESSO_INTERVALO):
+                self._sinal_de_vida()
+        finally:
+            connections.close_all()
+
+    def _sinal_de_vida(self):
+        try:
+            os.utime(caminho_arquivo(self.job_id))
+        except OSError:
+            logger.warning('Falha ao renovar o arquivo do job %s', self.job_id, exc_info=True)
+        if not self._gravar_no_banco:
+            return
+        try:
+            UploadJob.objects.filter(pk=self.job_id).update(linhas_processadas=self.linhas, atualizado_em=timezone.now())
+        except DatabaseError:
+            logger.warning('Falha ao gravar o progresso do job %s', self.job_id, exc_info=True)
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+
+def progresso_local(job_id):
+    # Linhas processadas de um job em execução neste processo (None se não estiver aqui)
+    relator = _em_andamento.get(job_id)
+    return relator.linhas if relator is not None else None
+
+
+def _reservar(filtro):
+    agora = timezone.now()
+    return UploadJob.objects.filter(filtro, status=UploadJob.PENDENTE).update(
+        status=UploadJob.PROCESSANDO, iniciado_em=agora, atualizado_em=agora
+    )
+
+
+def reservar(job_id):
+    if not _reservar(Q(pk=job_id)):
+        return None
+    return UploadJob.objects.select_related('owner').get(pk=job_id)
+
+
+def reservar_proximo():
+    # O pendente mais antigo; se outro worker o reservar antes, tenta o seguinte
+    while True:
+        job_id = (
+            UploadJob.objects.filter(status=UploadJob.PENDENTE)
+            .order_by('criado_em').values_list('pk', flat=True).first()
+        )
+        if job_id is None:
+            return None
+        job = reservar(job_id)
+        if job is not None:
+            return job
+
+
+def _arquivo_renovado_desde(job_id, limite):
+    try:
+        return os.path.getmtime(caminho_arquivo(job_id)) >= limite.timestamp()
+    except OSError:
+        return False
+
+
+def recuperar_expirados():
+    """Devolve à fila os jobs 'processando' sem sinal de vida há INGESTAO_JOB_EXPIRACAO segundos.
+
+    Sinal de vida é o atualizado_em do job ou a data de modificação do seu arquivo, renovados
+    pelo RelatorProgresso de quem o executa.
+    """
+    limite = timezone.now() - timedelta(seconds=settings.INGESTAO_JOB_EXPIRACAO)
+    expirados = UploadJob.objects.filter(status=UploadJob.PROCESSANDO, atualizado_em__lt=limite)
+    ids = [job_id for job_id in expirados.values_list('pk', flat=True) if not _arquivo_renovado_desde(job_id, limite)]
+    return expirados.filter(pk__in=ids).update(status=UploadJob.PENDENTE, linhas_processadas=0, iniciado_em=None)
+
+
+def _finalizar(job, **campos):
+    agora = timezone.now()
+    UploadJob.objects.filter(pk=job.pk).update(concluido_em=agora, atualizado_em=agora, **campos)
+
+
+def executar(job):
+    """Processa um job já reservado: ingestão, índice do vectorstore e resultado no UploadJob."""
+    relator = RelatorProgresso(job.pk)
+    _em_andamento[job.pk] = relator
+    try:
+        with (
+            instrumentacao.medindo() as medicao, vectorstores.bloqueio_escrita(job.chave_vectorstore),
+            open(caminho_arquivo(job.pk), 'rb') as arquivo,
+        ):
+            indexador = IndexadorVectorstore(job.chave_vectorstore) if job.chave_vectorstore else None
+            resultado = ingerir_csv(
+                arquivo, indexador=indexador, owner=job.owner,
+                nome_arquivo=job.nome_arquivo, progresso=relator.atualizar
+            )
+        if medicao is not None:
+            # Tempo de cada etapa (leitura, normalização, upsert...) e consultas ao banco do job
+            resultado['instrumentacao'] = medicao.resumo()
+    except ErroLeituraCSV as e:
+        _finalizar(job, status=UploadJob.ERRO, erro=f'Erro ao ler o CSV: {e}', linhas_processadas=relator.linhas)
+    except Exception as e:
+        logger.exception('Falha no job de ingestão %s', job.pk)
+        _finalizar(job, status=UploadJob.ERRO, erro=str(e), linhas_processadas=relator.linhas)
+    else:
+        _finalizar(job, status=UploadJob.CONCLUIDO, resultado=resultado, linhas_processadas=resultado['registros'])
+    finally:
+        relator.parar()
+        _em_andamento.pop(job.pk, None)
+        try:
+            os.remove(caminho_arquivo(job.pk))
+        except FileNotFoundError:
+            pass
+
+
+def situacao(job):
+    """Dados do endpoint de status: progresso, velocidade, erro e, ao fim, o resultado da ingestão."""
+    linhas = progresso_local(job.pk)
+    if linhas is None:
+        linhas = job.linhas_processadas
+    tempo = 0.0
+    if job.iniciado_em is not None:
+        tempo = ((job.concluido_em or timezone.now()) - job.iniciado_em).total_seconds()
+    dados = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'nome_arquivo': job.nome_arquivo,
+        'linhas_processadas': linhas,
+        'linhas_por_segundo': round(linhas / tempo, 1) if tempo > 0 else 0.0,
+        'tempo_segundos': round(tempo, 3),
+        'criado_em': job.criado_em,
+        'iniciado_em': job.iniciado_em,
+        'concluido_em': job.concluido_em,
+    }
+    if job.conversation_id:
+        dados['conversation_id'] = job.conversation_id
+    if job.erro:
+        dados['erro'] = job.erro
+    if job.resultado is not None:
+        dados['resultado'] = job.resultado
+    return dados
+
+
+class PoolIngestao:
+    """Pool de threads do processo web que executa os jobs assim que são criados."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def enviar(self, job_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingestao')
+        self._executor.submit(self._executar, job_id)
+
+    def _executar(self, job_id):
+        try:
+            # Se um run_jobs já tiver pegado o job, não há nada a fazer aqui
+            job = reservar(job_id)
+            if job is not None:
+                executar(job)
+        except Exception:
+            logger.exception('Falha ao executar o job de ingestão %s', job_id)
+        finally:
+            # Threads do pool não passam pelo request_finished
+            connections.close_all()
+
+
+pool = PoolIngestao(settings.INGESTAO_WORKERS)
+
+
+def enfileirar(job):
+    if settings.INGESTAO_EM_PROCESSO:
+        pool.enviar(job.pk)
+
+
+def rodar_worker(intervalo, parar, uma_vez=False):
+    """Laço de um worker do run_jobs: processa pendentes até `parar` (ou até a fila esvaziar).
+
+    A cada INGESTAO_RECUPERACAO_INTERVALO segundos devolve à fila os jobs expirados, inclusive os
+    de processos web ou workers que caíram depois que este começou.
+    """
+    proxima_recuperacao = 0.0
+    while not parar.is_set():
+        job = None
+        try:
+            if time.monotonic() >= proxima_recuperacao:
+                proxima_recuperacao = time.monotonic() + settings.INGESTAO_RECUPERACAO_INTERVALO
+                if recuperados := recuperar_expirados():
+                    logger.warning('%s job(s) de ingestão expirado(s) de volta à fila', recuperados)
+            job = reservar_proximo()
+            if job is not None:
+                executar(job)
+        except DatabaseError:
+            logger.exception('Falha ao buscar jobs de ingestão')
+        finally:
+            connections.close_all()
+        if job is None:
+            if uma_vez:
+                return
+            parar.wait(intervalo)
+
@@ -1,3 +1,1124 @@
-from django.test import TestCase
+import asyncio
+import csv
+import fcntl
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.cache import cache
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Concat
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analytics, exclusao, ingestion, listagem, rollup, tarefas, vectorstores, versoes
+from .bench import ServidorLLMFalso, gerar_dataframe, popular
+from .cache_respostas import CacheRespostas, cache_respostas, normalizar_pergunta
+from .clientes import RegistroClientes
+from .embeddings import embeddings_compartilhados
+from .indexacao import IndexadorVectorstore
+from .instrumentacao import metricas as metricas_processo
+from .ingestion import CAMPOS_MODELO, ingerir_csv
+from .models import Conversation, FinancialRecord, FinancialRollup, Message, UploadJob, User
+from .parsing import converter_datas, converter_valores
+from .vectorstores import caminho_vectorstore, carregar_vectorstore, chave_conversa
+from .views import preparar_consulta
+
+
+def arquivo_csv(df):
+    # DataFrame com os campos do FinancialRecord -> CSV com os cabeçalhos esperados no upload
+    colunas = {campo: coluna for coluna, campo in CAMPOS_MODELO.items()}
+    return io.BytesIO(df.rename(columns=colunas).to_csv(index=False).encode('utf-8'))
+
+
+def estado_rollup():
+    return sorted(
+        FinancialRollup.objects.values_list('owner_id', 'mes', 'tipo_normalizado', 'categoria', 'total', 'quantidade', 'primeiro'),
+        key=str
+    )
+
+
+class LLMFalsoMixin:
+    """Aponta os clientes da OpenAI para um servidor local e usa embeddings locais (sem rede)."""
+
+    resposta_llm = 'Resposta do agente.'
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = ServidorLLMFalso(latencia=0, resposta=self.resposta_llm).__enter__()
+        self.addCleanup(self.servidor.__exit__, None, None, None)
+        ambiente = mock.patch.dict(os.environ, {'OPENAI_BASE_URL': self.servidor.url, 'OPENAI_API_KEY': 'sk-teste'})
+        ambiente.start()
+        self.addCleanup(ambiente.stop)
+        configuracoes = override_settings(EMBEDDING_BACKEND='fake')
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+        embeddings_compartilhados.cache_clear()
+        self.addCleanup(embeddings_compartilhados.cache_clear)
+        cache_respostas.limpar()
+        self.addCleanup(cache_respostas.limpar)
+
+
+class ConversaoTests(TestCase):
+
+    def test_valores(self):
+        casos = {
+            '1.234,56': 1234.56, 'R$ 1.234,56': 1234.56, '(1.000,00)': -1000.0, '10,00-': -10.0,
+            '-R$ 10,00': -10.0, '1234.56': 1234.56, '1.234': 1234.0, '0,5': 0.5,
+        }
+        convertidos = converter_valores(pd.Series(list(casos)))
+        self.assertEqual(convertidos.tolist(), list(casos.values()))
+
+    def test_valores_rejeitados(self):
+        # Mais de 2 casas não é arredondado: '1,234' pode ser milhar em inglês
+        invalidos = ['1,234', '1.2345', '1.000,001', 'abc', '(10', '-(10)', '1,2,3', '1' * 20, '']
+        self.assertTrue(converter_valores(pd.Series(invalidos)).isna().all())
+
+    def test_datas(self):
+        casos = {
+            '05/01/2024': date(2024, 1, 5), '5-1-24': date(2024, 1, 5), '2024-01-05 10:30': date(2024, 1, 5),
+            '2024.01.05': date(2024, 1, 5), '5 de janeiro de 2024': date(2024, 1, 5), '05/jan/24': date(2024, 1, 5),
+            '  05/01/2024 ': date(2024, 1, 5), '01/01/68': date(2068, 1, 1), '01/01/99': date(1999, 1, 1),
+        }
+        convertidas = converter_datas(pd.Series(list(casos)))
+        self.assertEqual(convertidas.dt.date.tolist(), list(casos.values()))
+
+    def test_datas_rejeitadas(self):
+        invalidas = ['31/02/2024', '13/13/2024', '01/01/1677', '05/xyz/2024', '05/01-2024', 'janeiro', '']
+        self.assertTrue(converter_datas(pd.Series(invalidas)).isna().all())
+
+    def test_rejeicoes_no_upload(self):
+        df = gerar_dataframe(10)
+        df.loc[3, 'valor'] = '1,234'
+        df.loc[7, 'data'] = '31/02/2024'
+        resultado = ingerir_csv(arquivo_csv(df))
+        self.assertEqual(resultado['rejeitados']['por_campo'], {'valor': 1, 'data': 1})
+        self.assertEqual([(e['linha'], e['campo']) for e in resultado['rejeitados']['exemplos']], [(4, 'valor'), (8, 'data')])
+        self.assertEqual(FinancialRecord.objects.filter(valor_normalizado__isnull=True).count(), 1)
+
+
+class ReimportacaoTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='dono', password='senha-teste')
+        self.df = gerar_dataframe(300)
+
+    def test_reimportar_o_mesmo_arquivo(self):
+        primeiro = ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        segundo = ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        self.assertEqual((primeiro['inseridos'], primeiro['arquivo_repetido']), (300, False))
+        self.assertEqual(
+            (segundo['inseridos'], segundo['atualizados'], segundo['ignorados'], segundo['arquivo_repetido']),
+            (0, 0, 300, True)
+        )
+        self.assertEqual(FinancialRecord.objects.filter(owner=self.owner).count(), 300)
+
+    def test_reimportar_com_alteracoes(self):
+        ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        alterado = pd.concat([self.df, gerar_dataframe(5, semente=1)], ignore_index=True)
+        alterado.loc[:9, 'categoria'] = 'Recategorizado'
+        resultado = ingerir_csv(arquivo_csv(alterado), owner=self.owner)
+        self.assertEqual((resultado['inseridos'], resultado['atualizados'], resultado['ignorados']), (5, 10, 290))
+        self.assertEqual(FinancialRecord.objects.filter(owner=self.owner, categoria='Recategorizado').count(), 10)
+
+    def test_linhas_repetidas_no_arquivo(self):
+        # Duas linhas idênticas no mesmo CSV são dois lançamentos, também ao reimportar
+        df = pd.concat([self.df.head(20), self.df.head(20)], ignore_index=True)
+        self.assertEqual(ingerir_csv(arquivo_csv(df), owner=self.owner)['inseridos'], 40)
+        self.assertEqual(ingerir_csv(arquivo_csv(df), owner=self.owner)['ignorados'], 40)
+
+    def test_donos_diferentes_nao_compartilham_registros(self):
+        outro = User.objects.create_user(username='outro', password='senha-teste')
+        ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        self.assertEqual(ingerir_csv(arquivo_csv(self.df), owner=outro)['inseridos'], 300)
+
+
+class RollupTests(TestCase):
+    """O rollup mantido incrementalmente deve ser igual ao recalculado do zero por `reconstruir`."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='dono', password='senha-teste')
+        self.df = gerar_dataframe(400)
+
+    def assertRollupConsistente(self):
+        incremental = estado_rollup()
+        rollup.reconstruir()
+        self.assertEqual(incremental, estado_rollup())
+
+    def test_upload(self):
+        ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        ingerir_csv(arquivo_csv(gerar_dataframe(50, semente=2)))
+        self.assertRollupConsistente()
+
+    def test_recategorizacao(self):
+        ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        alterado = self.df.copy()
+        alterado.loc[::7, 'categoria'] = 'Outra categoria'
+        self.assertGreater(ingerir_csv(arquivo_csv(alterado), owner=self.owner)['atualizados'], 0)
+        self.assertRollupConsistente()
+
+    def test_exclusao_por_periodo(self):
+        ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        registros = exclusao.registros_do_escopo(self.owner, de=date(2022, 1, 1), ate=date(2023, 6, 30))
+        quantidade = registros.count()
+        resultado = exclusao.excluir_em_lotes(registros, self.owner, tamanho_lote=30)
+        self.assertEqual(resultado['removidos'], quantidade)
+        self.assertRollupConsistente()
+
+    def test_exclusao_por_lote(self):
+        primeiro = ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+        ingerir_csv(arquivo_csv(gerar_dataframe(100, semente=3)), owner=self.owner)
+        exclusao.excluir_em_lotes(exclusao.registros_do_escopo(self.owner, lote=primeiro['lote_upload']), self.owner)
+        self.assertEqual(FinancialRecord.objects.filter(owner=self.owner).count(), 100)
+        self.assertRollupConsistente()
+
+    def test_linhas_gravadas_por_outro_upload_durante_a_ingestao(self):
+        # Outro upload grava parte das mesmas linhas entre a consulta das existentes e a inserção
+        classificar = ingestion._classificar
+        for categoria, atualizados in ((None, 0), ('Recategorizado', 10)):
+            with self.subTest(categoria=categoria):
+                FinancialRecord.objects.all().delete()
+                rollup.reconstruir()
+                concorrente = self.df.head(10).copy()
+                if categoria:
+                    concorrente['categoria'] = categoria
+                chamadas = []
+
+                def classificar_antes_do_outro_upload(linhas):
+                    resultado = classificar(linhas)
+                    if not chamadas:
+                        chamadas.append(linhas)
+                        ingerir_csv(arquivo_csv(concorrente), owner=self.owner)
+                    return resultado
+
+                with mock.patch.object(ingestion, '_classificar', classificar_antes_do_outro_upload):
+                    resultado = ingerir_csv(arquivo_csv(self.df), owner=self.owner)
+                self.assertEqual(
+                    (resultado['inseridos'], resultado['atualizados'], resultado['ignorados']),
+                    (390, atualizados, 10 - atualizados)
+                )
+                self.assertEqual(FinancialRecord.objects.filter(owner=self.owner).count(), 400)
+                self.assertRollupConsistente()
+
+    def test_grupo_unico_mesmo_sem_dono_e_sem_data(self):
+        for owner, mes in ((self.owner, date(2024, 1, 1)), (None, None)):
+            with self.subTest(owner=owner, mes=mes):
+                grupo = {'owner': owner, 'mes': mes, 'tipo_normalizado': 'despesa', 'categoria': 'Impostos'}
+                FinancialRollup.objects.create(**grupo, total=1, quantidade=1, primeiro=1)
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    FinancialRollup.objects.create(**grupo, total=2, quantidade=1, primeiro=2)
+
+    def test_grupo_criado_por_outra_ingestao(self):
+        # Outra ingestão cria o grupo depois da leitura (com bloqueio) das linhas existentes
+        bloquear_existentes = rollup._bloquear_existentes
+        for owner, mes in ((self.owner, date(2030, 1, 1)), (None, None)):
+            with self.subTest(owner=owner, mes=mes):
+                acumulador = rollup.AcumuladorRollup(owner)
+                acumulador.grupos = {(mes, 'despesa', 'Nova'): [1000, 2, 500]}
+
+                def ler_antes_da_outra_ingestao(owner):
+                    existentes = bloquear_existentes(owner)
+                    if not FinancialRollup.objects.filter(owner=owner, mes=mes, categoria='Nova').exists():
+                        FinancialRollup.objects.create(
+                            owner=owner, mes=mes, tipo_normalizado='despesa', categoria='Nova',
+                            total=5, quantidade=1, primeiro=700
+                        )
+                    return existentes
+
+                with mock.patch.object(rollup, '_bloquear_existentes', ler_antes_da_outra_ingestao):
+                    acumulador.aplicar()
+                linha = FinancialRollup.objects.get(owner=owner, mes=mes, categoria='Nova')
+                self.assertEqual((linha.total, linha.quantidade, linha.primeiro), (15, 3, 500))
+
+
+def dashboard_antigo(registros):
+    # Cálculo das views de dashboard antes do rollup (leitura linha a linha dos textos gravados)
+    def parse_valor(valor):
+        try:
+            return float(str(valor).replace('.', '').replace(',', '.'))
+        except ValueError:
+            return 0.0
+
+    receitas = [r for r in registros if r.tipo.lower() == 'receita']
+    gastos = [r for r in registros if r.tipo.lower() != 'receita']
+    total_receita = sum(parse_valor(r.valor) for r in receitas if r.valor)
+    total_gastos = sum(parse_valor(r.valor) for r in gastos if r.valor)
+    lucro_liquido = total_receita - total_gastos
+    margem_lucro = (lucro_liquido / total_receita * 100) if total_receita else 0.0
+    meses = {}
+    for r in registros:
+        dia, mes, ano = r.data.split('/')
+        totais = meses.setdefault(f'{ano}-{mes.zfill(2)}', {'receita': 0.0, 'despesa': 0.0})
+        totais['receita' if r.tipo.strip().lower() == 'receita' else 'despesa'] += parse_valor(r.valor)
+    meses = sorted(meses.items())
+    categorias = {}
+    for d in gastos:
+        categorias[d.categoria or 'Outros'] = categorias.get(d.categoria or 'Outros', 0.0) + parse_valor(d.valor)
+    contagem = Counter(g.categoria or 'Outro' for g in gastos)
+    return {
+        'indicadores': {
+            'receita': round(total_receita, 2),
+            'gastos': round(total_gastos, 2),
+            'lucro_liquido': round(lucro_liquido, 2),
+            'margem_lucro': round(margem_lucro, 2)
+        },
+        'tendencias': {
+            'labels': [k for k, v in meses],
+            'receitas': [round(v['receita'], 2) for k, v in meses],
+            'despesas': [round(v['despesa'], 2) for k, v in meses]
+        },
+        'distribuicao_despesas': {'labels': list(categorias.keys()), 'valores': [round(v, 2) for v in categorias.values()]},
+        'percentual_tipos_despesa': {cat: round((qtd / len(gastos)) * 100, 2) for cat, qtd in contagem.items()},
+        'fluxo_caixa': {
+            'labels': [k for k, v in meses],
+            'fluxo_caixa': [round(v['receita'] - v['despesa'], 2) for k, v in meses]
+        },
+    }
+
+
+class DashboardTests(TestCase):
+    """Os endpoints de dashboard devolvem os mesmos bytes que as views antigas, linha a linha."""
+
+    URLS = {
+        'indicadores': '/users/financial-indicators/',
+        'tendencias': '/users/financial-trends/',
+        'distribuicao_despesas': '/users/expense-distribution/',
+        'percentual_tipos_despesa': '/users/expense-type-percentage/',
+        'fluxo_caixa': '/users/cash-flow/',
+    }
+
+    def setUp(self):
+        # A versão dos dados volta a 0 a cada teste: respostas de outro teste estariam com a mesma chave
+        cache.clear()
+        self.addCleanup(cache.clear)
+        df = gerar_dataframe(3000)
+        df.loc[::97, 'categoria'] = ''
+        ingerir_csv(arquivo_csv(df))
+        self.esperado = dashboard_antigo(list(FinancialRecord.objects.order_by('id')))
+
+    def test_endpoints_iguais_as_views_antigas(self):
+        for secao, url in self.URLS.items():
+            with self.subTest(secao=secao):
+                self.assertEqual(self.client.get(url).content, JSONRenderer().render(self.esperado[secao]))
+
+    def test_dashboard_combinado(self):
+        with self.assertNumQueries(1):
+            secoes = analytics.dashboard(FinancialRollup.objects.filter(owner=None))
+        self.assertEqual(JSONRenderer().render(secoes), JSONRenderer().render(self.esperado))
+        self.assertEqual(self.client.get('/users/dashboard/').content, JSONRenderer().render(self.esperado))
+
+    def test_dashboard_com_secoes(self):
+        resposta = self.client.get('/users/dashboard/', {'secoes': 'fluxo_caixa, indicadores'})
+        self.assertEqual(
+            resposta.content,
+            JSONRenderer().render({'fluxo_caixa': self.esperado['fluxo_caixa'], 'indicadores': self.esperado['indicadores']})
+        )
+        resposta = self.client.get('/users/dashboard/', {'secoes': 'indicadores,graficos'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('graficos', resposta.json()['error'])
+
+    def test_sem_registros(self):
+        exclusao.excluir_tudo(None)
+        vazio = dashboard_antigo([])
+        for secao, url in self.URLS.items():
+            with self.subTest(secao=secao):
+                self.assertEqual(self.client.get(url).content, JSONRenderer().render(vazio[secao]))
+
+
+class RenormalizacaoTests(TestCase):
+    """Migração 0017: registros gravados com a conversão antiga voltam a bater com os uploads novos."""
+
+    def test_reupload_depois_da_migracao_nao_duplica(self):
+        owner = User.objects.create_user(username='dono', password='senha-teste')
+        df = gerar_dataframe(200)
+        df.loc[:3, 'valor'] = ['(10,00)', 'R$ 1.234,56', '1234.56', '10,00-']
+        df.loc[4:5, 'data'] = ['05/jan/2024', '2024.03.01']
+        ingerir_csv(arquivo_csv(df), owner=owner)
+        esperado = list(FinancialRecord.objects.order_by('id').values_list(
+            'valor_normalizado', 'data_normalizada', 'tipo_normalizado', 'impressao'
+        ))
+        rollup_esperado = estado_rollup()
+        # Como a conversão antiga deixava esses registros: sem valor/data e com outra impressão
+        FinancialRecord.objects.filter(id__in=FinancialRecord.objects.order_by('id').values('id')[:6]).update(
+            valor_normalizado=None, data_normalizada=None
+        )
+        FinancialRecord.objects.update(impressao=Concat(F('descricao'), F('id')))
+        FinancialRollup.objects.all().delete()
+
+        migracao = importlib.import_module('users.migrations.0017_renormalizar_registros')
+        editor = connection.schema_editor()
+        for operacao in (migracao.renormalizar, migracao.reconstruir_rollup, migracao.invalidar_caches):
+            operacao(apps, editor)
+
+        self.assertEqual(esperado, list(FinancialRecord.objects.order_by('id').values_list(
+            'valor_normalizado', 'data_normalizada', 'tipo_normalizado', 'impressao'
+        )))
+        self.assertEqual(rollup_esperado, estado_rollup())
+        resultado = ingerir_csv(arquivo_csv(pd.concat([df, gerar_dataframe(1, semente=9)])), owner=owner)
+        self.assertEqual((resultado['inseridos'], resultado['ignorados']), (1, 200))
+
+
+class VectorstoreTests(TestCase):
+    """Indexação, deduplicação por conteúdo e busca do RAG com o modelo de embedding local."""
+
+    def setUp(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        configuracoes = override_settings(EMBEDDING_BACKEND='fake', VECTORSTORE_DIR=diretorio)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+        embeddings_compartilhados.cache_clear()
+        self.addCleanup(embeddings_compartilhados.cache_clear)
+        self.df = gerar_dataframe(200)
+
+    def indexar(self, df, chave=chave_conversa(None, 'conversa-teste')):
+        return ingerir_csv(arquivo_csv(df), indexador=IndexadorVectorstore(chave))['vectorstore']
+
+    def test_indexacao(self):
+        resultado = self.indexar(self.df)
+        self.assertNotIn('erro', resultado)
+        self.assertEqual((resultado['documentos_novos'], resultado['documentos_total']), (200, 200))
+        self.assertEqual(carregar_vectorstore(chave_conversa(None, 'conversa-teste')).index.ntotal, 200)
+
+    @override_settings(EMBEDDING_BATCH_SIZE=16, EMBEDDING_MAX_CONCURRENCY=2)
+    def test_embeddings_em_blocos_depois_do_commit(self):
+        indexador = IndexadorVectorstore(chave_conversa(None, 'conversa-teste'))
+        blocos = []
+        embutir = indexador.embeddings.embed_documents
+        with mock.patch.object(
+            indexador.embeddings, 'embed_documents', side_effect=lambda textos: blocos.append(len(textos)) or embutir(textos)
+        ):
+            ingerir_csv(arquivo_csv(self.df), tamanho_chunk=50, indexador=indexador)
+        # O arquivo temporário com os textos pendentes é fechado no fim
+        self.assertIsNone(indexador.pendentes)
+        self.assertEqual(blocos, [32] * 6 + [8])
+
+    def test_reupload_nao_duplica_documentos(self):
+        self.indexar(self.df)
+        alterado = self.df.copy()
+        alterado.loc[0, 'status'] = 'Pendente'
+        resultado = self.indexar(alterado)
+        self.assertEqual(
+            (resultado['documentos_novos'], resultado['documentos_ignorados'], resultado['documentos_total']),
+            (1, 199, 201)
+        )
+
+    def test_busca_rag(self):
+        self.indexar(self.df)
+        vectorstore = carregar_vectorstore(chave_conversa(None, 'conversa-teste'))
+        documento = vectorstore.docstore.search(vectorstore.index_to_docstore_id[42]).page_content
+        consulta = preparar_consulta('conversa-teste', None, documento, usar_cache=False, k=1)
+        self.assertEqual(consulta['contextos'], [documento])
+
+    def test_busca_sem_vectorstore(self):
+        consulta = preparar_consulta('sem-vectorstore', None, 'Quanto gastei?', usar_cache=False)
+        self.assertEqual(consulta['contextos'], [])
+
+    def test_vectorstore_de_outro_dono(self):
+        dona = User.objects.create_user(username='dona', password='senha-teste')
+        self.indexar(self.df, chave_conversa(dona, 'conversa-teste'))
+        outro = User.objects.create_user(username='outro', password='senha-teste')
+        for user in (outro, None):
+            consulta = preparar_consulta('conversa-teste', user, 'Quanto gastei?', usar_cache=False)
+            self.assertEqual(consulta['contextos'], [])
+        self.assertEqual(len(preparar_consulta('conversa-teste', dona, 'Quanto gastei?', usar_cache=False)['contextos']), 3)
+
+    def test_leitura_durante_a_gravacao(self):
+        self.indexar(self.df)
+        caminho = caminho_vectorstore(chave_conversa(None, 'conversa-teste'))
+        lidos = []
+        replace = os.replace
+
+        def ler_antes_e_depois(origem, destino):
+            # Outro processo carregando o vectorstore a cada troca de arquivo da gravação
+            lidos.append(vectorstores.carregar(caminho).index.ntotal)
+            replace(origem, destino)
+            lidos.append(vectorstores.carregar(caminho).index.ntotal)
+
+        with mock.patch.object(vectorstores.os, 'replace', ler_antes_e_depois):
+            self.indexar(pd.concat([self.df, gerar_dataframe(50, semente=1)], ignore_index=True))
+        self.assertEqual(lidos, [200, 250])
+
+    def test_indices_antigos_removidos(self):
+        for semente in range(4):
+            self.indexar(gerar_dataframe(20, semente=semente))
+        caminho = caminho_vectorstore(chave_conversa(None, 'conversa-teste'))
+        indices = [nome for nome in os.listdir(caminho) if nome.endswith('.faiss')]
+        self.assertEqual(len(indices), vectorstores.INDICES_MANTIDOS)
+        self.assertEqual(vectorstores.carregar(caminho).index.ntotal, 80)
+
+    def test_vectorstore_no_formato_antigo(self):
+        self.indexar(self.df)
+        caminho = caminho_vectorstore(chave_conversa(None, 'conversa-teste'))
+        arquivo = os.path.join(caminho, vectorstores.ARQUIVO_DOCSTORE)
+        with open(arquivo, encoding='utf-8') as f:
+            sidecar = json.load(f)
+        os.rename(os.path.join(caminho, sidecar.pop('indice')), os.path.join(caminho, vectorstores.ARQUIVO_INDICE))
+        with open(arquivo, 'w', encoding='utf-8') as f:
+            json.dump({**sidecar, 'versao': 1}, f)
+        self.assertEqual(vectorstores.carregar(caminho).index.ntotal, 200)
+        self.indexar(gerar_dataframe(10, semente=1))
+        self.indexar(gerar_dataframe(10, semente=2))
+        self.assertFalse(os.path.exists(os.path.join(caminho, vectorstores.ARQUIVO_INDICE)))
+        self.assertEqual(vectorstores.carregar(caminho).index.ntotal, 220)
+
+    def test_cache_conta_os_vetores(self):
+        self.indexar(self.df)
+        caminho = caminho_vectorstore(chave_conversa(None, 'conversa-teste'))
+        sidecar = os.path.getsize(os.path.join(caminho, vectorstores.ARQUIVO_DOCSTORE))
+        vetores = 200 * vectorstores.carregar(caminho).index.d * 4
+        cache_grande = vectorstores.VectorstoreCache(max_bytes=10 ** 9)
+        cache_grande.obter(caminho, vectorstores.carregar)
+        self.assertEqual(cache_grande.estatisticas()['bytes'], sidecar + vetores)
+        # Cabe o sidecar, mas não os vetores
+        cache_pequeno = vectorstores.VectorstoreCache(max_bytes=sidecar + vetores - 1)
+        cache_pequeno.obter(caminho, vectorstores.carregar)
+        self.assertEqual(cache_pequeno.estatisticas()['itens'], 0)
+
+    def test_escrita_espera_o_lock_de_outro_processo(self):
+        chave = chave_conversa(None, 'conversa-teste')
+        entrou = threading.Event()
+
+        def gravar():
+            with vectorstores.bloqueio_escrita(chave):
+                entrou.set()
+
+        # Outra descrição de arquivo, como a de outro processo, com o flock do vectorstore
+        with open(caminho_vectorstore(chave) + '.lock', 'a') as arquivo:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            thread = threading.Thread(target=gravar)
+            thread.start()
+            self.assertFalse(entrou.wait(0.2))
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+        self.assertTrue(entrou.wait(5))
+        thread.join()
+
+
+def autenticado(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+
+class DonoDaConversaTests(LLMFalsoMixin, TransactionTestCase):
+    """Uma conversa (e o vectorstore dela) só é usada pelo usuário que a criou."""
+
+    def setUp(self):
+        super().setUp()
+        self.dona = User.objects.create_user(username='dona', password='senha-teste')
+        self.outro = User.objects.create_user(username='outro', password='senha-teste')
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        configuracoes = override_settings(VECTORSTORE_DIR=diretorio, INGESTAO_DIR=diretorio)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+
+    def perguntar(self, credenciais, conversation_id='conversa-da-dona'):
+        return self.client.post(
+            '/users/financial-agent/', {'question': 'Quanto gastei?', 'conversation_id': conversation_id},
+            content_type='application/json', **credenciais
+        )
+
+    def test_agente_nao_usa_conversa_de_outro_usuario(self):
+        self.assertEqual(self.perguntar(autenticado(self.dona)).status_code, 200)
+        self.assertEqual(self.perguntar(autenticado(self.outro)).status_code, 404)
+        self.assertEqual(self.perguntar({}).status_code, 404)
+        conversa = Conversation.objects.get(conversation_id='conversa-da-dona')
+        self.assertEqual(conversa.user, self.dona)
+        self.assertEqual(Message.objects.filter(conversation=conversa).count(), 2)
+
+    def test_conversa_anonima_nao_e_usada_com_login(self):
+        self.assertEqual(self.perguntar({}, 'conversa-anonima').status_code, 200)
+        self.assertEqual(self.perguntar(autenticado(self.outro), 'conversa-anonima').status_code, 404)
+
+    def test_upload_nao_grava_na_conversa_de_outro_usuario(self):
+        self.perguntar(autenticado(self.dona))
+        arquivo = SimpleUploadedFile('extrato.csv', arquivo_csv(gerar_dataframe(5)).getvalue(), 'text/csv')
+        with mock.patch.object(tarefas, 'enfileirar'):
+            resposta = self.client.post(
+                '/users/upload-csv-vectorstore/', {'file': arquivo, 'conversation_id': 'conversa-da-dona'},
+                **autenticado(self.outro)
+            )
+            self.assertEqual(resposta.status_code, 404)
+            arquivo.seek(0)
+            resposta = self.client.post(
+                '/users/upload-csv-vectorstore/', {'file': arquivo, 'conversation_id': 'conversa-da-dona'},
+                **autenticado(self.dona)
+            )
+        self.assertEqual(resposta.status_code, 202)
+        job = UploadJob.objects.get()
+        self.assertEqual((job.owner, job.chave_vectorstore), (self.dona, chave_conversa(self.dona, 'conversa-da-dona')))
+
+
+class JobsExpiradosTests(TestCase):
+
+    def setUp(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        configuracoes = override_settings(INGESTAO_DIR=diretorio, INGESTAO_JOB_EXPIRACAO=60, INGESTAO_PROGRESSO_INTERVALO=0.05)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+        self.job = tarefas.criar_job(SimpleUploadedFile('extrato.csv', b'Data,Valor (R$)\n'))
+        antigo = timezone.now() - timedelta(minutes=5)
+        UploadJob.objects.filter(pk=self.job.pk).update(status=UploadJob.PROCESSANDO, atualizado_em=antigo)
+        os.utime(tarefas.caminho_arquivo(self.job.pk), (antigo.timestamp(), antigo.timestamp()))
+
+    def test_job_sem_sinal_de_vida_volta_para_a_fila(self):
+        self.assertEqual(tarefas.recuperar_expirados(), 1)
+        self.assertEqual(UploadJob.objects.get(pk=self.job.pk).status, UploadJob.PENDENTE)
+
+    def test_relator_renova_o_sinal_de_vida_sem_progresso(self):
+        relator = tarefas.RelatorProgresso(self.job.pk)
+        time.sleep(0.2)
+        relator.parar()
+        self.assertEqual(tarefas.recuperar_expirados(), 0)
+        self.assertEqual(UploadJob.objects.get(pk=self.job.pk).status, UploadJob.PROCESSANDO)
+
+    @override_settings(INGESTAO_RECUPERACAO_INTERVALO=0)
+    def test_worker_devolve_expirados_a_fila_enquanto_roda(self):
+        outro = tarefas.criar_job(SimpleUploadedFile('outro.csv', b'Data,Valor (R$)\n'))
+
+        def executar(job):
+            # Enquanto o worker processa um job, o outro fica sem sinal de vida (worker que caiu)
+            if job.pk == self.job.pk:
+                antigo = timezone.now() - timedelta(minutes=5)
+                UploadJob.objects.filter(pk=outro.pk).update(status=UploadJob.PROCESSANDO, atualizado_em=antigo)
+                os.utime(tarefas.caminho_arquivo(outro.pk), (antigo.timestamp(), antigo.timestamp()))
+
+        with (
+            mock.patch.object(tarefas, 'executar', side_effect=executar) as executados,
+            mock.patch.object(tarefas.connections, 'close_all'),
+        ):
+            tarefas.rodar_worker(0, threading.Event(), uma_vez=True)
+        self.assertEqual([chamada.args[0].pk for chamada in executados.call_args_list], [self.job.pk, outro.pk])
+
+
+class VersaoDadosTests(TestCase):
+
+    @override_settings(CACHE_BACKEND='memoria')
+    def test_cache_em_memoria_nao_guarda_a_versao(self):
+        # Outro processo guardou a versão no seu cache e não vê a invalidação deste
+        cache.set(versoes._chave_cache('anon'), 0)
+        versoes.incrementar_versao('anon')
+        self.assertEqual(versoes.versao_em_cache('anon'), 1)
+
+    @override_settings(CACHE_BACKEND='arquivo')
+    def test_leitura_antes_de_um_incremento(self):
+        # A leitura pega a versão antiga no banco e o incremento termina antes de ela ir para o cache
+        cache.delete(versoes._chave_cache('anon'))
+        versao_dados = versoes.versao_dados
+
+        def ler_durante_incremento(escopo):
+            versao = versao_dados(escopo)
+            with mock.patch.object(versoes, 'versao_dados', versao_dados), self.captureOnCommitCallbacks(execute=True):
+                versoes.incrementar_versao(escopo)
+            return versao
+
+        with mock.patch.object(versoes, 'versao_dados', ler_durante_incremento):
+            self.assertEqual(versoes.versao_em_cache('anon'), 0)
+        self.assertEqual(versoes.versao_em_cache('anon'), 1)
+
+    @override_settings(CACHE_BACKEND='arquivo')
+    def test_incremento_atualiza_o_cache(self):
+        cache.delete_many([versoes._chave_cache('anon'), versoes._chave_cache('user_1')])
+        self.assertEqual(versoes.versao_em_cache('anon'), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            versoes.incrementar_versao('anon')
+            versoes.incrementar_versao('user_1')
+        with self.captureOnCommitCallbacks(execute=True):
+            versoes.incrementar_todas()
+        with self.assertNumQueries(0):
+            self.assertEqual((versoes.versao_em_cache('anon'), versoes.versao_em_cache('user_1')), (2, 2))
+
+
+class ClientesLLMTests(LLMFalsoMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registro = RegistroClientes()
+        self.addCleanup(self.registro.fechar)
+
+    def test_um_pool_para_todos_os_event_loops(self):
+        # Sob WSGI cada requisição assíncrona roda num event loop novo
+        for _ in range(20):
+            self.assertEqual(asyncio.run(self.registro.llm('agente').ainvoke('Qual foi meu lucro?')), self.resposta_llm)
+        self.assertEqual(self.servidor.requisicoes, 20)
+        self.assertEqual(len(self.servidor.conexoes), 1)
+
+    @override_settings(LLM_MAX_CONCURRENCY=2)
+    def test_limite_de_chamadas_vale_para_o_processo(self):
+        self.registro = RegistroClientes()
+        self.addCleanup(self.registro.fechar)
+        self.servidor.latencia = 0.05
+
+        async def varias():
+            llm = self.registro.llm('agente')
+            await asyncio.gather(*(llm.ainvoke('Qual foi meu lucro?') for _ in range(3)))
+
+        threads = [threading.Thread(target=asyncio.run, args=(varias(),)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.servidor.requisicoes, 9)
+        self.assertLessEqual(self.servidor.max_em_andamento, 2)
+
+    def test_stream_em_outro_event_loop(self):
+        async def ler():
+            return [token async for token in self.registro.llm('agente').astream('Qual foi meu lucro?')]
+
+        self.assertEqual(''.join(asyncio.run(ler())), self.resposta_llm)
+
+    def test_agente_sob_wsgi_reaproveita_a_conexao(self):
+        cliente = Client()
+        for i in range(15):
+            resposta = cliente.post(
+                '/users/financial-agent/', {'question': f'Quanto gastei no dia {i}?'}, content_type='application/json'
+            )
+            self.assertEqual(resposta.json()['resposta'], self.resposta_llm)
+        self.assertEqual(self.servidor.requisicoes, 15)
+        self.assertEqual(len(self.servidor.conexoes), 1)
+
+
+async def eventos_sse(resposta):
+    # Corpo de uma resposta text/event-stream -> lista de (evento, dados)
+    corpo = b''.join([parte async for parte in resposta.streaming_content]).decode('utf-8')
+    eventos = []
+    for bloco in corpo.strip().split('\n\n'):
+        campos = dict(linha.split(': ', 1) for linha in bloco.split('\n'))
+        eventos.append((campos.get('event', 'message'), json.loads(campos['data'])))
+    return eventos
+
+
+class AgenteStreamingTests(LLMFalsoMixin, TransactionTestCase):
+    # Sem resposta fixa o servidor falso gera 'palavra0 ', 'palavra1 ', ... um por evento
+    resposta_llm = None
+
+    def setUp(self):
+        super().setUp()
+        self.servidor.tokens = 5
+
+    async def test_tokens_em_eventos_e_mensagens_gravadas_no_fim(self):
+        resposta = await self.async_client.post(
+            '/users/financial-agent/', {'question': 'Qual foi meu lucro?', 'stream': True}, content_type='application/json'
+        )
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream; charset=utf-8')
+        eventos = await eventos_sse(resposta)
+        inicio, fim = eventos[0], eventos[-1]
+        conversation_id = inicio[1]['conversation_id']
+        self.assertEqual(inicio[0], 'inicio')
+        self.assertEqual([dados['token'] for _, dados in eventos[1:-1]], [f'palavra{i} ' for i in range(5)])
+        texto = ''.join(f'palavra{i} ' for i in range(5))
+        self.assertEqual(fim, ('fim', {'resposta': texto, 'conversation_id': conversation_id}))
+        mensagens = Message.objects.filter(conversation__conversation_id=conversation_id).order_by('id')
+        self.assertEqual(
+            [m async for m in mensagens.values_list('sender', 'text')], [('user', 'Qual foi meu lucro?'), ('agent', texto)]
+        )
+
+    async def test_accept_event_stream(self):
+        resposta = await self.async_client.post(
+            '/users/financial-agent/', {'question': 'Qual foi meu lucro?'}, content_type='application/json',
+            headers={'Accept': 'text/event-stream'}
+        )
+        self.assertEqual((await eventos_sse(resposta))[-1][0], 'fim')
+
+    def test_sem_stream_resposta_inteira(self):
+        resposta = self.client.post('/users/financial-agent/', {'question': 'Qual foi meu lucro?'}, content_type='application/json')
+        self.assertEqual(resposta.json()['resposta'], ''.join(f'palavra{i} ' for i in range(5)))
+
+
+class SaudeFinanceiraTests(LLMFalsoMixin, TransactionTestCase):
+    resposta_llm = json.dumps({
+        'indice': 72, 'label': 'Bom', 'analise': 'As receitas cobrem as despesas.',
+        'pontos_fortes': ['Receita estável', 'Poucas dívidas', 'Terceira frase'], 'melhorias': ['Reduzir custos'], 'nota': 70,
+    })
+    ENDPOINTS = {
+        '/users/indice-saude/': {'indice': 72, 'label': 'Bom'},
+        '/users/analise-saude/': {'analise': 'As receitas cobrem as despesas.'},
+        '/users/pontos-fortes/': {'pontos_fortes': ['Receita estável', 'Poucas dívidas']},
+        '/users/pontos-fracos/': {'melhorias': ['Reduzir custos']},
+        '/users/nota-saude/': {'nota': 70},
+    }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_uma_chamada_para_os_cinco_endpoints(self):
+        for url, esperado in self.ENDPOINTS.items():
+            self.assertEqual(self.client.get(url).json(), esperado)
+        self.assertEqual(self.servidor.requisicoes, 1)
+
+    def test_nova_analise_quando_os_dados_mudam(self):
+        self.client.get('/users/nota-saude/')
+        self.client.get('/users/nota-saude/')
+        ingerir_csv(arquivo_csv(gerar_dataframe(20)))
+        self.client.get('/users/nota-saude/')
+        self.assertEqual(self.servidor.requisicoes, 2)
+        self.assertIn('Maiores receitas por categoria: Vendas', self.servidor.prompts[-1])
+
+    def test_analise_por_usuario(self):
+        user = User.objects.create_user(username='dono', password='senha-teste')
+        self.client.get('/users/nota-saude/')
+        self.client.get('/users/nota-saude/', **autenticado(user))
+        self.assertEqual(self.servidor.requisicoes, 2)
+
+    def test_requisicoes_simultaneas_esperam_a_mesma_chamada(self):
+        self.servidor.latencia = 0.3
+        respostas = {}
+
+        def pedir(url):
+            respostas[url] = Client().get(url).json()
+
+        threads = [threading.Thread(target=pedir, args=(url,)) for url in self.ENDPOINTS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(respostas, self.ENDPOINTS)
+        self.assertEqual(self.servidor.requisicoes, 1)
+
+    def test_chamada_assincrona_ao_llm(self):
+        with mock.patch('users.clientes.LLMLimitado.invoke', side_effect=AssertionError('invoke bloqueante')):
+            self.assertEqual(self.client.get('/users/nota-saude/').json(), {'nota': 70})
+        self.assertEqual(self.servidor.requisicoes, 1)
+
+    async def test_requisicao_cancelada_nao_cancela_a_analise(self):
+        self.servidor.latencia = 0.3
+        primeira = asyncio.ensure_future(self.async_client.get('/users/nota-saude/'))
+        for _ in range(100):
+            if self.servidor.requisicoes:
+                break
+            await asyncio.sleep(0.01)
+        primeira.cancel()
+        resposta = await self.async_client.get('/users/nota-saude/')
+        self.assertEqual(resposta.json(), {'nota': 70})
+        self.assertEqual(self.servidor.requisicoes, 1)
+
+
+@override_settings(HISTORICO_MAX_MENSAGENS=4, HISTORICO_RESUMIR_A_CADA=2, HISTORICO_MAX_TOKENS=1500)
+class HistoricoTests(LLMFalsoMixin, TransactionTestCase):
+    resposta_llm = 'Resumo: o usuário perguntou sobre os gastos.'
+
+    def perguntar(self, pergunta, conversation_id='conversa-longa'):
+        resposta = self.client.post(
+            '/users/financial-agent/', {'question': pergunta, 'conversation_id': conversation_id}, content_type='application/json'
+        )
+        self.assertEqual(resposta.status_code, 200)
+
+    def prompts(self, marcador):
+        return [prompt for prompt in self.servidor.prompts if marcador in prompt]
+
+    def test_mensagens_antigas_entram_no_resumo(self):
+        for i in range(8):
+            self.perguntar(f'Pergunta número {i}?')
+        conversa = Conversation.objects.get(conversation_id='conversa-longa')
+        self.assertEqual(conversa.resumo, self.resposta_llm)
+        fora_do_resumo = Message.objects.filter(conversation=conversa, id__gt=conversa.resumo_ate).count()
+        self.assertLessEqual(fora_do_resumo, 4 + 2 * 2)
+        # Cada pedido de resumo leva só as mensagens que saíram da janela, em lotes de 2 a 4
+        resumos = self.prompts('Novo resumo:')
+        self.assertTrue(resumos)
+        self.assertIn('Pergunta número 0?', resumos[0])
+        ultimo = self.prompts('Pergunta: Pergunta número 7?')[0]
+        self.assertIn('Resumo da conversa até aqui:\n' + self.resposta_llm, ultimo)
+        self.assertNotIn('Pergunta número 0?', ultimo)
+        self.assertIn('Usuário: Pergunta número 6?', ultimo)
+
+    def test_toda_mensagem_no_prompt_ou_no_resumo(self):
+        for i in range(10):
+            self.perguntar(f'Pergunta número {i}?')
+        conversa = Conversation.objects.get(conversation_id='conversa-longa')
+        resumidas = '\n'.join(self.prompts('Novo resumo:'))
+        ultimo = self.prompts('Pergunta: Pergunta número 9?')[0]
+        for i in range(9):
+            with self.subTest(pergunta=i):
+                self.assertTrue(f'Pergunta número {i}?' in resumidas or f'Usuário: Pergunta número {i}?' in ultimo)
+        self.assertGreater(conversa.resumo_ate, 0)
+
+    @override_settings(HISTORICO_MAX_TOKENS=50)
+    def test_mensagem_longa_resumida_no_mesmo_turno(self):
+        self.perguntar('Quanto gastei? ' + 'detalhe ' * 200)
+        conversa = Conversation.objects.get(conversation_id='conversa-longa')
+        self.assertEqual(conversa.resumo, self.resposta_llm)
+        self.perguntar('E em janeiro?')
+        ultimo = self.prompts('Pergunta: E em janeiro?')[0]
+        historico = ultimo.split('Histórico da conversa:\n', 1)[1].split('\n\nPergunta:', 1)[0]
+        self.assertLessEqual(len(historico), 50 * 4)
+
+
+class CacheRespostasTests(TestCase):
+
+    def setUp(self):
+        self.cache = CacheRespostas(max_itens=3, ttl=60, similaridade=0.98)
+
+    def test_pergunta_igual_e_parecida(self):
+        self.cache.guardar('user_1:1:-', 'qual foi meu lucro', [1.0, 0.0], 'Lucro de R$ 10.')
+        self.assertEqual(self.cache.buscar_exato('user_1:1:-', 'qual foi meu lucro'), 'Lucro de R$ 10.')
+        self.assertEqual(self.cache.buscar_similar('user_1:1:-', 'qual o meu lucro', [0.99, 0.01]), 'Lucro de R$ 10.')
+        self.assertIsNone(self.cache.buscar_similar('user_1:1:-', 'quanto gastei', [0.0, 1.0]))
+        estatisticas = self.cache.estatisticas()
+        self.assertEqual((estatisticas['hits_exatos'], estatisticas['hits_semanticos'], estatisticas['misses']), (1, 1, 1))
+
+    def test_numeros_e_meses_diferentes_nao_reaproveitam(self):
+        self.cache.guardar('anon:1:-', 'quanto gastei em janeiro de 2024', [1.0, 0.0], 'R$ 5.')
+        self.assertIsNone(self.cache.buscar_similar('anon:1:-', 'quanto gastei em fevereiro de 2024', [1.0, 0.0]))
+        self.assertIsNone(self.cache.buscar_similar('anon:1:-', 'quanto gastei em janeiro de 2023', [1.0, 0.0]))
+        self.assertEqual(self.cache.buscar_similar('anon:1:-', 'quanto eu gastei em jan de 2024', [1.0, 0.0]), 'R$ 5.')
+
+    def test_escopos_separados(self):
+        # Outra versão dos dados (ou outro usuário) não vê as respostas antigas
+        self.cache.guardar('user_1:1:-', 'qual foi meu lucro', [1.0, 0.0], 'Lucro de R$ 10.')
+        self.assertIsNone(self.cache.buscar_exato('user_1:2:-', 'qual foi meu lucro'))
+        self.assertIsNone(self.cache.buscar_exato('user_2:1:-', 'qual foi meu lucro'))
+
+    def test_lru_e_ttl(self):
+        for i in range(3):
+            self.cache.guardar('anon:1:-', f'pergunta {i}', None, f'resposta {i}')
+        self.cache.buscar_exato('anon:1:-', 'pergunta 0')
+        self.cache.guardar('anon:1:-', 'pergunta 3', None, 'resposta 3')
+        self.assertIsNone(self.cache.buscar_exato('anon:1:-', 'pergunta 1'))
+        self.assertEqual(self.cache.buscar_exato('anon:1:-', 'pergunta 0'), 'resposta 0')
+        with mock.patch('users.cache_respostas.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(self.cache.buscar_exato('anon:1:-', 'pergunta 0'))
+        self.assertEqual((self.cache.estatisticas()['evictions'], self.cache.estatisticas()['expirados']), (1, 1))
+
+    def test_normalizar_pergunta(self):
+        self.assertEqual(normalizar_pergunta('  Qual foi  meu LUCRO em Março?'), 'qual foi meu lucro em marco')
+
+
+class CacheRespostasAgenteTests(LLMFalsoMixin, TransactionTestCase):
+
+    def perguntar(self, pergunta):
+        resposta = self.client.post('/users/financial-agent/', {'question': pergunta}, content_type='application/json')
+        self.assertEqual(resposta.json()['resposta'], self.resposta_llm)
+        return resposta['X-Cache']
+
+    def chamadas_llm(self):
+        return sum('Pergunta:' in prompt for prompt in self.servidor.prompts)
+
+    def test_segunda_pergunta_igual_vem_do_cache(self):
+        self.assertEqual(self.perguntar('Qual foi meu lucro?'), 'MISS')
+        self.assertEqual(self.perguntar('qual foi meu LUCRO'), 'HIT')
+        self.assertEqual(self.chamadas_llm(), 1)
+
+    def test_novo_upload_invalida(self):
+        self.perguntar('Qual foi meu lucro?')
+        ingerir_csv(arquivo_csv(gerar_dataframe(20)))
+        self.assertEqual(self.perguntar('Qual foi meu lucro?'), 'MISS')
+        self.assertEqual(self.chamadas_llm(), 2)
+
+
+@mock.patch('users.listagem.TAMANHO_LOTE', 70)
+class ListagemTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user(username='dono', password='senha-teste')
+        # Lotes com o mesmo uploaded_at: a ordem entre eles vem do id
+        popular(250, tamanho_lote=100, owner=self.owner)
+        popular(30, semente=1)
+        self.todos = [listagem.linha(valores) for valores in listagem.registros(self.owner)]
+
+    def get(self, **parametros):
+        return self.client.get('/users/financial-records/', parametros, **autenticado(self.owner))
+
+    def test_paginas_por_cursor(self):
+        vistos, cursor, paginas = [], None, 0
+        while True:
+            resposta = self.get(limite=60, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(resposta.status_code, 200)
+            vistos += resposta.json()
+            paginas += 1
+            cursor = resposta.get('X-Next-Cursor')
+            if cursor is None:
+                self.assertNotIn('Link', resposta)
+                break
+            self.assertIn(f'cursor={cursor}', resposta['Link'])
+        self.assertEqual(paginas, 5)
+        self.assertEqual(vistos, self.todos)
+
+    def test_pagina_nao_muda_com_registros_novos(self):
+        primeira = self.get(limite=100)
+        popular(10, semente=2, owner=self.owner)
+        segunda = self.get(limite=100, cursor=primeira['X-Next-Cursor'])
+        self.assertEqual(segunda.json(), self.todos[100:200])
+
+    def test_parametros_invalidos(self):
+        for parametros in ({'limite': 0}, {'limite': 'dez'}, {'limite': 5000}, {'cursor': 'xyz'}, {'formato': 'xml'}):
+            with self.subTest(**parametros):
+                self.assertEqual(self.get(**parametros).status_code, 400)
+
+    def test_lista_completa_em_streaming(self):
+        resposta = self.get()
+        self.assertEqual(json.loads(b''.join(resposta.streaming_content)), self.todos)
+
+    def test_exportacao_ndjson(self):
+        resposta = self.get(formato='ndjson')
+        self.assertEqual(resposta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        linhas = b''.join(resposta.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(linha) for linha in linhas], self.todos)
+
+    def test_exportacao_csv_a_partir_do_cursor(self):
+        cursor = self.get(limite=100)['X-Next-Cursor']
+        resposta = self.get(formato='csv', cursor=cursor)
+        self.assertIn('attachment', resposta['Content-Disposition'])
+        linhas = list(csv.reader(io.StringIO(b''.join(resposta.streaming_content).decode('utf-8'))))
+        self.assertEqual(linhas[0], listagem.COLUNAS)
+        self.assertEqual(linhas[1:], [list(linha.values()) for linha in self.todos[100:]])
+
+
+class DonoDosRegistrosTests(TestCase):
+    """Listagem, dashboard, exclusão e jobs de upload só enxergam os dados de quem pede."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.dona = User.objects.create_user(username='dona', password='senha-teste')
+        self.outro = User.objects.create_user(username='outro', password='senha-teste')
+        ingerir_csv(arquivo_csv(gerar_dataframe(50)), owner=self.dona)
+        ingerir_csv(arquivo_csv(gerar_dataframe(30, semente=1)), owner=self.outro)
+        ingerir_csv(arquivo_csv(gerar_dataframe(20, semente=2)))
+
+    def quantidade_listada(self, credenciais):
+        return len(self.client.get('/users/financial-records/', {'limite': 1000}, **credenciais).json())
+
+    def test_listagem(self):
+        self.assertEqual(self.quantidade_listada(autenticado(self.dona)), 50)
+        self.assertEqual(self.quantidade_listada(autenticado(self.outro)), 30)
+        self.assertEqual(self.quantidade_listada({}), 20)
+
+    def test_dashboard(self):
+        for user, credenciais in ((self.dona, autenticado(self.dona)), (self.outro, autenticado(self.outro)), (None, {})):
+            with self.subTest(user=user):
+                esperado = analytics.dashboard(FinancialRollup.objects.filter(owner=user))
+                self.assertEqual(self.client.get('/users/dashboard/', **credenciais).content, JSONRenderer().render(esperado))
+                self.assertEqual(
+                    self.client.get('/users/financial-indicators/', **credenciais).json(), esperado['indicadores']
+                )
+
+    def test_exclusao(self):
+        self.assertEqual(self.client.delete('/users/financial-records/', **autenticado(self.outro)).status_code, 204)
+        self.assertEqual(FinancialRecord.objects.filter(owner=self.outro).count(), 0)
+        self.assertEqual(FinancialRecord.objects.filter(owner=self.dona).count(), 50)
+        self.assertEqual(FinancialRecord.objects.filter(owner=None).count(), 20)
+        self.assertEqual(self.quantidade_listada(autenticado(self.dona)), 50)
+
+    def test_job_de_upload(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        with override_settings(INGESTAO_DIR=diretorio):
+            job = tarefas.criar_job(SimpleUploadedFile('extrato.csv', b'Data\n'), owner=self.dona)
+        url = f'/users/upload-jobs/{job.pk}/'
+        self.assertEqual(self.client.get(url, **autenticado(self.dona)).status_code, 200)
+        self.assertEqual(self.client.get(url, **autenticado(self.outro)).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_token_invalido(self):
+        resposta = self.client.get('/users/financial-records/', HTTP_AUTHORIZATION='Bearer token-invalido')
+        self.assertEqual(resposta.status_code, 401)
+
+
+class CacheHTTPTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user(username='dono', password='senha-teste')
+        ingerir_csv(arquivo_csv(gerar_dataframe(40)), owner=self.owner)
+
+    def get(self, url='/users/dashboard/', **cabecalhos):
+        return self.client.get(url, **autenticado(self.owner), **cabecalhos)
+
+    def test_if_none_match_recebe_304(self):
+        primeira = self.get()
+        self.assertEqual(primeira['Cache-Control'], 'private, no-cache')
+        for etag in (primeira['ETag'], 'W/' + primeira['ETag'], f'"outro", {primeira["ETag"]}'):
+            with self.subTest(etag=etag):
+                resposta = self.get(HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(resposta.status_code, 304)
+                self.assertEqual(resposta['ETag'], primeira['ETag'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"outro"').status_code, 200)
+
+    def test_resposta_em_cache_sem_recalcular(self):
+        primeira = self.get()
+        # Só a leitura da versão dos dados
+        with self.assertNumQueries(1):
+            segunda = self.get()
+        self.assertEqual(segunda.content, primeira.content)
+
+    def test_upload_invalida(self):
+        primeira = self.get()
+        ingerir_csv(arquivo_csv(gerar_dataframe(10, semente=1)), owner=self.owner)
+        resposta = self.get(HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], primeira['ETag'])
+        self.assertNotEqual(resposta.content, primeira.content)
+
+    def test_exclusao_invalida(self):
+        primeira = self.get('/users/financial-records/', QUERY_STRING='limite=100')
+        self.assertEqual(len(primeira.json()), 40)
+        self.client.delete('/users/financial-records/', **autenticado(self.owner))
+        resposta = self.get('/users/financial-records/', QUERY_STRING='limite=100', HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual((resposta.status_code, resposta.json()), (200, []))
+
+    def test_etag_por_usuario_e_url(self):
+        outro = User.objects.create_user(username='outro', password='senha-teste')
+        etag = self.get()['ETag']
+        self.assertNotEqual(self.client.get('/users/dashboard/', **autenticado(outro))['ETag'], etag)
+        self.assertNotEqual(self.get('/users/cash-flow/')['ETag'], etag)
+        self.assertEqual(self.client.get('/users/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(RESPOSTAS_HTTP_CACHE_TIMEOUT=0)
+    def test_desligado(self):
+        self.assertNotIn('ETag', self.get())
+
+
+@override_settings(INSTRUMENTACAO=True)
+class InstrumentacaoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        metricas_processo.limpar()
+        self.addCleanup(metricas_processo.limpar)
+
+    def test_server_timing_e_totais_da_view(self):
+        resposta = self.client.get('/users/dashboard/')
+        self.assertIn('total;dur=', resposta['Server-Timing'])
+        texto = self.client.get('/users/metricas/').content.decode()
+        self.assertIn('corujita_requisicoes_total{view="dashboard",metodo="GET",status="200"} 1', texto)
+        self.assertIn('corujita_requisicao_segundos_count{view="dashboard"} 1', texto)
+
+    def test_estatisticas_dos_caches(self):
+        cache_respostas.limpar()
+        self.addCleanup(cache_respostas.limpar)
+        cache_respostas.guardar('anon:0:-', 'qual foi meu lucro', None, 'R$ 10.')
+        cache_respostas.buscar_exato('anon:0:-', 'qual foi meu lucro')
+        texto = self.client.get('/users/metricas/').content.decode()
+        estatisticas = cache_respostas.estatisticas()
+        self.assertIn(f'corujita_cache_hits_total{{cache="respostas"}} {estatisticas["hits"]}', texto)
+        self.assertIn(f'corujita_cache_itens{{cache="respostas"}} {estatisticas["itens"]}', texto)
+        for nome in ('embeddings', 'respostas', 'vectorstores'):
+            for metrica in ('hits_total', 'misses_total', 'evictions_total'):
+                self.assertIn(f'corujita_cache_{metrica}{{cache="{nome}"}} ', texto)
+        self.assertIn('corujita_cache_bytes{cache="vectorstores"} ', texto)
+        self.assertEqual(texto.count('# TYPE corujita_cache_hits_total counter'), 1)
+
+    @override_settings(INSTRUMENTACAO=False)
+    def test_desligada(self):
+        self.assertEqual(self.client.get('/users/metricas/').status_code, 404)
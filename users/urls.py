@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterView, FinancialAgentView, UploadCSVVectorstoreView, FinancialRecordListView, FinancialIndicatorsView, FinancialTrendsView, ExpenseDistributionView, ExpenseTypePercentageView, CashFlowView, indice_saude, analise_saude, pontos_fortes, pontos_fracos, nota_saude
+from .views import RegisterView, FinancialAgentView, UploadCSVVectorstoreView, UploadJobView, FinancialRecordListView, FinancialIndicatorsView, FinancialTrendsView, ExpenseDistributionView, ExpenseTypePercentageView, CashFlowView, DashboardView, indice_saude, analise_saude, pontos_fortes, pontos_fracos, nota_saude, metricas
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -8,15 +8,18 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('financial-agent/', FinancialAgentView.as_view(), name='financial_agent'),
     path('upload-csv-vectorstore/', UploadCSVVectorstoreView.as_view(), name='upload_csv_vectorstore'),
+    path('upload-jobs/<uuid:job_id>/', UploadJobView.as_view(), name='upload_job'),
     path('financial-records/', FinancialRecordListView.as_view(), name='financial_records'),
     path('financial-indicators/', FinancialIndicatorsView.as_view(), name='financial_indicators'),
     path('financial-trends/', FinancialTrendsView.as_view(), name='financial_trends'),
     path('expense-distribution/', ExpenseDistributionView.as_view(), name='expense_distribution'),
     path('expense-type-percentage/', ExpenseTypePercentageView.as_view(), name='expense_type_percentage'),
     path('cash-flow/', CashFlowView.as_view(), name='cash_flow'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('indice-saude/', indice_saude, name='indice_saude'),
     path('analise-saude/', analise_saude, name='analise_saude'),
     path('pontos-fortes/', pontos_fortes, name='pontos_fortes'),
     path('pontos-fracos/', pontos_fracos, name='pontos_fracos'),
     path('nota-saude/', nota_saude, name='nota_saude'),
+    path('metricas/', metricas, name='metricas'),
 ] 
\ No newline at end of file
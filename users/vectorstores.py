@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads do processo
+    fcntl = None
+
+import faiss
+from django.conf import settings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from .embeddings import embeddings_compartilhados
+from .instrumentacao import etapa, metricas
+from .versoes import escopo_usuario
+
+logger = logging.getLogger(__name__)
+
+# Só ids simples viram nome de arquivo (evita caminhos como '../')
+ID_VALIDO = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Cada vectorstore é um diretório com o índice FAISS nativo e um sidecar JSON com os documentos.
+# Cada gravação cria um índice com nome novo e só depois troca o sidecar, que diz qual é o seu
+# índice: quem lê o sidecar encontra sempre o par da mesma gravação. Ficam os dois últimos índices
+# (leitores que acabaram de ler o sidecar anterior ainda abrem o dele)
+ARQUIVO_DOCSTORE = 'docstore.json'
+PADRAO_INDICE = re.compile(r'^index-(\d+)\.faiss$')
+INDICES_MANTIDOS = 2
+# Vectorstores gravados antes dos índices versionados (sidecar sem o campo 'indice')
+ARQUIVO_INDICE = 'index.faiss'
+VERSAO_FORMATO = 2
+TENTATIVAS_LEITURA = 3
+
+# Índices planos são mapeados direto do arquivo (IO_FLAG_MMAP_IFC); as páginas ficam no
+# page cache do sistema e são compartilhadas entre os workers
+FLAGS_LEITURA = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class VectorstoreCache:
+    """LRU de vectorstores carregados, limitado pelo total de bytes e invalidado pelo mtime dos arquivos."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        # caminho -> (versão do arquivo, tamanho em bytes, vectorstore)
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obter(self, caminho, carregar):
+        try:
+            stat = os.stat(os.path.join(caminho, ARQUIVO_DOCSTORE))
+        except FileNotFoundError:
+            self.invalidar(caminho)
+            return None
+        # Toda gravação troca o sidecar (e o índice para o qual ele aponta)
+        versao = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            item = self._itens.get(caminho)
+            if item is not None and item[0] == versao:
+                self._itens.move_to_end(caminho)
+                self.hits += 1
+                return item[2]
+            self.misses += 1
+        # Carrega fora do lock para não bloquear leituras de outros vectorstores
+        vectorstore = carregar(caminho)
+        # Documentos (pelo tamanho do sidecar) e vetores: mesmo mapeado do arquivo, o índice lido
+        # nas buscas fica nas páginas do processo
+        tamanho = stat.st_size + bytes_indice(vectorstore.index)
+        with self._lock:
+            self._remover(caminho)
+            if tamanho <= self.max_bytes:
+                self._itens[caminho] = (versao, tamanho, vectorstore)
+                self._bytes += tamanho
+                while self._bytes > self.max_bytes:
+                    antigo = next(iter(self._itens))
+                    self._remover(antigo)
+                    self.evictions += 1
+        return vectorstore
+
+    def invalidar(self, caminho):
+        with self._lock:
+            self._remover(caminho)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remover(self, caminho):
+        item = self._itens.pop(caminho, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
+def bytes_indice(index):
+    # Índices planos: ntotal vetores de d floats de 32 bits
+    return index.ntotal * index.d * 4
+
+
+cache_vectorstores = VectorstoreCache(settings.VECTORSTORE_CACHE_MAX_BYTES)
+metricas.registrar_cache('vectorstores', cache_vectorstores.estatisticas)
+
+
+def caminho_vectorstore(chave):
+    if not chave or not ID_VALIDO.match(str(chave)):
+        return None
+    return os.path.join(settings.VECTORSTORE_DIR, str(chave))
+
+
+_locks_escrita = {}
+_locks_lock = threading.Lock()
+
+
+@contextmanager
+def _flock(caminho):
+    with open(caminho, 'a') as arquivo:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def bloqueio_escrita(chave):
+    """Um vectorstore é alterado por um job de cada vez, também entre processos (web e run_jobs).
+
+    O lock entre processos é um flock no arquivo '<vectorstore>.lock', ao lado do diretório.
+    """
+    caminho = caminho_vectorstore(chave)
+    if caminho is None:
+        yield
+        return
+    with _locks_lock:
+        lock = _locks_escrita.setdefault(caminho, threading.Lock())
+    os.makedirs(settings.VECTORSTORE_DIR, exist_ok=True)
+    with lock, (_flock(caminho + '.lock') if fcntl is not None else nullcontext()):
+        yield
+
+
+def chave_conversa(user, conversation_id):
+    # O dono faz parte da chave: o mesmo conversation_id enviado por outro usuário não chega aqui
+    return f'{escopo_usuario(user)}__{conversation_id}'
+
+
+def existe(caminho):
+    # O sidecar é gravado por último: se existe, o índice também
+    return os.path.exists(os.path.join(caminho, ARQUIVO_DOCSTORE))
+
+
+def _indices(caminho):
+    # Índices gravados no diretório, do mais antigo para o mais novo
+    versionados = sorted(
+        (int(encontrado.group(1)), nome) for nome in os.listdir(caminho) if (encontrado := PADRAO_INDICE.match(nome))
+    )
+    legado = [ARQUIVO_INDICE] if os.path.exists(os.path.join(caminho, ARQUIVO_INDICE)) else []
+    return legado + [nome for _, nome in versionados]
+
+
+def salvar(caminho, vectorstore):
+    os.makedirs(caminho, exist_ok=True)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    documentos = []
+    for doc_id in ids:
+        doc = vectorstore.docstore.search(doc_id)
+        documentos.append({'page_content': doc.page_content, 'metadata': doc.metadata})
+    indices = _indices(caminho)
+    # Nome maior que o de todos os índices já gravados (o relógio pode voltar)
+    ultimo = PADRAO_INDICE.match(indices[-1]) if indices else None
+    indice = f'index-{max(time.time_ns(), int(ultimo.group(1)) + 1 if ultimo else 0)}.faiss'
+    sidecar = {
+        'versao': VERSAO_FORMATO,
+        'indice': indice,
+        'distance_strategy': DistanceStrategy(vectorstore.distance_strategy).value,
+        'normalize_L2': vectorstore._normalize_L2,
+        'ids': ids,
+        'documentos': documentos,
+    }
+    # O índice novo é gravado antes e o sidecar trocado com os.replace; leitores com um índice antigo
+    # mapeado continuam com ele até recarregarem, mesmo depois de o arquivo ser removido
+    faiss.write_index(vectorstore.index, os.path.join(caminho, indice))
+    tmp_docstore = os.path.join(caminho, ARQUIVO_DOCSTORE + '.tmp')
+    with open(tmp_docstore, 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_docstore, os.path.join(caminho, ARQUIVO_DOCSTORE))
+    for antigo in (indices + [indice])[:-INDICES_MANTIDOS]:
+        os.remove(os.path.join(caminho, antigo))
+
+
+def _ler(caminho, flags):
+    with open(os.path.join(caminho, ARQUIVO_DOCSTORE), encoding='utf-8') as f:
+        sidecar = json.load(f)
+    arquivo_indice = os.path.join(caminho, sidecar.get('indice', ARQUIVO_INDICE))
+    try:
+        return sidecar, faiss.read_index(arquivo_indice, flags)
+    except RuntimeError:
+        if os.path.exists(arquivo_indice):
+            raise
+        # Removido por gravações feitas depois da leitura do sidecar
+        raise FileNotFoundError(arquivo_indice)
+
+
+def carregar(caminho, embeddings=None, somente_leitura=True):
+    flags = FLAGS_LEITURA if somente_leitura else 0
+    with etapa('vectorstore.leitura'):
+        for tentativa in range(TENTATIVAS_LEITURA):
+            try:
+                sidecar, index = _ler(caminho, flags)
+                break
+            except FileNotFoundError:
+                if tentativa == TENTATIVAS_LEITURA - 1:
+                    raise
+    ids = sidecar['ids']
+    if index.ntotal != len(ids):
+        # Sidecar que não corresponde ao índice (editado ou copiado à mão)
+        raise ValueError(f'Vectorstore inconsistente em {caminho}: {index.ntotal} vetores, {len(ids)} documentos.')
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, **doc) for doc_id, doc in zip(ids, sidecar['documentos'])
+    })
+    return FAISS(
+        embedding_function=embeddings or embeddings_compartilhados(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=sidecar.get('normalize_L2', False),
+        distance_strategy=DistanceStrategy(sidecar.get('distance_strategy', DistanceStrategy.EUCLIDEAN_DISTANCE.value)),
+    )
+
+
+def carregar_vectorstore(chave):
+    # Devolve o vectorstore da conversa (ou None se não existir), reaproveitando o cache do processo
+    caminho = caminho_vectorstore(chave)
+    if caminho is None:
+        return None
+    try:
+        return cache_vectorstores.obter(caminho, carregar)
+    except Exception:
+        logger.exception('Falha ao carregar o vectorstore %s', caminho)
+        return None
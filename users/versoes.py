@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+# Versão dos dados financeiros de cada dono: muda a cada upload ou exclusão e entra na chave dos
+# caches derivados dos registros (ex.: análise de saúde financeira, respostas do dashboard)
+
+
+def escopo_usuario(user):
+    # Registros sem dono (uploads sem login) formam um escopo próprio
+    return f'user_{user.id}' if user is not None else 'anon'
+
+
+def _chave_cache(escopo):
+    return f'versao:{escopo}'
+
+
+def versao_dados(escopo):
+    return DataVersion.objects.filter(escopo=escopo).values_list('versao', flat=True).first() or 0
+
+
+def versao_em_cache(escopo):
+    """versao_dados sem consultar o banco enquanto a versão estiver no cache (VERSAO_CACHE_TIMEOUT).
+
+    Só com o cache compartilhado entre os processos (CACHE_BACKEND='arquivo'): a invalidação de
+    `incrementar_versao` não chega ao cache em memória dos outros processos. A versão lida do banco
+    entra com `add`: se um incremento terminou depois da leitura, o cache já tem a versão nova e
+    não é sobrescrito com a antiga.
+    """
+    if settings.CACHE_BACKEND != 'arquivo':
+        return versao_dados(escopo)
+    versao = cache.get(_chave_cache(escopo))
+    if versao is None:
+        versao = versao_dados(escopo)
+        cache.add(_chave_cache(escopo), versao, settings.VERSAO_CACHE_TIMEOUT)
+    return versao
+
+
+def _atualizar_cache(escopos):
+    # Depois do commit: grava a versão atual em vez de só apagar a chave, senão uma leitura feita
+    # antes do commit ainda poderia guardar a versão antiga
+    versoes = dict(DataVersion.objects.filter(escopo__in=escopos).values_list('escopo', 'versao'))
+    cache.set_many({_chave_cache(escopo): versao for escopo, versao in versoes.items()}, settings.VERSAO_CACHE_TIMEOUT)
+
+
+def incrementar_versao(escopo):
+    # Chamar na mesma transação da alteração: a nova versão aparece junto com os dados
+    _, criado = DataVersion.objects.get_or_create(escopo=escopo, defaults={'versao': 1})
+    if not criado:
+        DataVersion.objects.filter(escopo=escopo).update(versao=F('versao') + 1)
+    transaction.on_commit(lambda: _atualizar_cache([escopo]))
+
+
+def incrementar_todas():
+    # Alterações que atingem todos os donos (ex.: exclusão da instalação inteira)
+    DataVersion.objects.update(versao=F('versao') + 1)
+    escopos = list(DataVersion.objects.values_list('escopo', flat=True))
+    transaction.on_commit(lambda: _atualizar_cache(escopos))
@@ -1,266 +1,290 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions
-from .models import User, Conversation, Message, FinancialRecord
+from .models import User, Conversation, Message, FinancialRecord, FinancialRollup, UploadJob
 from .serializers import UserSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
-import pandas as pd
+from . import analytics, exclusao, historico, listagem, saude, tarefas
+from .vectorstores import caminho_vectorstore, carregar_vectorstore, chave_conversa
+from .versoes import escopo_usuario, versao_dados
+from .cache_http import AutenticacaoSemConsulta, em_cache_por_versao
+from .instrumentacao import etapa, metricas as metricas_processo
+from .cache_respostas import cache_respostas, normalizar_pergunta
+from .clientes import obter_llm
+from .embeddings import embeddings_compartilhados
+from .async_utils import (
+    CredenciaisInvalidas, em_thread, evento_sse, ler_dados, obter_usuario, quer_streaming,
+    resposta_json, resposta_sse, via_asgi
+)
 
-# Dependências para LLM e embeddings (usar provedores atuais do ecossistema LangChain)
-from langchain_openai import OpenAI, OpenAIEmbeddings
-# Vectorstore FAISS permanece na comunidade
-from langchain_community.vectorstores import FAISS
-import os
 from dotenv import load_dotenv
 load_dotenv()
+import logging
 import uuid
-import pickle
-from django.db.models import Q
-from django.db.models.functions import TruncMonth
-from collections import defaultdict
-from rest_framework.decorators import api_view
+from urllib.parse import urlencode
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 
 # Create your views here.
 
+logger = logging.getLogger(__name__)
+
+MAX_CONVERSATION_ID = Conversation._meta.get_field('conversation_id').max_length
+
+ERRO_AGENTE = "Desculpe, houve um erro ao consultar o agente de IA. Verifique sua chave de API ou tente novamente mais tarde."
+
+def dono(request):
+    # Os dados de cada usuário logado são só dele; sem login, valem os registros sem dono
+    if not request.user.is_authenticated:
+        return None
+    # GETs autenticados só pelo token (AutenticacaoSemConsulta): basta a chave para filtrar
+    return request.user if isinstance(request.user, User) else User(pk=request.user.id)
+
+def pertence(conversation, user):
+    # Conversas criadas sem login só são usadas sem login
+    return conversation.user_id == (user.pk if user is not None else None)
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
 
-class FinancialAgentView(APIView):
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        question = request.data.get('question')
-        conversation_id = request.data.get('conversation_id')
-        user = request.user if request.user.is_authenticated else None
+@method_decorator(csrf_exempt, name='dispatch')
+class FinancialAgentView(View):
+    # View assíncrona: enquanto espera o LLM o worker continua atendendo outras requisições
+    async def post(self, request):
+        try:
+            user = await obter_usuario(request)
+        except CredenciaisInvalidas as e:
+            return resposta_json({'detail': e.detalhe}, status=401)
+        try:
+            dados = ler_dados(request)
+        except ValueError:
+            return resposta_json({'error': 'JSON inválido.'}, status=400)
+        if not isinstance(dados, dict):
+            dados = {}
+        question = dados.get('question')
+        conversation_id = dados.get('conversation_id')
         if not question:
-            return Response({'error': 'Pergunta não fornecida.'}, status=400)
+            return resposta_json({'error': 'Pergunta não fornecida.'}, status=400)
 
         # Buscar ou criar conversa
-        if conversation_id:
-            conversation, _ = Conversation.objects.get_or_create(conversation_id=conversation_id, defaults={'user': user})
-        else:
-            conversation_id = str(uuid.uuid4())
-            conversation = Conversation.objects.create(conversation_id=conversation_id, user=user)
-
-        # Buscar histórico de mensagens
-        messages = Message.objects.filter(conversation=conversation).order_by('timestamp')
-        # Montar histórico simples no prompt (evita dependência de langchain.memory)
-        history_lines = []
-        for msg in messages:
-            role = 'Usuário' if msg.sender == 'user' else 'Assistente'
-            history_lines.append(f"{role}: {msg.text}")
-        history_text = "\n".join(history_lines)
-
-        # Configurar chave da OpenAI
-        openai_api_key = os.getenv('OPENAI_API_KEY', 'SUA_CHAVE_AQUI')
-        llm = OpenAI(openai_api_key=openai_api_key, temperature=0.2)
-
-        # --- RAG: Buscar contexto relevante no vectorstore ---
-        contextos_relevantes = []
-        vectorstore_path = f'vectorstores/vectorstore_{conversation_id}.pkl'
-        if os.path.exists(vectorstore_path):
-            with open(vectorstore_path, 'rb') as f:
-                vectorstore = pickle.load(f)
-            docs = vectorstore.similarity_search(question, k=3)
-            contextos_relevantes = [doc.page_content for doc in docs]
+        with etapa('agente.conversa'):
+            if conversation_id:
+                conversation, _ = await Conversation.objects.aget_or_create(conversation_id=conversation_id, defaults={'user': user})
+                if not pertence(conversation, user):
+                    return resposta_json({'error': 'Conversa não encontrada.'}, status=404)
+            else:
+                conversation_id = str(uuid.uuid4())
+                conversation = await Conversation.objects.acreate(conversation_id=conversation_id, user=user)
+
+        # Histórico: só as últimas mensagens (limite no banco e em tokens); as anteriores vão resumidas
+        with etapa('agente.historico'):
+            history_text = historico.historico_texto(await historico.mensagens_recentes(conversation))
+
+        llm = obter_llm()
+
+        # Cache de respostas (pergunta igual ou parecida, mesmos dados) e, se não houver, busca RAG.
+        # Só perguntas sem histórico nem resumo usam o cache: as demais dependem da conversa
+        usar_cache = not history_text and not conversation.resumo
+        with etapa('agente.consulta'):
+            consulta = await em_thread(preparar_consulta, conversation_id, user, question, usar_cache)
+        contextos_relevantes = consulta['contextos']
         # Montar contexto para o prompt
         contexto_rag = '\n'.join(contextos_relevantes) if contextos_relevantes else ''
 
-        # Prompt especializado
-        system_prompt = (
-            "Seu nome é Corujita, uma assistente financeira especialista em pequenos negócios. "
-            "Você atende principalmente pequenos empreendedores e responde dúvidas sobre os dados pessoais e financeiros do próprio usuário. "
-            "Responda sempre de forma simples, clara, sem usar termos técnicos, e explique tudo de maneira fácil de entender, como se estivesse conversando com alguém leigo. "
-            "Seja amigável, didática e detalhada nas explicações, ajudando o usuário a realmente compreender cada resposta. "
-            + (f"\nContexto financeiro do usuário: {contexto_rag}" if contexto_rag else "")
-        )
-        # Montar prompt contendo o sistema, histórico e a nova pergunta
-        full_prompt = (
-            f"{system_prompt}\n\n" +
-            (f"Histórico da conversa:\n{history_text}\n\n" if history_text else "") +
-            f"Pergunta: {question}\nResposta:"
-        )
-        try:
-            resposta = llm.predict(full_prompt)
-        except Exception as e:
-            resposta = "Desculpe, houve um erro ao consultar o agente de IA. Verifique sua chave de API ou tente novamente mais tarde."
+        with etapa('agente.prompt'):
+            # Prompt especializado
+            system_prompt = (
+                "Seu nome é Corujita, uma assistente financeira especialista em pequenos negócios. "
+                "Você atende principalmente pequenos empreendedores e responde dúvidas sobre os dados pessoais e financeiros do próprio usuário. "
+                "Responda sempre de forma simples, clara, sem usar termos técnicos, e explique tudo de maneira fácil de entender, como se estivesse conversando com alguém leigo. "
+                "Seja amigável, didática e detalhada nas explicações, ajudando o usuário a realmente compreender cada resposta. "
+                + (f"\nContexto financeiro do usuário: {contexto_rag}" if contexto_rag else "")
+            )
+            # Montar prompt contendo o sistema, histórico e a nova pergunta
+            full_prompt = (
+                f"{system_prompt}\n\n" +
+                (f"Resumo da conversa até aqui:\n{conversation.resumo}\n\n" if conversation.resumo else "") +
+                (f"Histórico da conversa:\n{history_text}\n\n" if history_text else "") +
+                f"Pergunta: {question}\nResposta:"
+            )
+        if quer_streaming(request, dados):
+            # Tokens enviados conforme o LLM gera; as mensagens são gravadas ao fim do stream
+            return resposta_sse(self.transmitir(llm, full_prompt, conversation, conversation_id, question, consulta))
+
+        resposta = consulta['resposta']
+        if resposta is None:
+            try:
+                resposta = await llm.ainvoke(full_prompt)
+                if consulta['escopo'] is not None:
+                    cache_respostas.guardar(consulta['escopo'], consulta['pergunta'], consulta['vetor'], resposta)
+            except Exception as e:
+                resposta = ERRO_AGENTE
 
         # Salvar pergunta e resposta
-        Message.objects.create(conversation=conversation, sender='user', text=question)
-        Message.objects.create(conversation=conversation, sender='agent', text=resposta)
+        with etapa('agente.gravacao'):
+            await Message.objects.acreate(conversation=conversation, sender='user', text=question)
+            await Message.objects.acreate(conversation=conversation, sender='agent', text=resposta)
+        with etapa('agente.resumo'):
+            await historico.atualizar_resumo(conversation)
+
+        resposta_http = resposta_json({'resposta': str(resposta), 'conversation_id': conversation_id})
+        resposta_http['X-Cache'] = 'HIT' if consulta['resposta'] is not None else 'MISS'
+        return resposta_http
 
-        return Response({'resposta': str(resposta), 'conversation_id': conversation_id})
+    async def transmitir(self, llm, prompt, conversation, conversation_id, question, consulta):
+        # Eventos: 'inicio' (conversation_id), um 'data' por token e 'fim' com a resposta completa
+        yield evento_sse({'conversation_id': conversation_id}, evento='inicio')
+        partes = []
+        if consulta['resposta'] is not None:
+            # Resposta do cache: enviada de uma vez
+            partes.append(consulta['resposta'])
+            yield evento_sse({'token': consulta['resposta']})
+        else:
+            try:
+                async for token in llm.astream(prompt):
+                    partes.append(token)
+                    yield evento_sse({'token': token})
+                if consulta['escopo'] is not None:
+                    cache_respostas.guardar(consulta['escopo'], consulta['pergunta'], consulta['vetor'], ''.join(partes))
+            except Exception:
+                logger.exception('Falha no streaming do agente para a conversa %s', conversation_id)
+                if not partes:
+                    partes.append(ERRO_AGENTE)
+                    yield evento_sse({'token': ERRO_AGENTE})
+        resposta = ''.join(partes)
+        # Se o cliente desconectar antes, o gerador é fechado e nada é gravado
+        with etapa('agente.gravacao'):
+            await Message.objects.acreate(conversation=conversation, sender='user', text=question)
+            await Message.objects.acreate(conversation=conversation, sender='agent', text=resposta)
+        yield evento_sse({'resposta': resposta, 'conversation_id': conversation_id}, evento='fim')
+        # Depois do evento final: o cliente já tem a resposta completa
+        with etapa('agente.resumo'):
+            await historico.atualizar_resumo(conversation)
+
+def preparar_consulta(conversation_id, user, question, usar_cache=True, k=3):
+    """Roda numa thread: procura a resposta no cache e, se não encontrar, o contexto RAG da pergunta.
+
+    O escopo do cache é o usuário, a versão dos dados e o vectorstore usado (None com `usar_cache`
+    falso: a resposta não é buscada nem guardada); o embedding da pergunta serve tanto para a busca
+    semântica no cache quanto para a busca no vectorstore.
+    """
+    # Vectorstores ficam em cache no processo: perguntas repetidas não relêem o arquivo
+    with etapa('rag.vectorstore'):
+        chave = chave_conversa(user, conversation_id)
+        vectorstore = carregar_vectorstore(chave)
+        if vectorstore is None and user is not None:
+            chave, vectorstore = f'user_{user.id}', carregar_vectorstore(f'user_{user.id}')
+    usar_cache = usar_cache and cache_respostas.habilitado
+    escopo = escopo_usuario(user)
+    consulta = {
+        'escopo': f"{escopo}:{versao_dados(escopo)}:{chave if vectorstore is not None else '-'}" if usar_cache else None,
+        'pergunta': normalizar_pergunta(question),
+        'vetor': None,
+        'resposta': None,
+        'contextos': [],
+    }
+    if usar_cache:
+        with etapa('rag.cache_respostas'):
+            consulta['resposta'] = cache_respostas.buscar_exato(consulta['escopo'], consulta['pergunta'])
+        if consulta['resposta'] is not None:
+            return consulta
+    if usar_cache or vectorstore is not None:
+        try:
+            with etapa('rag.embedding'):
+                consulta['vetor'] = embeddings_compartilhados().embed_query(question)
+        except Exception:
+            logger.exception('Falha ao gerar o embedding da pergunta')
+    if usar_cache:
+        with etapa('rag.cache_respostas'):
+            consulta['resposta'] = cache_respostas.buscar_similar(consulta['escopo'], consulta['pergunta'], consulta['vetor'])
+        if consulta['resposta'] is not None:
+            return consulta
+    if vectorstore is not None and consulta['vetor'] is not None:
+        with etapa('rag.busca'):
+            docs = vectorstore.similarity_search_by_vector(consulta['vetor'], k=k)
+        consulta['contextos'] = [doc.page_content for doc in docs]
+    return consulta
 
-class FinancialRecordListView(APIView):
+class FinancialRecordListView(AutenticacaoSemConsulta, APIView):
     permission_classes = [AllowAny]
+    @em_cache_por_versao
     def get(self, request):
-        records = FinancialRecord.objects.all().order_by('-uploaded_at')
-        data = [
-            {
-                'Data': r.data,
-                'Cliente/Fornecedor': r.cliente_fornecedor,
-                'Descrição': r.descricao,
-                'Categoria': r.categoria,
-                'Valor (R$)': r.valor,
-                'Tipo': r.tipo,
-                'Forma de Pagamento': r.forma_pagamento,
-                'Status': r.status,
-                'uploaded_at': r.uploaded_at.strftime('%Y-%m-%d %H:%M')
-            }
-            for r in records
-        ]
-        return Response(data)
+        # Sem parâmetros: a lista completa, enviada em streaming conforme é lida do banco.
+        # Com ?limite= (e ?cursor=): uma página; o cursor da próxima vem em X-Next-Cursor e Link.
+        # ?formato=ndjson|csv: exportação em streaming (a partir do cursor, se houver).
+        parametros = request.query_params
+        try:
+            if 'limite' in parametros or ('cursor' in parametros and 'formato' not in parametros):
+                limite = listagem.ler_limite(parametros.get('limite'))
+                data, proximo = listagem.pagina(dono(request), parametros.get('cursor'), limite)
+                resposta = Response(data)
+                if proximo:
+                    resposta['X-Next-Cursor'] = proximo
+                    url = request.build_absolute_uri(request.path) + '?' + urlencode({'limite': limite, 'cursor': proximo})
+                    resposta['Link'] = f'<{url}>; rel="next"'
+                return resposta
+            return listagem.resposta_streaming(
+                dono(request), parametros.get('formato', 'json'), parametros.get('cursor'), assincrono=via_asgi(request)
+            )
+        except listagem.ParametroInvalido as e:
+            return Response({'error': str(e)}, status=400)
 
     def delete(self, request):
-        FinancialRecord.objects.all().delete()
-        return Response({'message': 'Todos os registros financeiros foram excluídos com sucesso!'}, status=204)
+        # ?lote=<uuid> (devolvido no upload) e/ou ?de=&ate= (AAAA-MM-DD) restringem a exclusão
+        try:
+            lote, de, ate = exclusao.ler_escopo(request.query_params)
+        except listagem.ParametroInvalido as e:
+            return Response({'error': str(e)}, status=400)
+        owner = dono(request)
+        if not (lote or de or ate):
+            exclusao.excluir_tudo(owner)
+            return Response({'message': 'Todos os registros financeiros foram excluídos com sucesso!'}, status=204)
+        resultado = exclusao.excluir_em_lotes(exclusao.registros_do_escopo(owner, lote, de, ate), owner)
+        return Response({'message': f'{resultado["removidos"]} registros financeiros excluídos com sucesso!', **resultado})
 
-class FinancialIndicatorsView(APIView):
+class DashboardView(AutenticacaoSemConsulta, APIView):
     permission_classes = [AllowAny]
+    @em_cache_por_versao
     def get(self, request):
-        # Receita: soma dos valores onde tipo é Receita
-        receitas = FinancialRecord.objects.filter(tipo__iexact='Receita')
-        gastos = FinancialRecord.objects.filter(~Q(tipo__iexact='Receita'))
-        def parse_valor(valor):
-            try:
-                return float(str(valor).replace('.', '').replace(',', '.'))
-            except:
-                return 0.0
-        total_receita = sum(parse_valor(r.valor) for r in receitas if r.valor)
-        total_gastos = sum(parse_valor(r.valor) for r in gastos if r.valor)
-        lucro_liquido = total_receita - total_gastos
-        margem_lucro = (lucro_liquido / total_receita * 100) if total_receita else 0.0
-        return Response({
-            'receita': round(total_receita, 2),
-            'gastos': round(total_gastos, 2),
-            'lucro_liquido': round(lucro_liquido, 2),
-            'margem_lucro': round(margem_lucro, 2)
-        })
+        # ?secoes=indicadores,fluxo_caixa limita o cálculo às seções pedidas
+        secoes = [s.strip() for s in request.query_params.get('secoes', '').split(',') if s.strip()]
+        invalidas = [s for s in secoes if s not in analytics.SECOES]
+        if invalidas:
+            return Response({'error': f'Seções inválidas: {", ".join(invalidas)}. Opções: {", ".join(analytics.SECOES)}.'}, status=400)
+        return Response(analytics.dashboard(FinancialRollup.objects.filter(owner=dono(request)), secoes))
 
-class FinancialTrendsView(APIView):
+class DashboardSectionView(AutenticacaoSemConsulta, APIView):
+    # Endpoints antigos: cada um devolve uma seção do dashboard combinado
     permission_classes = [AllowAny]
+    secao = None
+    @em_cache_por_versao
     def get(self, request):
-        # Agrupar receitas e despesas por mês
-        records = FinancialRecord.objects.all()
-        trends = defaultdict(lambda: {'receita': 0.0, 'despesa': 0.0})
-        def parse_valor(valor):
-            try:
-                return float(str(valor).replace('.', '').replace(',', '.'))
-            except:
-                return 0.0
-        for r in records:
-            # Extrair mês/ano da data (esperando formato dd/mm/yyyy ou yyyy-mm-dd)
-            data = str(r.data)
-            if '/' in data:
-                partes = data.split('/')
-                if len(partes[-1]) == 4:
-                    mes = partes[1].zfill(2)
-                    ano = partes[2]
-                else:
-                    mes = partes[0].zfill(2)
-                    ano = partes[2]
-            elif '-' in data:
-                partes = data.split('-')
-                ano = partes[0]
-                mes = partes[1].zfill(2)
-            else:
-                continue
-            chave = f"{ano}-{mes}"
-            valor = parse_valor(r.valor)
-            if str(r.tipo).strip().lower() == 'receita':
-                trends[chave]['receita'] += valor
-            else:
-                trends[chave]['despesa'] += valor
-        # Ordenar por mês
-        trends_ordenados = sorted(trends.items())
-        labels = [k for k, v in trends_ordenados]
-        receitas = [round(v['receita'], 2) for k, v in trends_ordenados]
-        despesas = [round(v['despesa'], 2) for k, v in trends_ordenados]
-        return Response({
-            'labels': labels,
-            'receitas': receitas,
-            'despesas': despesas
-        })
+        return Response(analytics.dashboard(FinancialRollup.objects.filter(owner=dono(request)), [self.secao])[self.secao])
 
-class ExpenseDistributionView(APIView):
-    permission_classes = [AllowAny]
-    def get(self, request):
-        from collections import defaultdict
-        despesas = FinancialRecord.objects.exclude(tipo__iexact='Receita')
-        categorias = defaultdict(float)
-        def parse_valor(valor):
-            try:
-                return float(str(valor).replace('.', '').replace(',', '.'))
-            except:
-                return 0.0
-        for d in despesas:
-            cat = d.categoria or 'Outros'
-            categorias[cat] += parse_valor(d.valor)
-        labels = list(categorias.keys())
-        valores = [round(v, 2) for v in categorias.values()]
-        return Response({
-            'labels': labels,
-            'valores': valores
-        })
+class FinancialIndicatorsView(DashboardSectionView):
+    secao = 'indicadores'
 
-class ExpenseTypePercentageView(APIView):
-    permission_classes = [AllowAny]
-    def get(self, request):
-        from collections import Counter
-        # Filtrar apenas gastos (excluir receitas)
-        gastos = FinancialRecord.objects.exclude(tipo__iexact='Receita')
-        categorias = [g.categoria or 'Outro' for g in gastos]
-        total = len(categorias)
-        contagem = Counter(categorias)
-        porcentagens = {cat: round((qtd/total)*100, 2) for cat, qtd in contagem.items()} if total > 0 else {}
-        return Response(porcentagens)
-
-class CashFlowView(APIView):
-    permission_classes = [AllowAny]
-    def get(self, request):
-        from collections import defaultdict
-        records = FinancialRecord.objects.all()
-        trends = defaultdict(lambda: {'receita': 0.0, 'despesa': 0.0})
-        def parse_valor(valor):
-            try:
-                return float(str(valor).replace('.', '').replace(',', '.'))
-            except:
-                return 0.0
-        for r in records:
-            data = str(r.data)
-            if '/' in data:
-                partes = data.split('/')
-                if len(partes[-1]) == 4:
-                    mes = partes[1].zfill(2)
-                    ano = partes[2]
-                else:
-                    mes = partes[0].zfill(2)
-                    ano = partes[2]
-            elif '-' in data:
-                partes = data.split('-')
-                ano = partes[0]
-                mes = partes[1].zfill(2)
-            else:
-                continue
-            chave = f"{ano}-{mes}"
-            valor = parse_valor(r.valor)
-            if str(r.tipo).strip().lower() == 'receita':
-                trends[chave]['receita'] += valor
-            else:
-                trends[chave]['despesa'] += valor
-        # Ordenar por mês
-        trends_ordenados = sorted(trends.items())
-        labels = [k for k, v in trends_ordenados]
-        fluxo_caixa = [round(v['receita'] - v['despesa'], 2) for k, v in trends_ordenados]
-        return Response({
-            'labels': labels,
-            'fluxo_caixa': fluxo_caixa
-        })
+class FinancialTrendsView(DashboardSectionView):
+    secao = 'tendencias'
+
+class ExpenseDistributionView(DashboardSectionView):
+    secao = 'distribuicao_despesas'
+
+class ExpenseTypePercentageView(DashboardSectionView):
+    secao = 'percentual_tipos_despesa'
+
+class CashFlowView(DashboardSectionView):
+    secao = 'fluxo_caixa'
 
 class UploadCSVVectorstoreView(APIView):
     parser_classes = (MultiPartParser, FormParser)
@@ -270,150 +294,77 @@ class UploadCSVVectorstoreView(APIView):
         file = request.FILES.get('file')
         if not file:
             return Response({'error': 'Arquivo CSV não enviado.'}, status=400)
-        try:
-            # Tentar ler o CSV para DataFrame (tratamento robusto de encoding e separador)
-            try:
-                file.seek(0)
-                content = file.read()
-                try:
-                    decoded = content.decode('utf-8')
-                except UnicodeDecodeError:
-                    decoded = content.decode('latin1')
-                from io import StringIO
-                # Detectar separador automaticamente
-                import csv
-                sample = decoded[:1024]
-                sniffer = csv.Sniffer()
-                sep = ','
-                if sniffer.has_header(sample):
-                    dialect = sniffer.sniff(sample)
-                    sep = dialect.delimiter
-                df = pd.read_csv(StringIO(decoded), sep=sep)
-            except Exception as e:
-                return Response({'error': f'Erro ao ler o CSV: {str(e)}'}, status=400)
-            # Padronizar colunas (normalização)
-            import unicodedata
-            def normalizar(col):
-                return unicodedata.normalize('NFKD', col).encode('ASCII', 'ignore').decode('ASCII').strip().lower().replace('/', '').replace(' ', '').replace('(', '').replace(')', '').replace('-', '')
-            colunas_padrao = {
-                'data': 'Data',
-                'clientefornecedor': 'Cliente/Fornecedor',
-                'descricao': 'Descrição',
-                'categoria': 'Categoria',
-                'valorr$': 'Valor (R$)',
-                'tipo': 'Tipo',
-                'formadepagamento': 'Forma de Pagamento',
-                'status': 'Status'
-            }
-            # Criar um mapeamento das colunas do CSV para as colunas padrão
-            colunas_csv = {normalizar(col): col for col in df.columns}
-            # Garantir todas as colunas padrão
-            for key, col_padrao in colunas_padrao.items():
-                if key not in colunas_csv:
-                    df[col_padrao] = ''
-            # Recriar DataFrame apenas com as colunas padrão, na ordem correta
-            df_padrao = pd.DataFrame()
-            for key, col_padrao in colunas_padrao.items():
-                if key in colunas_csv:
-                    df_padrao[col_padrao] = df[colunas_csv[key]]
-                else:
-                    df_padrao[col_padrao] = ''
-            # Salvar cada linha como um registro no banco de dados
-            registros_criados = 0
-            for _, row in df_padrao.iterrows():
-                FinancialRecord.objects.create(
-                    data=row['Data'],
-                    cliente_fornecedor=row['Cliente/Fornecedor'],
-                    descricao=row['Descrição'],
-                    categoria=row['Categoria'],
-                    valor=row['Valor (R$)'],
-                    tipo=row['Tipo'],
-                    forma_pagamento=row['Forma de Pagamento'],
-                    status=row['Status']
-                )
-                registros_criados += 1
-            return Response({'message': f'{registros_criados} registros financeiros salvos com sucesso no banco de dados local!'}, status=201)
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
-
-def analisar_financeiro_llm(prompt):
-    openai_api_key = os.getenv('OPENAI_API_KEY', 'SUA_CHAVE_AQUI')
-    llm = OpenAI(openai_api_key=openai_api_key, temperature=0.2)
-    try:
-        resposta = llm.predict(prompt)
-        return resposta
-    except Exception as e:
-        return None
+        # O vectorstore é da conversa informada, do usuário logado ou de uma conversa nova
+        owner = dono(request)
+        conversation_id = request.data.get('conversation_id')
+        if conversation_id:
+            chave = chave_conversa(owner, conversation_id)
+        elif owner is not None:
+            chave = f'user_{owner.pk}'
+        else:
+            conversation_id = str(uuid.uuid4())
+            chave = chave_conversa(owner, conversation_id)
+        if caminho_vectorstore(chave) is None or len(conversation_id or '') > MAX_CONVERSATION_ID:
+            return Response({'error': 'conversation_id inválido.'}, status=400)
+        if conversation_id:
+            # A conversa passa a ser de quem enviou o arquivo; a de outro usuário não é encontrada
+            conversation, _ = Conversation.objects.get_or_create(conversation_id=conversation_id, defaults={'user': owner})
+            if not pertence(conversation, owner):
+                return Response({'error': 'Conversa não encontrada.'}, status=404)
+        # A ingestão (upsert em lotes e índice do vectorstore) roda em segundo plano;
+        # o andamento é consultado em upload-jobs/<job_id>/
+        job = tarefas.criar_job(file, owner=owner, chave_vectorstore=chave, conversation_id=conversation_id)
+        tarefas.enfileirar(job)
+        return Response({
+            'message': 'Arquivo recebido! Os registros estão sendo processados.',
+            'job_id': str(job.pk),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(reverse('upload_job', args=[job.pk])),
+            **({'conversation_id': conversation_id} if conversation_id else {})
+        }, status=202)
 
-@api_view(['GET'])
-def indice_saude(request):
-    # Prompt para nota de 0 a 100 e label
-    prompt = (
-        "Analise todos os dados financeiros do banco de dados e responda apenas com um JSON no formato: {\"indice\": <nota de 0 a 100>, \"label\": <rótulo curto como Bom, Ruim, Excelente, Regular, etc>}"
-    )
-    resposta = analisar_financeiro_llm(prompt)
-    import json
-    try:
-        return Response(json.loads(resposta))
-    except:
-        return Response({'indice': 0, 'label': 'Desconhecido'})
-
-@api_view(['GET'])
-def analise_saude(request):
-    # Prompt para texto breve
-    prompt = (
-        "Analise todos os dados financeiros do banco de dados e responda apenas com um texto de no máximo 30 palavras, explicando de forma simples a situação financeira da empresa."
-    )
-    resposta = analisar_financeiro_llm(prompt)
-    texto = resposta.strip() if resposta else ''
-    if not texto:
-        texto = 'Não foi possível analisar a situação financeira.'
-    return Response({'analise': texto})
-
-@api_view(['GET'])
-def pontos_fortes(request):
-    # Prompt para pontos fortes (apenas 2 frases)
-    prompt = (
-        "Analise todos os dados financeiros do banco de dados e responda apenas com um JSON no formato: {\"pontos_fortes\": [duas frases curtas, cada uma representando um ponto forte]}"
-    )
-    resposta = analisar_financeiro_llm(prompt)
-    import json
-    try:
-        data = json.loads(resposta)
-        # Garante que só venham 2 frases
-        if isinstance(data.get('pontos_fortes'), list):
-            data['pontos_fortes'] = data['pontos_fortes'][:2]
-        return Response(data)
-    except:
-        return Response({'pontos_fortes': []})
-
-@api_view(['GET'])
-def pontos_fracos(request):
-    # Prompt para pontos fracos (apenas 2 frases)
-    prompt = (
-        "Analise todos os dados financeiros do banco de dados e responda apenas com um JSON no formato: {\"melhorias\": [duas frases curtas, cada uma representando um ponto fraco ou sugestão de melhoria]}"
-    )
-    resposta = analisar_financeiro_llm(prompt)
-    import json
-    try:
-        data = json.loads(resposta)
-        # Garante que só venham 2 frases
-        if isinstance(data.get('melhorias'), list):
-            data['melhorias'] = data['melhorias'][:2]
-        return Response(data)
-    except:
-        return Response({'melhorias': []})
-
-@api_view(['GET'])
-def nota_saude(request):
-    prompt = (
-        "Analise todos os dados financeiros do banco de dados e responda apenas com um número de 0 a 100, representando a nota de saúde financeira da empresa. Não escreva mais nada além do número."
-    )
-    resposta = analisar_financeiro_llm(prompt)
+class UploadJobView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        # Só o dono do upload vê o job
+        job = UploadJob.objects.filter(pk=job_id, owner=dono(request)).first()
+        if job is None:
+            return Response({'error': 'Job não encontrado.'}, status=404)
+        return Response(tarefas.situacao(job))
+
+async def responder_saude(request, montar):
+    # Os cinco endpoints leem partes da mesma análise em cache (uma chamada ao LLM por versão dos dados)
     try:
-        nota = int(float(resposta.strip()))
-        if nota < 0: nota = 0
-        if nota > 100: nota = 100
-    except:
-        nota = 0
-    return Response({'nota': nota})
+        user = await obter_usuario(request)
+    except CredenciaisInvalidas as e:
+        return resposta_json({'detail': e.detalhe}, status=401)
+    analise = await saude.obter_analise(user)
+    return resposta_json(montar(analise))
+
+@require_GET
+async def indice_saude(request):
+    return await responder_saude(request, lambda analise: {'indice': analise['indice'], 'label': analise['label']})
+
+@require_GET
+async def analise_saude(request):
+    return await responder_saude(request, lambda analise: {'analise': analise['analise']})
+
+@require_GET
+async def pontos_fortes(request):
+    return await responder_saude(request, lambda analise: {'pontos_fortes': analise['pontos_fortes']})
+
+@require_GET
+async def pontos_fracos(request):
+    return await responder_saude(request, lambda analise: {'melhorias': analise['melhorias']})
+
+@require_GET
+async def nota_saude(request):
+    return await responder_saude(request, lambda analise: {'nota': analise['nota']})
+
+@require_GET
+def metricas(request):
+    # Métricas deste processo no formato texto do Prometheus (só com INSTRUMENTACAO ligada)
+    if not settings.INSTRUMENTACAO:
+        raise Http404
+    return HttpResponse(metricas_processo.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')